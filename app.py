@@ -1,16 +1,22 @@
 import streamlit as st
 import os
 from dotenv import load_dotenv
-from git import Repo, InvalidGitRepositoryError, GitCommandError
+from git import Repo, InvalidGitRepositoryError
 import gpt_utils
-import difflib
-import tempfile
-import shutil
-import subprocess
-from urllib.parse import urlparse
+import client_registry
+import clone_cache
+import janitor
+import git_utils
+import diff_index
+import diff_spool
+import speculation
+import diff_utils
+import workspace
+import repo_diff
+import metrics
+import json
 import time
-import stat
-import errno
+from contextlib import closing, nullcontext
 
 # Load environment variables
 load_dotenv()
@@ -24,114 +30,130 @@ def init_session_state():
         st.session_state.api_key = GENERIC_API_KEY
     if 'key_type' not in st.session_state:
         st.session_state.key_type = "generic" if GENERIC_API_KEY else "personal"
-    if 'temp_dir' not in st.session_state:
-        st.session_state.temp_dir = None
+    if 'repo_setup' not in st.session_state:
+        st.session_state.repo_setup = None
+    if 'speculator' not in st.session_state:
+        st.session_state.speculator = speculation.Speculator()
 
 # Initialize session state at startup
 init_session_state()
 
-def run_git_command(cmd, cwd=None):
-    """Run a git command and return its output"""
-    try:
-        result = subprocess.run(
-            cmd,
-            cwd=cwd,
-            capture_output=True,
-            text=True,
-            shell=True,
-            env=os.environ.copy()  # Use current environment variables
-        )
-        if result.returncode == 0:
-            return result.stdout.strip()
-        st.error(f"Git command failed: {result.stderr.strip()}")
-        return None
-    except Exception as e:
-        st.error(f"Git command error: {str(e)}")
-        return None
-
-def get_repo_name_from_url(url):
-    """Extract repository name from GitHub URL"""
-    try:
-        path = urlparse(url).path
-        return path.strip('/').split('/')[-1].replace('.git', '')
-    except:
-        return 'remote_repo'
-
-def force_remove_directory(path):
-    """Force remove a directory and its contents on Windows"""
-    def handle_remove_readonly(func, path, exc):
-        excvalue = exc[1]
-        if func in (os.rmdir, os.remove, os.unlink) and excvalue.errno == errno.EACCES:
-            # Change the file to be readable, writable, and executable
-            os.chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-            try:
-                func(path)
-            except Exception:
-                # If changing permissions didn't work, try to force delete
-                if os.path.isfile(path):
-                    os.remove(path)
-                else:
-                    shutil.rmtree(path, ignore_errors=True)
-
-    max_retries = 5
-    for attempt in range(max_retries):
-        try:
-            if os.path.exists(path):
-                # First try to kill any processes that might be using the directory
-                if os.name == 'nt':  # Windows
-                    try:
-                        os.system(f'taskkill /F /IM "git.exe" 2>nul')
-                        time.sleep(0.5)  # Wait for processes to be killed
-                    except Exception:
-                        pass
-
-                # Try to remove the directory
-                shutil.rmtree(path, onerror=handle_remove_readonly)
-                
-                # Double check it's gone
-                if os.path.exists(path):
-                    time.sleep(0.5)  # Wait a bit before retry
-                    continue
-                
-                return True  # Successfully removed
-            return True  # Path doesn't exist, consider it removed
-        except Exception as e:
-            if attempt == max_retries - 1:  # Last attempt
-                st.error(f"Failed to remove directory after {max_retries} attempts: {str(e)}")
-                return False
-            time.sleep(0.5)  # Wait before retrying
-    return False
-
-def cleanup():
-    """Clean up temporary directories with improved Windows support"""
-    try:
-        if hasattr(st.session_state, 'temp_dir') and st.session_state.temp_dir:
-            temp_dir = st.session_state.temp_dir
-            st.session_state.temp_dir = None  # Clear it first
-            
-            if os.path.exists(temp_dir):
-                if not force_remove_directory(temp_dir):
-                    st.warning("Could not completely clean up temporary directory. You may need to remove it manually.")
-    except Exception as e:
-        st.warning(f"Warning during cleanup: {str(e)}")
-
-def get_file_diff(file1_content, file2_content):
-    """Generate diff between two files"""
-    diff = difflib.unified_diff(
-        file1_content.splitlines(keepends=True),
-        file2_content.splitlines(keepends=True),
-        fromfile='file1',
-        tofile='file2'
+@st.cache_resource(show_spinner=False)
+def start_janitor():
+    """Sweep what earlier runs left behind, once per server process; the
+    deletions themselves run on the janitor's background thread"""
+    janitor.sweep(exclude=[clone_cache.CACHE_ROOT])
+    clone_cache.sweep()
+
+start_janitor()
+
+def render_diff(diff_text):
+    """Render a diff, timing how long Streamlit takes to serialize it"""
+    with metrics.span("render.diff", bytes=len(diff_text)):
+        st.code(diff_text, language="diff")
+
+def _page_number(label, pages, key):
+    """Return the 0-based page picked with a number input, or 0 if there is only one"""
+    if pages <= 1:
+        return 0
+    return st.number_input(f"{label} (1-{pages})", min_value=1, max_value=pages, key=key) - 1
+
+def render_spool(spool, part):
+    """Render one part of a DiffSpool as a per-file list, one page of files
+    and of each file's hunks at a time; only what is shown is read back"""
+    entries = spool.files(part)
+    per_page = diff_spool.FILES_PER_PAGE
+    page = _page_number(
+        f"Page of {len(entries)} files", -(-len(entries) // per_page), f"diff_page_{part}"
     )
-    return ''.join(diff)
-
-def setup_repository(local_path, remote_url=None):
+    with metrics.span("render.diff", part=part, files=len(entries)) as timing:
+        summaries = []
+        for index in range(page * per_page, min(len(entries), (page + 1) * per_page)):
+            entry = entries[index]
+            if not entry.hunks:
+                # Summaries and "Only in" lines are shown together below
+                summaries.append(spool.section(part, index))
+                continue
+            with st.expander(f"{entry.path}  (+{entry.added} -{entry.removed})"):
+                hunk_page = _page_number(
+                    f"Hunks, {len(entry.hunks)} in total", -(-len(entry.hunks) // diff_spool.HUNKS_PER_PAGE),
+                    f"diff_hunks_{part}_{entry.path}"
+                )
+                header, hunks = spool.hunks(
+                    part, index, hunk_page * diff_spool.HUNKS_PER_PAGE, diff_spool.HUNKS_PER_PAGE
+                )
+                text = header + "".join(hunks)
+                timing.add("bytes", len(text))
+                st.code(text, language="diff")
+        if summaries:
+            text = "".join(summaries)
+            timing.add("bytes", len(text))
+            st.code(text, language="diff")
+
+def render_metrics():
+    """Show recorded stage timings in a collapsible sidebar panel"""
+    with st.sidebar.expander("Performance Timings"):
+        stages = metrics.summary()
+        if not stages:
+            st.caption("No timings recorded yet.")
+            return
+        st.dataframe(
+            [
+                {
+                    "Stage": stage["stage"],
+                    "Count": stage["count"],
+                    "p50 (ms)": round(stage["p50_seconds"] * 1000, 1),
+                    "p95 (ms)": round(stage["p95_seconds"] * 1000, 1),
+                    "Bytes": stage["bytes"],
+                    "Tokens": stage["tokens"],
+                    "Saved Tokens": stage["saved_tokens"]
+                }
+                for stage in stages
+            ],
+            hide_index=True
+        )
+        st.caption("Most recent spans")
+        st.dataframe(
+            [
+                {
+                    "Stage": span["name"],
+                    "ms": round(span["duration"] * 1000, 1),
+                    "Bytes": span.get("bytes"),
+                    "Tokens": (span.get("prompt_tokens", 0) or 0) + (span.get("completion_tokens", 0) or 0),
+                    "Saved Tokens": span.get("saved_tokens")
+                }
+                for span in metrics.recent_spans(20)
+            ],
+            hide_index=True
+        )
+        st.download_button("Export JSON", metrics.to_json(), "smartcommit-timings.json", "application/json")
+        st.download_button("Export Prometheus", metrics.to_prometheus(), "smartcommit-timings.prom", "text/plain")
+
+def render_stream(generator):
+    """Render a streamed response progressively and return the full text"""
+    # Closing explicitly aborts the underlying request if a rerun interrupts us
+    with closing(generator):
+        return st.write_stream(generator)
+
+def render_message_and_analysis(diff):
+    """Stream the commit message for diff (a string or a DiffView) while the
+    change analysis runs concurrently"""
+    # A message already being pre-generated for this diff is served from the cache
+    st.session_state.speculator.wait(diff, gpt_utils.REQUEST_TIMEOUT)
+    diff_content = diff if isinstance(diff, str) else diff.text()
+    analysis = gpt_utils.start_stream_analysis(diff_content)
+    # Aborts the analysis too if a rerun interrupts the message
+    with closing(analysis):
+        st.subheader("Suggested Commit Message")
+        commit_message = render_stream(gpt_utils.stream_commit_message(diff_content))
+
+        st.subheader("Change Analysis")
+        render_stream(analysis)
+    return commit_message
+
+def setup_repository(local_path, remote_url=None, clone_options=None):
     """Setup and validate repository for comparison"""
     try:
-        # Initialize session state if not already done
-        if 'temp_dir' not in st.session_state:
-            st.session_state.temp_dir = None
-
         # Check if local path exists
         if not os.path.exists(local_path):
             return None, None, f"Local path '{local_path}' does not exist."
@@ -150,173 +172,119 @@ def setup_repository(local_path, remote_url=None):
         # Handle remote repository if provided
         if remote_url:
             try:
-                # Clean up any existing temporary directory
-                cleanup()
-                
-                # Wait for cleanup to complete
-                time.sleep(1)
-                
-                # Create new temporary directory with unique name
-                base_temp = tempfile.gettempdir()
-                unique_dir = f"smartcommit_{int(time.time())}"
-                temp_base = os.path.join(base_temp, unique_dir)
-                
-                # Ensure the new directory path is clean
-                if os.path.exists(temp_base):
-                    if not force_remove_directory(temp_base):
-                        return local_repo, None, "Failed to clean up existing temporary directory"
-                
-                os.makedirs(temp_base, exist_ok=True)
-                st.session_state.temp_dir = temp_base
-                
-                repo_name = get_repo_name_from_url(remote_url)
-                clone_path = os.path.join(temp_base, repo_name)
-                
-                # Double check clone path is clean
-                if os.path.exists(clone_path):
-                    if not force_remove_directory(clone_path):
-                        cleanup()
-                        return local_repo, None, "Failed to prepare clone directory"
-                
-                # Try to clone with HTTPS first
-                success = False
-                error_msg = ""
-                
+                # Reuse (and refresh) a cached clone instead of cloning per rerun
+                clone_path, error_msg = clone_cache.get_cached_clone(remote_url, options=clone_options)
+                if error_msg:
+                    return local_repo, None, f"Failed to clone repository: {error_msg}"
+
                 try:
-                    clone_cmd = f"git clone {remote_url} {clone_path}"
-                    result = run_git_command(clone_cmd)
-                    if result is not None:  # Check for None specifically
-                        success = True
-                    else:
-                        error_msg = "HTTPS clone failed"
+                    remote_repo = Repo(clone_path)
+                    return local_repo, remote_repo, None
                 except Exception as e:
-                    error_msg = f"HTTPS error: {str(e)}"
-                
-                # Try SSH if HTTPS failed
-                if not success and remote_url.startswith('https://'):
-                    try:
-                        ssh_url = remote_url.replace('https://', 'git@').replace('/', ':', 1)
-                        clone_cmd = f"git clone {ssh_url} {clone_path}"
-                        result = run_git_command(clone_cmd)
-                        if result is not None:  # Check for None specifically
-                            success = True
-                        else:
-                            error_msg += ", SSH clone failed"
-                    except Exception as e:
-                        error_msg += f", SSH error: {str(e)}"
-                
-                if not success:
-                    cleanup()
-                    return local_repo, None, f"Failed to clone repository: {error_msg}"
-                
-                if os.path.exists(clone_path):
-                    try:
-                        remote_repo = Repo(clone_path)
-                        return local_repo, remote_repo, None
-                    except Exception as e:
-                        cleanup()
-                        return local_repo, None, f"Error initializing cloned repository: {str(e)}"
-                else:
-                    cleanup()
-                    return local_repo, None, "Failed to clone remote repository - directory not created"
-                    
+                    return local_repo, None, f"Error initializing cloned repository: {str(e)}"
+
             except Exception as e:
-                cleanup()
                 return local_repo, None, f"Error cloning remote repository: {str(e)}"
         
         return local_repo, None, None
 
     except Exception as e:
-        cleanup()
         return None, None, f"Error setting up repository: {str(e)}"
 
-def get_repository_diff(local_repo, remote_repo=None):
-    """Get differences between repositories"""
-    try:
-        changes = {
-            'unstaged': '',
-            'staged': '',
-            'remote': ''
+def get_repository_setup(local_path, remote_url=None, clone_options=None):
+    """Return setup_repository's result, reusing this session's repositories
+    while the remote clone is still within its refresh interval"""
+    setup_key = (local_path, remote_url, json.dumps(clone_options, sort_keys=True))
+    cached = st.session_state.get('repo_setup')
+    if (cached and cached['key'] == setup_key and os.path.isdir(local_path)
+            and time.time() - cached['time'] < clone_cache.REFRESH_INTERVAL):
+        return cached['local_repo'], cached['remote_repo'], None
+
+    with metrics.span("setup_repository", remote=bool(remote_url)):
+        local_repo, remote_repo, error_msg = setup_repository(local_path, remote_url, clone_options)
+    if error_msg:
+        st.session_state.repo_setup = None
+    else:
+        st.session_state.repo_setup = {
+            'key': setup_key,
+            'time': time.time(),
+            'local_repo': local_repo,
+            'remote_repo': remote_repo
         }
+    return local_repo, remote_repo, error_msg
+
+def repository_state(local_repo, remote_repo=None, status=None):
+    """Return a cheap fingerprint of the local working tree and the remote's fetched commit"""
+    return (
+        local_repo.working_dir,
+        git_utils.repo_fingerprint(local_repo.working_dir, status),
+        remote_repo.working_dir if remote_repo else None,
+        git_utils.head_sha(remote_repo.working_dir) if remote_repo else None
+    )
+
+class IncompleteDiff(Exception):
+    """Carries a diff that some files could not be compared in out of
+    cached_repository_diff, so it is shown but not memoized"""
+
+    def __init__(self, changes):
+        super().__init__("Some files could not be compared")
+        self.changes = changes
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def cached_repository_diff(state, _local_repo, _remote_repo=None, _max_workers=1, _status=None):
+    """get_repository_diff memoized on the repository_state fingerprint.
+    Raises IncompleteDiff instead of caching a diff with per-file errors."""
+    errors = []
+    with metrics.span("get_repository_diff", remote=_remote_repo is not None) as timing:
+        changes = get_repository_diff(_local_repo, _remote_repo, _max_workers, _status, errors)
+        timing.set(bytes=sum(changes.size(part) for part in ('unstaged', 'staged', 'remote')))
+    if errors:
+        raise IncompleteDiff(changes)
+    return changes
+
+def watched_repository_diff(local_repo, remote_repo=None, max_workers=1):
+    """Return the DiffSpool of this session's DiffIndex, which patches the
+    changed files' sections from filesystem events instead of recomputing
+    the whole comparison"""
+    key = (local_repo.working_dir, remote_repo.working_dir if remote_repo else None, max_workers)
+    index = st.session_state.get('diff_index')
+    if index is None or st.session_state.get('diff_index_key') != key:
+        if index is not None:
+            index.close()
+        with metrics.span("get_repository_diff", remote=remote_repo is not None, watch=True):
+            index = diff_index.DiffIndex(key[0], key[1], max_workers, warn=st.warning)
+        st.session_state.diff_index = index
+        st.session_state.diff_index_key = key
+        return index.spool
+    return index.refresh()
+
+def get_repository_diff(local_repo, remote_repo=None, max_workers=1, status=None, errors=None):
+    """Get differences between repositories as a DiffSpool with "unstaged",
+    "staged" and "remote" parts, written file by file as they are diffed.
+    Warnings about files that could not be compared are shown and, if
+    given, appended to errors."""
+    def warn(message):
+        if errors is not None:
+            errors.append(message)
+        st.warning(message)
 
-        # Get local changes
-        if local_repo.is_dirty(untracked_files=True):
-            changes['unstaged'] = local_repo.git.diff()
-            changes['staged'] = local_repo.git.diff('--cached')
+    try:
+        changes = diff_spool.DiffSpool()
+
+        # Get local changes from one status pass (reused from the fingerprint if given)
+        for part, path, section in repo_diff.iter_local_sections(local_repo.working_dir, status):
+            changes.add(part, path, section)
 
         # Compare with remote if available
         if remote_repo:
             try:
-                # Get the remote repository's default branch
-                remote_branch = remote_repo.active_branch.name
-                remote_commit = remote_repo.head.commit.hexsha
-
-                # Add remote as a new remote to local repository
-                remote_name = "comparison_remote"
-                try:
-                    local_repo.delete_remote(remote_name)
-                except:
-                    pass
-                
-                local_repo.create_remote(remote_name, remote_repo.working_dir)
-                local_repo.remotes[remote_name].fetch()
-
-                # Instead of using git diff with merge base, just get the file lists and contents
-                local_files = set()
-                remote_files = set()
-                
-                # Get list of files in local repo
-                for root, _, files in os.walk(local_repo.working_dir):
-                    for file in files:
-                        if not file.startswith('.git'):
-                            rel_path = os.path.relpath(os.path.join(root, file), local_repo.working_dir)
-                            local_files.add(rel_path)
-
-                # Get list of files in remote repo
-                for root, _, files in os.walk(remote_repo.working_dir):
-                    for file in files:
-                        if not file.startswith('.git'):
-                            rel_path = os.path.relpath(os.path.join(root, file), remote_repo.working_dir)
-                            remote_files.add(rel_path)
-
-                # Compare files
-                diff_output = []
-                
-                # Files in both repos
-                common_files = local_files.intersection(remote_files)
-                for file in common_files:
-                    try:
-                        local_content = open(os.path.join(local_repo.working_dir, file), 'r', encoding='utf-8').read()
-                        remote_content = open(os.path.join(remote_repo.working_dir, file), 'r', encoding='utf-8').read()
-                        
-                        if local_content != remote_content:
-                            diff = difflib.unified_diff(
-                                remote_content.splitlines(keepends=True),
-                                local_content.splitlines(keepends=True),
-                                fromfile=f'remote/{file}',
-                                tofile=f'local/{file}'
-                            )
-                            diff_output.extend(diff)
-                    except Exception as e:
-                        st.warning(f"Error comparing file {file}: {str(e)}")
-
-                # Files only in local
-                only_local = local_files - remote_files
-                for file in only_local:
-                    diff_output.append(f"Only in local: {file}\n")
-
-                # Files only in remote
-                only_remote = remote_files - local_files
-                for file in only_remote:
-                    diff_output.append(f"Only in remote: {file}\n")
-
-                changes['remote'] = ''.join(diff_output) if diff_output else "No differences found"
-
-                # Clean up the temporary remote
-                local_repo.delete_remote(remote_name)
-
+                changes.extend('remote', repo_diff.iter_remote_sections(
+                    local_repo.working_dir, remote_repo.working_dir, max_workers, warn=warn
+                ))
+                if not changes.has('remote'):
+                    changes.add('remote', None, repo_diff.NO_DIFFERENCES)
             except Exception as e:
-                st.warning(f"Warning while comparing with remote: {str(e)}")
+                warn(f"Warning while comparing with remote: {str(e)}")
 
         return changes
 
@@ -363,7 +331,75 @@ with st.sidebar:
     st.subheader("Comparison Settings")
     comparison_type = st.radio(
         "Select Comparison Type",
-        ["Git Repository", "File Comparison"]
+        ["Git Repository", "Workspace", "File Comparison"]
+    )
+
+    diff_workers = 1
+    watch_changes = False
+    pregenerate = False
+    remote_clone_options = {}
+    if comparison_type == "Git Repository":
+        diff_workers = st.number_input(
+            "Diff Worker Processes",
+            min_value=1,
+            max_value=os.cpu_count() or 1,
+            value=diff_utils.default_workers(),
+            help="Number of processes used to diff changed files against the remote"
+        )
+
+        watch_changes = st.checkbox(
+            "Watch for changes (incremental diff)",
+            help="Watch the local repository and only re-diff the files that changed since the last refresh"
+        )
+
+        pregenerate = st.checkbox(
+            "Pre-generate commit message",
+            help=(
+                f"Generate the message in the background once the diff has been unchanged for "
+                f"{speculation.DEBOUNCE_SECONDS:g}s, so the Generate button answers instantly"
+            )
+        )
+        if pregenerate:
+            speculator = st.session_state.speculator
+            st.caption(
+                f"Pre-generation: {speculator.status}, ~{speculator.spent_tokens:,} of "
+                f"{speculator.token_cap:,} tokens used this session"
+            )
+
+        with st.expander("Remote Clone Options"):
+            shallow_clone = st.checkbox(
+                "Shallow clone (latest commit only)", value=True,
+                help="Clone with --depth 1; the comparison only needs the tip tree"
+            )
+            single_branch = st.checkbox("Single branch", value=True, help="Only fetch the default branch")
+            partial_clone = st.checkbox(
+                "Partial clone (fetch files on demand)",
+                help="Clone with --filter=blob:none and download only the files that differ"
+            )
+            sparse_dirs = st.text_input(
+                "Sparse checkout directories",
+                help="Comma-separated directories to limit the comparison to (empty for the whole repository)"
+            )
+        remote_clone_options = clone_cache.clone_options(
+            depth=1 if shallow_clone else None,
+            partial=partial_clone,
+            single_branch=single_branch,
+            sparse_paths=[path.strip() for path in sparse_dirs.split(",")]
+        )
+
+    workspace_workers = workspace.WORKERS
+    if comparison_type == "Workspace":
+        workspace_workers = st.number_input(
+            "Workspace Scan Threads",
+            min_value=1,
+            max_value=64,
+            value=workspace.WORKERS,
+            help="Number of repositories whose status and diff are collected at once"
+        )
+
+    cache_stats = gpt_utils.response_cache.stats()
+    st.caption(
+        f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses"
     )
 
 try:
@@ -388,7 +424,7 @@ try:
             
         if local_repo_path:
             # Setup repositories
-            local_repo, remote_repo, error_msg = setup_repository(local_repo_path, remote_url)
+            local_repo, remote_repo, error_msg = get_repository_setup(local_repo_path, remote_url, remote_clone_options)
             
             if error_msg:
                 st.error(error_msg)
@@ -396,57 +432,74 @@ try:
                     st.stop()
             
             try:
-                # Get all changes
-                changes = get_repository_diff(local_repo, remote_repo)
+                # Get all changes, reusing the last result while nothing changed on disk.
+                # The cached clone is leased meanwhile so no other session refreshes it.
+                with clone_cache.lease(remote_repo.working_dir) if remote_repo else nullcontext():
+                    if watch_changes:
+                        changes = watched_repository_diff(local_repo, remote_repo, diff_workers)
+                    else:
+                        if st.session_state.get('diff_index') is not None:
+                            st.session_state.diff_index.close()
+                            st.session_state.diff_index = None
+                        status = git_utils.read_status(local_repo.working_dir)
+                        try:
+                            changes = cached_repository_diff(
+                                repository_state(local_repo, remote_repo, status),
+                                local_repo, remote_repo, diff_workers, status
+                            )
+                        except IncompleteDiff as e:
+                            changes = e.changes
                 
+                # Pre-generate the message the Generate button below would ask for
+                if pregenerate:
+                    st.session_state.speculator.observe(
+                        changes.view('remote') if changes.has('remote') else changes.view('unstaged', 'staged')
+                    )
+                else:
+                    st.session_state.speculator.stop()
+
                 # Display local changes
-                if changes['unstaged'] or changes['staged']:
+                if changes.has('unstaged') or changes.has('staged'):
                     st.markdown("### Local Changes")
                     
-                    if changes['unstaged']:
+                    if changes.has('unstaged'):
                         st.markdown("#### Unstaged Changes")
-                        st.code(changes['unstaged'], language="diff")
+                        render_spool(changes, 'unstaged')
                     
-                    if changes['staged']:
+                    if changes.has('staged'):
                         st.markdown("#### Staged Changes")
-                        st.code(changes['staged'], language="diff")
+                        render_spool(changes, 'staged')
                 
                 # Display remote comparison
-                if changes['remote']:
+                if changes.has('remote'):
                     st.markdown("### Changes Compared to Remote")
-                    st.code(changes['remote'], language="diff")
+                    render_spool(changes, 'remote')
                     
                     if st.button("Generate Commit Message for All Changes"):
-                        with st.spinner("Generating commit message..."):
-                            commit_message = gpt_utils.generate_commit_message(changes['remote'])
-                            st.subheader("Suggested Commit Message")
-                            st.write(commit_message)
-                            
-                            if st.button("Commit Changes"):
-                                try:
-                                    local_repo.git.add(".")
-                                    local_repo.git.commit(m=commit_message)
-                                    st.success("Changes committed successfully!")
-                                except Exception as e:
-                                    st.error(f"Error committing changes: {str(e)}")
+                        commit_message = render_message_and_analysis(changes.view('remote'))
+                        
+                        if st.button("Commit Changes"):
+                            try:
+                                local_repo.git.add(".")
+                                local_repo.git.commit(m=commit_message)
+                                st.success("Changes committed successfully!")
+                            except Exception as e:
+                                st.error(f"Error committing changes: {str(e)}")
                 
-                elif changes['unstaged'] or changes['staged']:
+                elif changes.has('unstaged') or changes.has('staged'):
                     # Generate commit message for local changes only
-                    all_changes = "\n".join(filter(None, [changes['unstaged'], changes['staged']]))
+                    all_changes = changes.view('unstaged', 'staged')
                     
                     if st.button("Generate Commit Message for Local Changes"):
-                        with st.spinner("Generating commit message..."):
-                            commit_message = gpt_utils.generate_commit_message(all_changes)
-                            st.subheader("Suggested Commit Message")
-                            st.write(commit_message)
-                            
-                            if st.button("Commit Changes"):
-                                try:
-                                    local_repo.git.add(".")
-                                    local_repo.git.commit(m=commit_message)
-                                    st.success("Changes committed successfully!")
-                                except Exception as e:
-                                    st.error(f"Error committing changes: {str(e)}")
+                        commit_message = render_message_and_analysis(all_changes)
+                        
+                        if st.button("Commit Changes"):
+                            try:
+                                local_repo.git.add(".")
+                                local_repo.git.commit(m=commit_message)
+                                st.success("Changes committed successfully!")
+                            except Exception as e:
+                                st.error(f"Error committing changes: {str(e)}")
                 else:
                     if remote_repo:
                         st.info("No differences found between local and remote repositories.")
@@ -456,8 +509,70 @@ try:
             except Exception as e:
                 st.error(f"Error comparing repositories: {str(e)}")
     
+    elif comparison_type == "Workspace":
+        st.subheader("Workspace Scan")
+        st.session_state.speculator.stop()
+        workspace_root = st.text_input(
+            "Workspace Root",
+            help="Directory containing your repositories; every git repository below it is scanned"
+        )
+
+        if workspace_root:
+            if not os.path.isdir(workspace_root):
+                st.error("Workspace root is not a directory")
+                st.stop()
+
+            if st.button("Rescan") or st.session_state.get('workspace_root') != workspace_root:
+                with st.spinner("Scanning repositories..."):
+                    st.session_state.workspace_scan = workspace.scan_workspace(workspace_root, workspace_workers)
+                st.session_state.workspace_root = workspace_root
+            summaries = st.session_state.workspace_scan
+
+            if not summaries:
+                st.info("No git repositories found under this directory.")
+            else:
+                # Columns can be sorted by clicking their headers
+                st.dataframe(
+                    [
+                        {
+                            "Repository": summary["repo"],
+                            "Branch": summary["branch"],
+                            "Ahead": summary["ahead"],
+                            "Behind": summary["behind"],
+                            "Staged": summary["staged"],
+                            "Unstaged": summary["unstaged"],
+                            "Untracked": summary["untracked"],
+                            "Conflicts": summary["conflicts"],
+                            "Lines Added": summary["added_lines"],
+                            "Lines Removed": summary["removed_lines"],
+                            "Error": summary["error"]
+                        }
+                        for summary in summaries
+                    ],
+                    hide_index=True
+                )
+
+                dirty = [summary["repo"] for summary in summaries if summary["diff"]]
+                if not dirty:
+                    st.info("No changes detected in any repository.")
+                else:
+                    selected = st.multiselect("Repositories to generate messages for", dirty, default=dirty)
+                    if selected and st.button("Generate Commit Messages"):
+                        diffs = {summary["repo"]: summary["diff"] for summary in summaries if summary["repo"] in selected}
+                        # Shown as each one finishes
+                        with st.spinner(f"Generating {len(diffs)} commit messages..."):
+                            for repo, message, error in workspace.generate_messages(
+                                diffs, workers=client_registry.PER_KEY_CONCURRENCY
+                            ):
+                                st.markdown(f"#### {repo}")
+                                if error:
+                                    st.error(f"Error generating commit message: {error}")
+                                else:
+                                    st.code(message, language=None)
+
     else:  # File Comparison
         st.subheader("File Comparison")
+        st.session_state.speculator.stop()
         col1, col2 = st.columns(2)
         
         with col1:
@@ -469,20 +584,16 @@ try:
             file2_content = st.text_area("Enter or paste modified code", height=300)
         
         if file1_content and file2_content:
-            diff = get_file_diff(file1_content, file2_content)
+            diff = diff_utils.get_file_diff(file1_content, file2_content)
             
             if diff:
                 st.markdown("### Differences Detected")
-                st.code(diff, language="diff")
+                render_diff(diff)
                 
                 if st.button("Generate Commit Message"):
-                    with st.spinner("Generating commit message..."):
-                        commit_message = gpt_utils.generate_commit_message(diff)
-                        st.subheader("Suggested Commit Message")
-                        st.write(commit_message)
+                    commit_message = render_message_and_analysis(diff)
             else:
                 st.info("No differences found between the files.")
 
 finally:
-    # Clean up temporary directories
-    cleanup() 
\ No newline at end of file
+    render_metrics() 
\ No newline at end of file
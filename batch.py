@@ -0,0 +1,159 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import client_registry
+import git_utils
+import gpt_utils
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second on
+    average, with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        if not rate > 0:
+            raise ValueError(f"rate must be positive, got {rate!r}")
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+def list_commits(repo_path, rev_range):
+    """Return the commit IDs in rev_range, oldest first"""
+    return git_utils.git_output(["rev-list", "--reverse", rev_range], repo_path).split()
+
+
+def commit_diff(repo_path, commit):
+    """Return the patch a commit introduced (against its first parent for merges)"""
+    return git_utils.git_output(
+        ["show", "--format=", "--patch", "--diff-merges=first-parent", commit], repo_path, errors="replace"
+    ).strip("\n")
+
+
+def commit_message(repo_path, commit):
+    """Return the commit's existing message"""
+    return git_utils.git_output(["log", "-1", "--format=%B", commit], repo_path, errors="replace").strip()
+
+
+def generate_with_retry(diff_content, bucket=None, retries=5):
+    """Generate a commit message, taking a token from bucket before every
+    API request it makes and letting the key's client retry transient
+    errors up to retries times (with Retry-After or exponential backoff)"""
+    with client_registry.request_policy(bucket, retries):
+        return gpt_utils.generate_commit_message(diff_content, raise_errors=True)
+
+
+def completed_keys(output_path):
+    """Return the (repo, commit) pairs already written successfully to output_path"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partial line from an interrupted run
+            if not record.get("error"):
+                done.add((record["repo"], record["commit"]))
+    return done
+
+
+def _process(repo_path, commit, bucket, retries):
+    record = {"repo": repo_path, "commit": commit}
+    try:
+        record["original_message"] = commit_message(repo_path, commit)
+        diff_content = commit_diff(repo_path, commit)
+        if not diff_content:
+            record["generated_message"] = ""
+        else:
+            record["generated_message"] = generate_with_retry(diff_content, bucket, retries)
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+def run_batch(repo_paths, rev_range, output_path, workers=4, requests_per_minute=60,
+              retries=5, on_record=None):
+    """Generate messages for every commit in rev_range across repo_paths.
+
+    Results are appended to output_path as JSON lines as they complete.
+    Commits already recorded there without an error are skipped, so an
+    interrupted run resumes where it left off. A repository whose commits
+    cannot be listed (e.g. it is missing or lacks the range) gets one
+    error record with a null commit and the others still run. Returns the
+    number of records written.
+    """
+    bucket = TokenBucket(requests_per_minute / 60.0, capacity=workers)
+    done = completed_keys(output_path)
+
+    def pending():
+        for repo_path in repo_paths:
+            repo_path = os.path.abspath(repo_path)
+            try:
+                commits = list_commits(repo_path, rev_range)
+            except (RuntimeError, OSError) as e:
+                yield {"repo": repo_path, "commit": None, "range": rev_range, "error": str(e)}
+                continue
+            for commit in commits:
+                if (repo_path, commit) not in done:
+                    yield repo_path, commit
+
+    written = 0
+
+    def emit(record):
+        nonlocal written
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+        written += 1
+        if on_record:
+            on_record(record)
+
+    jobs = pending()
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        exhausted = False
+        while in_flight or not exhausted:
+            # Keep a bounded number of commits in flight instead of
+            # materializing thousands of futures up front
+            while not exhausted and len(in_flight) < workers * 2:
+                try:
+                    job = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if isinstance(job, dict):
+                    emit(job)
+                    continue
+                repo_path, commit = job
+                # Run in a copy of this context so workers use the caller's API key
+                in_flight.add(executor.submit(
+                    contextvars.copy_context().run, _process, repo_path, commit, bucket, retries
+                ))
+            if not in_flight:
+                break
+
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                emit(future.result())
+    return written
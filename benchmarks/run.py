@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+import stub_openai
+import synthetic_repos
+
+
+def _timed(fn, repeat):
+    """Run fn repeat times and return (median_seconds, min_seconds, last_result)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), min(timings), result
+
+
+def _largest_changed_text_file(local_path, clone_path, changed_files):
+    """Return (remote_text, local_text) for the biggest changed text file, or None"""
+    for path in sorted(changed_files, key=lambda p: -os.path.getsize(os.path.join(local_path, p))):
+        try:
+            with open(os.path.join(clone_path, path), encoding="utf-8") as f:
+                remote_text = f.read()
+            with open(os.path.join(local_path, path), encoding="utf-8") as f:
+                local_text = f.read()
+            return remote_text, local_text
+        except (UnicodeDecodeError, OSError):
+            continue
+    return None
+
+
+def bench_scenario(name, work_dir, args, record):
+    import clone_cache
+    import diff_utils
+    import git_utils
+    import gpt_utils
+    import repo_diff
+
+    local_path, remote_url = synthetic_repos.build(name, work_dir, args.scale)
+
+    seconds, _, (clone_path, error_msg) = _timed(lambda: clone_cache.get_cached_clone(remote_url), 1)
+    if error_msg:
+        raise RuntimeError(error_msg)
+    record(name, "setup_cold_clone", seconds)
+
+    seconds, _, _ = _timed(lambda: clone_cache.get_cached_clone(remote_url, max_age=0), args.repeat)
+    record(name, "setup_warm_refresh", seconds)
+
+    seconds, _, changes = _timed(lambda: repo_diff.get_local_changes(local_path), args.repeat)
+    record(name, "local_changes", seconds, bytes=len(changes['unstaged']) + len(changes['staged']))
+
+    seconds, _, blobs = _timed(
+        lambda: (git_utils.list_worktree_blobs(local_path), git_utils.list_tree_blobs(clone_path)),
+        args.repeat
+    )
+    changed_files, only_local, only_remote = git_utils.compare_blob_maps(*blobs)
+    record(name, "remote_blob_listing", seconds,
+           files=len(blobs[0]), changed=len(changed_files) + len(only_local) + len(only_remote))
+
+    seconds, _, remote_text = _timed(
+        lambda: repo_diff.get_remote_diff(local_path, clone_path, args.workers), args.repeat
+    )
+    record(name, "remote_diff", seconds, bytes=len(remote_text), workers=args.workers)
+
+    pair = _largest_changed_text_file(local_path, clone_path, changed_files)
+    if pair:
+        seconds, _, diff = _timed(lambda: diff_utils.get_file_diff(*pair), args.repeat)
+        record(name, "file_diff_largest", seconds, bytes=len(pair[0]) + len(pair[1]))
+
+    changes['remote'] = remote_text
+    diff_content = repo_diff.combine_changes(changes)
+    seconds, _, message = _timed(lambda: gpt_utils.generate_commit_message(diff_content), 1)
+    if message.startswith("Error"):
+        raise RuntimeError(message)
+    record(name, "generate_end_to_end", seconds, bytes=len(diff_content))
+
+
+def bench_cli_startup(work_dir, args, record):
+    """Time cold starts of the CLI, which sit on the `git commit` path"""
+    cli = os.path.join(REPO_ROOT, "cli.py")
+    message_file = os.path.join(work_dir, "COMMIT_EDITMSG")
+    with open(message_file, "w") as f:
+        f.write("message\n")
+
+    commands = {
+        "cli_help": [sys.executable, cli, "--help"],
+        # What the hook does for `git commit -m ...`
+        "hook_noop": [sys.executable, cli, "prepare-commit-msg", message_file, "message"],
+    }
+    results = {}
+    for stage, command in commands.items():
+        seconds, _, _ = _timed(
+            lambda: subprocess.run(command, check=True, capture_output=True), max(args.repeat, 5)
+        )
+        record("startup", stage, seconds)
+        results[stage] = seconds
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SmartCommit's diffing and generation stages.")
+    parser.add_argument("--scenarios", nargs="+", default=sorted(synthetic_repos.SCENARIOS),
+                        choices=sorted(synthetic_repos.SCENARIOS))
+    parser.add_argument("--scale", type=int, default=1, help="multiplies file counts and sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (median is reported)")
+    parser.add_argument("--workers", type=int, default=1, help="processes for the remote per-file diff")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub API latency in seconds")
+    parser.add_argument("--startup-budget", type=float, default=0.3,
+                        help="fail if the no-op hook cold start exceeds this many seconds")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the generated repositories")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="smartcommit-bench-")
+    # Isolate the caches so every run starts cold and measures real work
+    os.environ["SMARTCOMMIT_CLONE_CACHE_DIR"] = os.path.join(work_dir, "clone-cache")
+    os.environ["SMARTCOMMIT_RESPONSE_CACHE_TTL"] = "0"
+
+    server, base_url = stub_openai.start_server(latency=args.latency)
+    import gpt_utils
+    gpt_utils.gpt_client.initialize("stub", base_url=base_url)
+
+    results = []
+
+    def record(scenario, stage, seconds, **extra):
+        results.append({"scenario": scenario, "stage": stage, "seconds": round(seconds, 4), **extra})
+        details = " ".join(f"{key}={value}" for key, value in extra.items())
+        print(f"{scenario:18} {stage:22} {seconds * 1000:10.1f} ms  {details}", flush=True)
+
+    try:
+        startup = bench_cli_startup(work_dir, args, record)
+        for name in args.scenarios:
+            bench_scenario(name, work_dir, args, record)
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if startup["hook_noop"] > args.startup_budget:
+        print(f"FAIL: no-op hook cold start {startup['hook_noop']:.3f}s exceeds "
+              f"budget {args.startup_budget:.3f}s", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_MESSAGE = (
+    "Update synthetic benchmark files\n\n"
+    "- Modify generated sources\n"
+    "- Rename and move assets"
+)
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible /chat/completions endpoint with fixed latency.
+
+    The server's `latency` (seconds before the response starts) and
+    `token_delay` (seconds between streamed tokens) attributes control
+    timing; every request gets STUB_MESSAGE back, except that every
+    `rate_limit_every`-th request is answered with a 429 and a short
+    Retry-After. `connections` counts accepted TCP connections, which
+    shows whether clients reuse keep-alive connections.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.counter_lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        with self.server.counter_lock:
+            self.server.requests += 1
+            rate_limited = self.server.rate_limit_every and self.server.requests % self.server.rate_limit_every == 0
+        if rate_limited:
+            self._rate_limited()
+            return
+        time.sleep(self.server.latency)
+        model = body.get("model", "stub")
+        if body.get("stream"):
+            self._stream(model)
+        else:
+            self._complete(model, body.get("messages", []))
+
+    def _complete(self, model, messages):
+        prompt_chars = sum(len(m.get("content", "")) for m in messages)
+        payload = json.dumps({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": STUB_MESSAGE},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": len(STUB_MESSAGE) // 4,
+                "total_tokens": (prompt_chars + len(STUB_MESSAGE)) // 4
+            }
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _rate_limited(self):
+        payload = json.dumps({"error": {"message": "Rate limit reached", "type": "requests"}}).encode("utf-8")
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Retry-After", "0.1")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for word in STUB_MESSAGE.split(" "):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def start_server(latency=0.0, token_delay=0.0, port=0, rate_limit_every=0):
+    """Start the stub in a daemon thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubOpenAIHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.token_delay = token_delay
+    server.rate_limit_every = rate_limit_every
+    server.requests = 0
+    server.connections = 0
+    server.counter_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stub server.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each response")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed tokens")
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.latency, args.token_delay, args.port)
+    print(f"Stub OpenAI server listening on {base_url}")
+    print(f"Point SmartCommit at it with OPENAI_BASE_URL={base_url} OPENAI_API_KEY=stub")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
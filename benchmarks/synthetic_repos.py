@@ -0,0 +1,126 @@
+import os
+import random
+import subprocess
+
+# Scenario name -> builder; each builder populates a fresh working tree
+SCENARIOS = {}
+
+_GIT_ENV = {
+    "GIT_AUTHOR_NAME": "bench",
+    "GIT_AUTHOR_EMAIL": "bench@example.com",
+    "GIT_COMMITTER_NAME": "bench",
+    "GIT_COMMITTER_EMAIL": "bench@example.com",
+}
+
+
+def _git(args, cwd):
+    subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True,
+        env={**os.environ, **_GIT_ENV}
+    )
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = "wb" if isinstance(content, bytes) else "w"
+    with open(path, mode) as f:
+        f.write(content)
+
+
+def _source_lines(rng, count):
+    return "".join(
+        f"def function_{i}_{rng.randrange(10 ** 6)}(value):\n    return value * {i}\n\n"
+        for i in range(count)
+    )
+
+
+def scenario(name):
+    def register(builder):
+        SCENARIOS[name] = builder
+        return builder
+    return register
+
+
+@scenario("many_small_files")
+def many_small_files(root, scale, rng):
+    """Lots of small source files; 10% of them get edited"""
+    count = 2000 * scale
+    for i in range(count):
+        _write(os.path.join(root, f"pkg{i % 50}", f"module_{i}.py"), _source_lines(rng, 5))
+    return lambda: [
+        _write(os.path.join(root, f"pkg{i % 50}", f"module_{i}.py"), _source_lines(rng, 6))
+        for i in range(0, count, 10)
+    ]
+
+
+@scenario("huge_files")
+def huge_files(root, scale, rng):
+    """A few multi-megabyte files with scattered edits"""
+    lines = 100000 * scale
+    for i in range(3):
+        _write(os.path.join(root, f"data_{i}.py"), _source_lines(rng, lines // 3))
+
+    def mutate():
+        for i in range(3):
+            path = os.path.join(root, f"data_{i}.py")
+            with open(path) as f:
+                content = f.read().splitlines(keepends=True)
+            for j in range(0, len(content), 997):
+                content[j] = f"# edited {j}\n"
+            _write(path, "".join(content))
+    return mutate
+
+
+@scenario("deep_tree")
+def deep_tree(root, scale, rng):
+    """Files nested 30 directories deep, with edits at the leaves"""
+    leaves = []
+    for branch in range(20 * scale):
+        path = os.path.join(root, *[f"d{branch}_{level}" for level in range(30)], "leaf.py")
+        _write(path, _source_lines(rng, 3))
+        leaves.append(path)
+    return lambda: [_write(path, _source_lines(rng, 4)) for path in leaves[::2]]
+
+
+@scenario("binary_blobs")
+def binary_blobs(root, scale, rng):
+    """Binary assets, half of them replaced"""
+    paths = []
+    for i in range(50 * scale):
+        path = os.path.join(root, "assets", f"blob_{i}.bin")
+        _write(path, rng.randbytes(256 * 1024))
+        paths.append(path)
+    return lambda: [_write(path, rng.randbytes(256 * 1024)) for path in paths[::2]]
+
+
+@scenario("many_renames")
+def many_renames(root, scale, rng):
+    """Many files moved to a new directory without content changes"""
+    count = 500 * scale
+    for i in range(count):
+        _write(os.path.join(root, "old", f"file_{i}.py"), _source_lines(rng, 4))
+
+    def mutate():
+        _git(["mv", "old", "new"], root)
+    return mutate
+
+
+def build(name, base_dir, scale=1, seed=0):
+    """Build a scenario and return (local_path, remote_url).
+
+    The baseline is committed, pushed to a bare repository that acts as
+    the remote, and then the local working tree is modified so the two
+    sides differ.
+    """
+    rng = random.Random(seed)
+    local_path = os.path.join(base_dir, name, "local")
+    remote_path = os.path.join(base_dir, name, "remote.git")
+    os.makedirs(local_path)
+
+    _git(["init", "-q", "-b", "main"], local_path)
+    mutate = SCENARIOS[name](local_path, scale, rng)
+    _git(["add", "-A"], local_path)
+    _git(["commit", "-q", "-m", f"Baseline for {name}"], local_path)
+    _git(["clone", "-q", "--bare", local_path, remote_path], base_dir)
+    mutate()
+    return local_path, "file://" + remote_path
@@ -0,0 +1,273 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Only the standard library is imported up front. repo_diff, gpt_utils and
+# friends are imported where they are needed, so no-op hook invocations
+# (message given with -m, merges, empty commits) return almost instantly.
+
+HOOK_MARKER = "# Installed by SmartCommit"
+
+# prepare-commit-msg sources for which git already has a message
+_SKIP_SOURCES = {"message", "merge", "squash", "commit"}
+
+
+def _git_output(args, cwd=None):
+    result = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"git {args[0]} failed")
+    return result.stdout
+
+
+def _positive_float(value):
+    """argparse type for options that must be greater than zero"""
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is None or not number > 0:
+        raise argparse.ArgumentTypeError(f"must be a positive number, got {value!r}")
+    return number
+
+
+def _init_client(timeout=None):
+    """Configure gpt_utils with the API key from the environment or .env"""
+    import gpt_utils
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    gpt_utils.gpt_client.initialize(api_key, timeout=timeout)
+    return gpt_utils
+
+
+def _collect_changes(repo_path, remote_url=None, staged_only=False, max_workers=1):
+    """Return the diff text to generate a message from"""
+    import repo_diff
+
+    if staged_only:
+        return repo_diff.get_local_changes(repo_path)['staged']
+
+    changes = repo_diff.get_local_changes(repo_path)
+    if remote_url:
+        import clone_cache
+
+        clone_path, error_msg = clone_cache.get_cached_clone(remote_url)
+        if error_msg:
+            raise RuntimeError(f"Failed to clone repository: {error_msg}")
+        with clone_cache.lease(clone_path):
+            changes['remote'] = repo_diff.get_remote_diff(
+                repo_path, clone_path, max_workers,
+                warn=lambda msg: print(f"warning: {msg}", file=sys.stderr)
+            )
+    return repo_diff.combine_changes(changes)
+
+
+def cmd_message(args):
+    """Print a commit message for the repository's current changes"""
+    diff_content = _collect_changes(args.repo, args.remote, args.staged, args.workers)
+    if not diff_content:
+        print("No changes detected.", file=sys.stderr)
+        return 1
+
+    gpt_utils = _init_client(args.timeout)
+    if args.analyze:
+        message, analysis = gpt_utils.generate_message_and_analysis(diff_content, args.timeout)
+        print(message)
+        print()
+        print(analysis)
+    elif args.stream:
+        for text in gpt_utils.stream_commit_message(diff_content):
+            print(text, end="", flush=True)
+        print()
+    else:
+        try:
+            message = gpt_utils.generate_commit_message(diff_content, raise_errors=True)
+        except Exception as e:
+            print(f"smartcommit: Error generating commit message: {str(e)}", file=sys.stderr)
+            return 1
+        print(message)
+    return 0
+
+
+def _hook_message(diff_content, timeout):
+    """Generate the hook's message within timeout seconds overall.
+
+    Failed requests are not retried, and the generation runs on a daemon
+    thread that is abandoned at the deadline, so a slow or rate-limited
+    API cannot hold up the commit.
+    """
+    import contextvars
+    import threading
+
+    import client_registry
+    import gpt_utils
+
+    outcome = {}
+
+    def generate():
+        try:
+            with client_registry.request_policy(max_retries=0):
+                outcome["message"] = gpt_utils.generate_commit_message(diff_content, raise_errors=True)
+        except Exception as e:
+            outcome["error"] = e
+
+    # Run in a copy of this context so the thread uses the configured API key
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(generate,), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"no response within {timeout:g}s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["message"]
+
+
+def cmd_prepare_commit_msg(args):
+    """Entry point for the prepare-commit-msg hook; never blocks the commit"""
+    if args.source in _SKIP_SOURCES:
+        return 0
+
+    try:
+        diff_content = _collect_changes(os.getcwd(), staged_only=True)
+        if not diff_content:
+            return 0
+
+        _init_client(args.timeout)
+        try:
+            message = _hook_message(diff_content, args.timeout)
+        except Exception as e:
+            # Leave the editor empty rather than abort the commit
+            print(f"smartcommit: Error generating commit message: {str(e)}", file=sys.stderr)
+            return 0
+
+        with open(args.message_file, "r", encoding="utf-8") as f:
+            existing = f.read()
+        with open(args.message_file, "w", encoding="utf-8") as f:
+            f.write(message.rstrip() + "\n" + existing)
+    except Exception as e:
+        print(f"smartcommit: {str(e)}", file=sys.stderr)
+    return 0
+
+
+def cmd_batch(args):
+    """Generate messages for a range of commits across one or more repositories"""
+    _init_client(args.timeout)
+    import batch
+
+    def report(record):
+        status = "error: " + record["error"] if record.get("error") else "ok"
+        commit = record["commit"][:12] if record["commit"] else record["range"]
+        print(f"{record['repo']} {commit} {status}", file=sys.stderr)
+
+    written = batch.run_batch(
+        args.repo or ["."], args.range, args.output,
+        workers=args.workers, requests_per_minute=args.rpm, retries=args.retries,
+        on_record=report
+    )
+    print(f"Wrote {written} record(s) to {args.output}", file=sys.stderr)
+    return 0
+
+
+def _hook_path(repo_path):
+    hooks_dir = _git_output(["rev-parse", "--git-path", "hooks"], cwd=repo_path).strip()
+    return os.path.join(repo_path, hooks_dir, "prepare-commit-msg")
+
+
+def _is_our_hook(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return HOOK_MARKER in f.read()
+    except OSError:
+        return False
+
+
+def cmd_hook(args):
+    """Install or remove the prepare-commit-msg hook"""
+    path = _hook_path(args.repo)
+
+    if args.action == "uninstall":
+        if not os.path.exists(path):
+            return 0
+        if not _is_our_hook(path):
+            print(f"{path} was not installed by SmartCommit; leaving it alone.", file=sys.stderr)
+            return 1
+        os.remove(path)
+        print(f"Removed {path}")
+        return 0
+
+    if os.path.exists(path) and not _is_our_hook(path) and not args.force:
+        print(f"{path} already exists; use --force to replace it.", file=sys.stderr)
+        return 1
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    script = os.path.abspath(__file__)
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("#!/bin/sh\n")
+        f.write(f"{HOOK_MARKER}\n")
+        f.write(f'exec "{sys.executable}" "{script}" prepare-commit-msg --timeout {args.timeout} "$@"\n')
+    os.chmod(path, 0o755)
+    print(f"Installed {path}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="smartcommit",
+        description="Generate commit messages from repository changes without the web UI."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    message = subparsers.add_parser("message", help="print a commit message for the current changes")
+    message.add_argument("--repo", default=".", help="local repository path (default: current directory)")
+    message.add_argument("--remote", help="remote repository URL to compare against")
+    message.add_argument("--staged", action="store_true", help="only use staged changes")
+    message.add_argument("--workers", type=int, default=1, help="processes for the remote per-file diff")
+    message.add_argument("--stream", action="store_true", help="print the message as it is generated")
+    message.add_argument("--analyze", action="store_true", help="also print a change analysis")
+    message.add_argument("--timeout", type=float, default=60, help="seconds to wait for the API")
+    message.set_defaults(func=cmd_message)
+
+    batch = subparsers.add_parser(
+        "batch", help="generate messages for a commit range, writing JSON lines",
+        description="Generate messages for every commit in a range. Output is appended, "
+                    "and commits already written successfully are skipped, so rerunning "
+                    "an interrupted batch resumes it."
+    )
+    batch.add_argument("range", help="commit range, e.g. main~500..main")
+    batch.add_argument("--repo", action="append", help="repository path (repeatable; default: current directory)")
+    batch.add_argument("--output", "-o", required=True, help="JSONL file to append results to")
+    batch.add_argument("--workers", type=int, default=4, help="concurrent requests")
+    batch.add_argument("--rpm", type=_positive_float, default=60, help="maximum requests per minute")
+    batch.add_argument("--retries", type=int, default=5, help="retries for rate limits and transient errors")
+    batch.add_argument("--timeout", type=float, default=60, help="seconds to wait for each API request")
+    batch.set_defaults(func=cmd_batch)
+
+    hook = subparsers.add_parser("hook", help="install or remove the prepare-commit-msg hook")
+    hook.add_argument("action", choices=["install", "uninstall"])
+    hook.add_argument("--repo", default=".", help="repository to install into (default: current directory)")
+    hook.add_argument("--force", action="store_true", help="replace an existing hook")
+    hook.add_argument("--timeout", type=float, default=20, help="seconds the hook waits for a message in total")
+    hook.set_defaults(func=cmd_hook)
+
+    prepare = subparsers.add_parser("prepare-commit-msg", help=argparse.SUPPRESS)
+    prepare.add_argument("message_file")
+    prepare.add_argument("source", nargs="?", default="")
+    prepare.add_argument("sha", nargs="?", default="")
+    prepare.add_argument("--timeout", type=float, default=20)
+    prepare.set_defaults(func=cmd_prepare_commit_msg)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except RuntimeError as e:
+        print(f"smartcommit: {str(e)}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
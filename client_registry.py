@@ -0,0 +1,260 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+# One HTTP connection pool is shared by every API key's client, so
+# keep-alive connections (and their TLS sessions) are reused across
+# sessions instead of each client opening its own
+HTTP_MAX_CONNECTIONS = int(os.getenv("SMARTCOMMIT_HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("SMARTCOMMIT_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("SMARTCOMMIT_HTTP_KEEPALIVE_SECONDS", "60"))
+
+# Requests one API key may have in flight at once (sync and async each),
+# and how often a rate-limited or transient failure is retried
+PER_KEY_CONCURRENCY = int(os.getenv("SMARTCOMMIT_PER_KEY_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.getenv("SMARTCOMMIT_MAX_RETRIES", "4"))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# Clients unused for this many seconds are dropped from the registry
+CLIENT_IDLE_SECONDS = float(os.getenv("SMARTCOMMIT_CLIENT_IDLE_SECONDS", "900"))
+
+# HTTP statuses worth retrying: rate limiting and transient server errors
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Set by request_policy(): (limiter, max_retries) for the requests made in
+# this context, and in contexts copied from it
+_policy = contextvars.ContextVar("smartcommit_request_policy", default=(None, None))
+
+_lock = threading.Lock()
+_clients = {}
+_http_client = None
+_async_http_client = None
+
+
+def is_retryable(exc):
+    """Return True for rate limits, timeouts and transient server errors"""
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in _RETRYABLE_STATUS
+    name = type(exc).__name__
+    return name in ("APITimeoutError", "APIConnectionError", "TimeoutError", "ConnectionError")
+
+
+def retry_after(exc):
+    """Return the server's Retry-After delay in seconds, if it sent one"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after-ms")) / 1000
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+@contextmanager
+def request_policy(limiter=None, max_retries=None):
+    """Within this block, call limiter.acquire() before every API request
+    (each retry and map-reduce sub-request included) and retry failures
+    max_retries times instead of MAX_RETRIES"""
+    token = _policy.set((limiter, max_retries))
+    try:
+        yield
+    finally:
+        _policy.reset(token)
+
+
+def _backoff(attempt):
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_SECONDS
+    )
+
+
+def _timeout():
+    import httpx
+    # The openai package's own default; per-client timeouts override it
+    return httpx.Timeout(600.0, connect=5.0)
+
+
+def shared_http_client():
+    """Return the process-wide httpx.Client used by every sync OpenAI client"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            import httpx
+            _http_client = httpx.Client(limits=_limits(), timeout=_timeout(), follow_redirects=True)
+        return _http_client
+
+
+def shared_async_http_client():
+    """Return the process-wide httpx.AsyncClient used by every async OpenAI client.
+
+    Its pool is bound to the event loop that first uses it, which is why
+    all async requests run on gpt_utils' single background loop.
+    """
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None:
+            import httpx
+            _async_http_client = httpx.AsyncClient(limits=_limits(), timeout=_timeout(), follow_redirects=True)
+        return _async_http_client
+
+
+class _KeyLimits:
+    """Concurrency cap and rate-limit state shared by every client of one
+    API key and endpoint, whatever their timeouts"""
+
+    def __init__(self):
+        # Set when the API answers 429; every request on this key waits it out
+        self.cooldown_until = 0.0
+        self.slots = threading.BoundedSemaphore(PER_KEY_CONCURRENCY)
+        self.async_slots = None
+
+
+class KeyClient:
+    """The OpenAI clients of one API key and timeout, sharing the key's
+    concurrency cap and rate-limit state"""
+
+    def __init__(self, api_key, timeout=None, base_url=None, limits=None):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.base_url = base_url
+        self.last_used = time.monotonic()
+        self.limits = limits or _KeyLimits()
+        self._client = None
+        self._async_client = None
+        self._init_lock = threading.Lock()
+
+    def _options(self):
+        # Retries are handled here so a 429 slows down the whole key
+        options = {"api_key": self.api_key, "max_retries": 0}
+        if self.timeout:
+            options["timeout"] = self.timeout
+        if self.base_url:
+            options["base_url"] = self.base_url
+        return options
+
+    @property
+    def client(self):
+        with self._init_lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(http_client=shared_http_client(), **self._options())
+            return self._client
+
+    @property
+    def async_client(self):
+        with self._init_lock:
+            if self._async_client is None:
+                from openai import AsyncOpenAI
+                self._async_client = AsyncOpenAI(http_client=shared_async_http_client(), **self._options())
+            return self._async_client
+
+    def _note_failure(self, exc, attempt):
+        """Return how long to wait before retrying exc, recording 429 cooldowns"""
+        delay = retry_after(exc)
+        if delay is None:
+            delay = _backoff(attempt)
+        if getattr(exc, "status_code", None) == 429:
+            self.limits.cooldown_until = max(self.limits.cooldown_until, time.monotonic() + delay)
+        return delay
+
+    def _cooldown_remaining(self):
+        return max(0.0, self.limits.cooldown_until - time.monotonic())
+
+    @contextmanager
+    def slot(self):
+        """Hold one of this key's concurrent request slots"""
+        with self.limits.slots:
+            self.last_used = time.monotonic()
+            yield
+
+    def call(self, request):
+        """Run request(client) in a slot, retrying rate limits and transient
+        errors with Retry-After or exponential backoff"""
+        with self.slot():
+            return self.call_with_retries(request)
+
+    def call_with_retries(self, request):
+        """call() for callers already holding a slot (e.g. while streaming)"""
+        limiter, max_retries = _policy.get()
+        max_retries = MAX_RETRIES if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            time.sleep(self._cooldown_remaining())
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                return request(self.client)
+            except Exception as e:
+                if attempt == max_retries or not is_retryable(e):
+                    raise
+                time.sleep(self._note_failure(e, attempt))
+
+    @asynccontextmanager
+    async def async_slot(self):
+        # Created lazily on the event loop that uses it
+        if self.limits.async_slots is None:
+            self.limits.async_slots = asyncio.Semaphore(PER_KEY_CONCURRENCY)
+        async with self.limits.async_slots:
+            self.last_used = time.monotonic()
+            yield
+
+    async def acall(self, request):
+        """Async counterpart of call(); request(async_client) returns an awaitable"""
+        limiter, max_retries = _policy.get()
+        max_retries = MAX_RETRIES if max_retries is None else max_retries
+        async with self.async_slot():
+            for attempt in range(max_retries + 1):
+                await asyncio.sleep(self._cooldown_remaining())
+                if limiter is not None:
+                    await asyncio.to_thread(limiter.acquire)
+                try:
+                    return await request(self.async_client)
+                except Exception as e:
+                    if attempt == max_retries or not is_retryable(e):
+                        raise
+                    await asyncio.sleep(self._note_failure(e, attempt))
+
+
+def get_client(api_key, timeout=None, base_url=None):
+    """Return the KeyClient for these settings, creating it on first use.
+
+    Clients of the same key and base_url share one concurrency cap and
+    429 cooldown. Clients idle for longer than CLIENT_IDLE_SECONDS are
+    evicted on the way.
+    """
+    now = time.monotonic()
+    key = (api_key, timeout, base_url)
+    with _lock:
+        for idle_key in [k for k, c in _clients.items() if now - c.last_used > CLIENT_IDLE_SECONDS]:
+            if idle_key != key:
+                del _clients[idle_key]
+        client = _clients.get(key)
+        if client is None:
+            # Reuse the limits of the key's clients with other timeouts
+            limits = next(
+                (c.limits for c in _clients.values() if (c.api_key, c.base_url) == (api_key, base_url)), None
+            )
+            client = _clients[key] = KeyClient(api_key, timeout, base_url, limits)
+        client.last_used = now
+        return client
+
+
+def clear():
+    """Forget every registered client"""
+    with _lock:
+        _clients.clear()
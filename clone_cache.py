@@ -0,0 +1,475 @@
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import janitor
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Where cached clones live and how much disk they may use in total
+CACHE_ROOT = os.getenv(
+    "SMARTCOMMIT_CLONE_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "smartcommit-clone-cache")
+)
+CACHE_SIZE_BUDGET = int(os.getenv("SMARTCOMMIT_CLONE_CACHE_MB", "2048")) * 1024 * 1024
+# Seconds a clone is trusted before the next request fetches from the remote again
+REFRESH_INTERVAL = float(os.getenv("SMARTCOMMIT_CLONE_REFRESH_SECONDS", "60"))
+
+_META_FILE = "meta.json"
+_LOCK_FILE = "lock"
+_LEASE_FILE = "lease"
+_CHECKOUT_LOCK_FILE = "checkout.lock"
+_REPO_DIR = "repo"
+
+_locks_guard = threading.Lock()
+_thread_locks = {}
+_checkout_locks = {}
+
+# Leases held on each entry by this process's threads; the lease file's
+# flock covers other processes
+_leases_changed = threading.Condition()
+_lease_counts = {}
+
+
+def normalize_remote_url(url):
+    """Normalize a remote URL so equivalent spellings share one cache entry"""
+    url = url.strip()
+    if os.path.exists(url):
+        return "file://" + os.path.abspath(url).rstrip("/\\")
+    if "://" not in url and ":" in url:
+        # scp-like syntax: git@github.com:owner/repo.git
+        host, path = url.split(":", 1)
+        host = host.split("@")[-1]
+    else:
+        parsed = urlparse(url)
+        if parsed.scheme in ("", "file"):
+            return "file://" + os.path.abspath(parsed.path).rstrip("/\\")
+        host = parsed.hostname or ""
+        path = parsed.path
+    path = path.strip("/")
+    if path.endswith(".git"):
+        path = path[:-4]
+    return f"{host.lower()}/{path}"
+
+
+def cache_key(url, options=None):
+    """Return the directory name used to cache clones of the given remote.
+
+    Clones made with different clone options are cached separately.
+    """
+    identity = normalize_remote_url(url)
+    if options:
+        identity += "\0" + json.dumps(options, sort_keys=True)
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()[:16]
+
+
+def clone_options(depth=None, partial=False, single_branch=False, sparse_paths=None):
+    """Return the options dict get_cached_clone accepts, without unset values.
+
+    depth: only fetch this many commits of history (``--depth``)
+    partial: fetch file contents on demand (``--filter=blob:none``); the
+        working tree starts empty and files are checked out as needed
+    single_branch: only fetch the remote's default branch
+    sparse_paths: only check out these directories (cone sparse-checkout)
+    """
+    options = {}
+    if depth:
+        options["depth"] = int(depth)
+    if partial:
+        options["partial"] = True
+    if single_branch:
+        options["single_branch"] = True
+    if sparse_paths:
+        options["sparse_paths"] = sorted({path.strip("/") for path in sparse_paths if path.strip("/")})
+    return options
+
+
+def _git(args, cwd=None):
+    """Run a git command without a shell and return the completed process"""
+    return subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        env=os.environ.copy()
+    )
+
+
+def _directory_size(path):
+    """Return the total size in bytes of all files under path"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _read_meta(entry_dir):
+    try:
+        with open(os.path.join(entry_dir, _META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(entry_dir, meta):
+    tmp_path = os.path.join(entry_dir, _META_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(entry_dir, _META_FILE))
+
+
+def _thread_lock(key):
+    with _locks_guard:
+        return _thread_locks.setdefault(key, threading.Lock())
+
+
+@contextmanager
+def _entry_lock(key, blocking=True):
+    """Lock a cache entry against other threads and other processes.
+
+    Yields True if the lock was acquired, False if blocking is off and the
+    entry is busy.
+    """
+    lock = _thread_lock(key)
+    if not lock.acquire(blocking=blocking):
+        yield False
+        return
+    lock_file = None
+    try:
+        entry_dir = os.path.join(CACHE_ROOT, key)
+        os.makedirs(entry_dir, exist_ok=True)
+        if fcntl is not None:
+            lock_file = open(os.path.join(entry_dir, _LOCK_FILE), "a")
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_file, flags)
+            except BlockingIOError:
+                yield False
+                return
+        yield True
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+        lock.release()
+
+
+def _flock(path, shared=False, blocking=True):
+    """Open path and flock it; returns the file (close it to unlock), or
+    None where flock is unavailable or a non-blocking lock is busy"""
+    if fcntl is None:
+        return None
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _entry_key(clone_path):
+    """Return the cache key of a clone handed out by get_cached_clone, or None"""
+    clone_path = os.path.abspath(clone_path)
+    entry_dir = os.path.dirname(clone_path)
+    if os.path.basename(clone_path) != _REPO_DIR or os.path.dirname(entry_dir) != os.path.abspath(CACHE_ROOT):
+        return None
+    return os.path.basename(entry_dir)
+
+
+@contextmanager
+def lease(clone_path):
+    """Hold a shared lease on a cached clone while reading from it.
+
+    While any lease is held, no thread or process refreshes, replaces or
+    evicts the clone; get_cached_clone waits for the leases to be
+    released first. Paths that are not cached clones are not leased.
+    """
+    key = _entry_key(clone_path)
+    if key is None:
+        yield
+        return
+    # Taken briefly so new leases queue behind a refresh in progress
+    with _thread_lock(key):
+        with _leases_changed:
+            _lease_counts[key] = _lease_counts.get(key, 0) + 1
+    lock_file = None
+    try:
+        lock_file = _flock(os.path.join(CACHE_ROOT, key, _LEASE_FILE), shared=True)
+        yield
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+        with _leases_changed:
+            _lease_counts[key] -= 1
+            if not _lease_counts[key]:
+                del _lease_counts[key]
+            _leases_changed.notify_all()
+
+
+@contextmanager
+def _exclusive(key, blocking=True):
+    """Wait until no lease is held on an entry, and keep new ones out.
+
+    Must be called with the entry lock held. Yields False if blocking is
+    off and the entry is leased.
+    """
+    with _leases_changed:
+        if blocking:
+            _leases_changed.wait_for(lambda: key not in _lease_counts)
+        elif key in _lease_counts:
+            yield False
+            return
+    lock_file = _flock(os.path.join(CACHE_ROOT, key, _LEASE_FILE), blocking=blocking)
+    if fcntl is not None and lock_file is None:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+
+
+def _clone_args(options):
+    args = ["clone"]
+    if options.get("depth"):
+        # --depth implies --single-branch unless --no-single-branch is given
+        args += ["--depth", str(options["depth"])]
+        if not options.get("single_branch"):
+            args.append("--no-single-branch")
+    elif options.get("single_branch"):
+        args.append("--single-branch")
+    if options.get("partial"):
+        args.append("--filter=blob:none")
+    if options.get("partial") or options.get("sparse_paths"):
+        # Checked out below, once sparse-checkout is configured
+        args.append("--no-checkout")
+    return args
+
+
+def _checkout(clone_path, options):
+    """Populate the working tree of a --no-checkout clone"""
+    if options.get("sparse_paths"):
+        result = _git(["sparse-checkout", "set", "--cone", *options["sparse_paths"]], cwd=clone_path)
+        if result.returncode != 0:
+            return f"sparse-checkout failed: {result.stderr.strip()}"
+    if options.get("partial"):
+        # Files are checked out on demand; see checkout_paths
+        return None
+    if options.get("sparse_paths"):
+        result = _git(["reset", "--hard", "HEAD"], cwd=clone_path)
+        if result.returncode != 0:
+            return f"checkout failed: {result.stderr.strip()}"
+    return None
+
+
+def _clone(remote_url, clone_path, options):
+    """Clone remote_url into clone_path, falling back to SSH for HTTPS URLs"""
+    args = _clone_args(options)
+    result = _git([*args, remote_url, clone_path])
+    if result.returncode == 0:
+        return _checkout(clone_path, options)
+    error_msg = f"HTTPS clone failed: {result.stderr.strip()}"
+
+    if remote_url.startswith("https://"):
+        janitor.retire(clone_path)
+        ssh_url = remote_url.replace("https://", "git@").replace("/", ":", 1)
+        result = _git([*args, ssh_url, clone_path])
+        if result.returncode == 0:
+            return _checkout(clone_path, options)
+        error_msg += f", SSH clone failed: {result.stderr.strip()}"
+    return error_msg
+
+
+def _refresh(clone_path, options):
+    """Bring an existing clone up to date with its remote's current branch.
+
+    Returns True if the working tree now matches the remote tip (for
+    partial clones: if the working tree is empty again, ready for
+    checkout_paths).
+    """
+    branch = _git(["symbolic-ref", "--short", "HEAD"], cwd=clone_path)
+    if branch.returncode != 0:
+        return False
+    fetch = ["fetch", "--prune"]
+    if options.get("depth"):
+        fetch += ["--depth", str(options["depth"])]
+    if _git([*fetch, "origin", branch.stdout.strip()], cwd=clone_path).returncode != 0:
+        return False
+    if options.get("partial"):
+        # Move the branch without checking anything out, then drop the
+        # files materialized for the previous comparison
+        if _git(["reset", "--soft", "FETCH_HEAD"], cwd=clone_path).returncode != 0:
+            return False
+        if _git(["read-tree", "--empty"], cwd=clone_path).returncode != 0:
+            return False
+    elif _git(["reset", "--hard", "FETCH_HEAD"], cwd=clone_path).returncode != 0:
+        return False
+    return _git(["clean", "-ffdx"], cwd=clone_path).returncode == 0
+
+
+def _head(clone_path):
+    result = _git(["rev-parse", "HEAD"], cwd=clone_path)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def get_cached_clone(remote_url, max_age=None, options=None):
+    """Return (clone_path, error_msg) for an up-to-date clone of remote_url.
+
+    An existing clone is refreshed with fetch + reset unless it was
+    refreshed less than max_age seconds ago (default REFRESH_INTERVAL);
+    otherwise the remote is cloned into the cache. options (see
+    clone_options) select a shallow, partial, single-branch or sparse
+    clone. Least recently used clones are evicted once the cache grows
+    past CACHE_SIZE_BUDGET.
+
+    Hold lease(clone_path) while reading from the clone, so that other
+    sessions don't refresh or evict it in the meantime.
+    """
+    max_age = REFRESH_INTERVAL if max_age is None else max_age
+    options = options or {}
+    key = cache_key(remote_url, options)
+    entry_dir = os.path.join(CACHE_ROOT, key)
+    clone_path = os.path.join(entry_dir, _REPO_DIR)
+
+    with _entry_lock(key):
+        meta = _read_meta(entry_dir)
+        previous_head = meta.get("head")
+        now = time.time()
+        has_clone = os.path.isdir(os.path.join(clone_path, ".git"))
+
+        if has_clone and now - meta.get("refreshed", 0) < max_age:
+            meta["last_used"] = now
+            _write_meta(entry_dir, meta)
+            return clone_path, None
+
+        with _exclusive(key):
+            if not (has_clone and _refresh(clone_path, options)):
+                # Missing or unusable clone: clone into a staging dir, then swap in
+                staging_path = tempfile.mkdtemp(prefix=janitor.PREFIX + "clone_", dir=entry_dir)
+                os.rmdir(staging_path)
+                error_msg = _clone(remote_url, staging_path, options)
+                if error_msg:
+                    janitor.retire(staging_path)
+                    return None, error_msg
+                # Renamed out of the way now, deleted in the background
+                janitor.retire(clone_path)
+                os.replace(staging_path, clone_path)
+                previous_head = None
+
+        head = _head(clone_path)
+        if head != previous_head or "size" not in meta:
+            meta["size"] = _directory_size(clone_path)
+        meta.update({
+            "url": normalize_remote_url(remote_url),
+            "options": options,
+            "head": head,
+            "refreshed": now,
+            "last_used": now
+        })
+        _write_meta(entry_dir, meta)
+
+    evict(keep=key)
+    return clone_path, None
+
+
+def evict(keep=None, budget=None):
+    """Remove least recently used clones until the cache fits the size budget"""
+    budget = CACHE_SIZE_BUDGET if budget is None else budget
+    if not os.path.isdir(CACHE_ROOT):
+        return
+
+    entries = []
+    for key in os.listdir(CACHE_ROOT):
+        entry_dir = os.path.join(CACHE_ROOT, key)
+        if os.path.isdir(entry_dir):
+            meta = _read_meta(entry_dir)
+            entries.append((meta.get("last_used", 0), meta.get("size", 0), key))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, key in sorted(entries):
+        if total <= budget:
+            break
+        if key == keep:
+            continue
+        with _entry_lock(key, blocking=False) as acquired:
+            if not acquired:
+                continue
+            with _exclusive(key, blocking=False) as unleased:
+                if not unleased:
+                    continue  # in use
+                janitor.retire(os.path.join(CACHE_ROOT, key, _REPO_DIR))
+                try:
+                    os.remove(os.path.join(CACHE_ROOT, key, _META_FILE))
+                except OSError:
+                    pass
+        total -= size
+
+
+def sweep():
+    """Retire the staging clones and trash that interrupted runs left in
+    the cache; returns the number of directories scheduled for deletion"""
+    if not os.path.isdir(CACHE_ROOT):
+        return 0
+    scheduled = 0
+    for key in os.listdir(CACHE_ROOT):
+        entry_dir = os.path.join(CACHE_ROOT, key)
+        if not os.path.isdir(entry_dir):
+            continue
+        with _entry_lock(key, blocking=False) as acquired:
+            if acquired:
+                # Nobody is cloning into this entry, so nothing in it is in use
+                scheduled += janitor.sweep(entry_dir, min_age=0)
+    return scheduled
+
+
+@contextmanager
+def _checkout_lock(clone_path):
+    clone_path = os.path.abspath(clone_path)
+    with _locks_guard:
+        lock = _checkout_locks.setdefault(clone_path, threading.Lock())
+    with lock:
+        lock_file = None
+        if _entry_key(clone_path) is not None:
+            lock_file = _flock(os.path.join(os.path.dirname(clone_path), _CHECKOUT_LOCK_FILE))
+        try:
+            yield
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+
+def checkout_paths(clone_path, paths):
+    """Check out paths missing from a clone's working tree.
+
+    Partial clones start with an empty working tree; this fetches and
+    writes just the blobs a comparison needs, in one batch. Sessions
+    leasing the same clone take turns, as they would race for its index.
+    """
+    with _checkout_lock(clone_path):
+        missing = [path for path in paths if not os.path.lexists(os.path.join(clone_path, path))]
+        if not missing:
+            return
+        result = subprocess.run(
+            ["git", "--literal-pathspecs", "checkout", "--ignore-skip-worktree-bits", "--pathspec-from-file=-",
+             "--pathspec-file-nul", "HEAD"],
+            cwd=clone_path,
+            input=b"".join(path.encode("utf-8", "surrogateescape") + b"\0" for path in missing),
+            capture_output=True,
+            env=os.environ.copy()
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"git checkout failed: {result.stderr.decode('utf-8', 'replace').strip()}")
@@ -0,0 +1,160 @@
+import math
+import re
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character-based estimate
+    tiktoken = None
+
+_encodings = {}
+
+# Extended header lines git writes between `diff --git` and the first hunk
+_GIT_HEADER = (
+    "index ", "old mode ", "new mode ", "deleted file mode ", "new file mode ",
+    "similarity index ", "dissimilarity index ", "rename from ", "rename to ",
+    "copy from ", "copy to ", "--- ", "+++ "
+)
+
+# One-line bodies that stand in for hunks (binary, large and generated files)
+_SUMMARY = re.compile(r"^(Binary files .* differ$|\w+( file)? changed: )")
+
+
+def _encoding(model):
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except Exception:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """Count the tokens text uses for model, estimating if tiktoken is unavailable"""
+    if not text:
+        return 0
+    if tiktoken is not None:
+        try:
+            return len(_encoding(model).encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    # Roughly four characters per token for English and code
+    return math.ceil(len(text) / 4)
+
+
+def split_files(diff_content):
+    """Split a diff into per-file sections.
+
+    Handles both `git diff` output (sections start at `diff --git`) and
+    plain unified diffs (sections start at a `---`/`+++` header pair).
+    Lines outside any section, such as `Only in local:` entries, become
+    sections of their own.
+    """
+    lines = diff_content.splitlines(keepends=True)
+    sections = []
+    current = []
+    in_git_header = False
+
+    for i, line in enumerate(lines):
+        next_line = lines[i + 1] if i + 1 < len(lines) else ""
+        starts_section = line.startswith("diff --git ") or (
+            line.startswith("--- ") and next_line.startswith("+++ ") and not in_git_header
+        )
+        summary = in_git_header and bool(_SUMMARY.match(line))
+        is_header = in_git_header and (line.startswith(_GIT_HEADER) or summary)
+        is_body = is_header or line.startswith((" ", "+", "-", "@@", "\\"))
+
+        if current and (starts_section or not is_body):
+            sections.append(''.join(current))
+            current = []
+        # The header ends at the first hunk, a summary, or any unrelated line
+        in_git_header = line.startswith("diff --git ") or (is_header and not summary)
+        current.append(line)
+
+    if current:
+        sections.append(''.join(current))
+    return sections
+
+
+def split_hunks(section):
+    """Split one file section into its header and a list of hunks"""
+    header = []
+    hunks = []
+    for line in section.splitlines(keepends=True):
+        if line.startswith("@@"):
+            hunks.append([line])
+        elif hunks:
+            hunks[-1].append(line)
+        else:
+            header.append(line)
+    return ''.join(header), [''.join(hunk) for hunk in hunks]
+
+
+def _split_lines(text, max_tokens, model):
+    """Split text at line boundaries into pieces of at most max_tokens"""
+    pieces = []
+    current = []
+    current_tokens = 0
+    for line in text.splitlines(keepends=True):
+        line_tokens = count_tokens(line, model)
+        if current and current_tokens + line_tokens > max_tokens:
+            pieces.append(''.join(current))
+            current = []
+            current_tokens = 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        pieces.append(''.join(current))
+    return pieces
+
+
+def _split_section(section, max_tokens, model):
+    """Split an oversized file section at hunk boundaries, repeating its header"""
+    header, hunks = split_hunks(section)
+    header_tokens = count_tokens(header, model)
+    budget = max(1, max_tokens - header_tokens)
+
+    pieces = []
+    for hunk in hunks or [section]:
+        if count_tokens(hunk, model) <= budget:
+            pieces.append(hunk)
+        else:
+            pieces.extend(_split_lines(hunk, budget, model))
+
+    # Re-pack hunks so small neighbours share a chunk
+    chunks = []
+    current = ''
+    for piece in pieces:
+        if current and count_tokens(current + piece, model) > budget:
+            chunks.append(header + current)
+            current = ''
+        current += piece
+    if current:
+        chunks.append(header + current)
+    return chunks
+
+
+def chunk_diff(diff_content, max_tokens, model="gpt-3.5-turbo"):
+    """Split a diff into chunks of at most max_tokens, cutting at file and hunk boundaries"""
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    for section in split_files(diff_content):
+        section_tokens = count_tokens(section, model)
+        if section_tokens > max_tokens:
+            if current:
+                chunks.append(''.join(current))
+                current = []
+                current_tokens = 0
+            chunks.extend(_split_section(section, max_tokens, model))
+            continue
+        if current and current_tokens + section_tokens > max_tokens:
+            chunks.append(''.join(current))
+            current = []
+            current_tokens = 0
+        current.append(section)
+        current_tokens += section_tokens
+
+    if current:
+        chunks.append(''.join(current))
+    return chunks
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import re
+
+import diff_chunking
+import file_types
+import metrics
+
+# Compaction steps, applied in this order. SMARTCOMMIT_COMPACTION selects a
+# comma-separated subset; "none" turns compaction off.
+STEPS = ("generated", "whitespace", "context", "dedupe", "paths")
+COMPACTION = os.getenv("SMARTCOMMIT_COMPACTION", ",".join(STEPS))
+
+# Unchanged lines kept around each change by the "context" step
+CONTEXT_LINES = int(os.getenv("SMARTCOMMIT_COMPACT_CONTEXT", "1"))
+
+# File names listed per directory by the "paths" step before just counting
+PATHS_PER_DIRECTORY = 3
+
+_ONLY_IN = re.compile(r"^Only in (local|remote): (.+)$")
+
+
+def enabled_steps(steps=None):
+    """Return the configured compaction steps as a tuple in application order"""
+    if steps is None:
+        steps = COMPACTION
+    if isinstance(steps, str):
+        steps = [step.strip() for step in steps.split(",")]
+    return tuple(step for step in STEPS if step in steps)
+
+
+def section_path(section):
+    """Return the file path a diff section is about, or None"""
+    git_path = old_path = None
+    for line in section.splitlines():
+        if line.startswith("diff --git a/"):
+            names = line[len("diff --git a/"):]
+            git_path = names[(len(names) - 3) // 2 + 3:]
+        elif line.startswith("+++ ") and line != "+++ /dev/null":
+            return line[4:].split("/", 1)[-1]
+        elif line.startswith("--- ") and line != "--- /dev/null":
+            old_path = line[4:].split("/", 1)[-1]
+        elif line.startswith("@@"):
+            break
+    return old_path or git_path
+
+
+def _changed_lines(hunk, prefix):
+    return [line[1:] for line in hunk.splitlines()[1:] if line.startswith(prefix)]
+
+
+def _is_whitespace_only(hunk):
+    """True if a hunk's removed and added lines pair up one to one and each
+    pair differs only in whitespace"""
+    removed = [line.split() for line in _changed_lines(hunk, "-")]
+    added = [line.split() for line in _changed_lines(hunk, "+")]
+    return removed == added
+
+
+def _collapse_context(hunk, keep):
+    """Drop unchanged lines further than keep lines from any change"""
+    lines = hunk.splitlines(keepends=True)
+    header, body = lines[0], lines[1:]
+    changed = [i for i, line in enumerate(body) if line.startswith(("+", "-"))]
+    kept = set()
+    for i in changed:
+        kept.update(range(max(0, i - keep), min(len(body), i + keep + 1)))
+
+    output = [header]
+    skipped = False
+    for i, line in enumerate(body):
+        if i in kept or not line.startswith(" "):
+            if skipped and output[-1] is not header:
+                output.append(" ...\n")
+            skipped = False
+            output.append(line)
+        else:
+            skipped = True
+    return "".join(output)
+
+
+def _count_changes(hunks):
+    added = sum(len(_changed_lines(hunk, "+")) for hunk in hunks)
+    removed = sum(len(_changed_lines(hunk, "-")) for hunk in hunks)
+    return added, removed
+
+
+def _compact_section(section, steps, seen_hunks, context):
+    path = section_path(section)
+    header, hunks = diff_chunking.split_hunks(section)
+    if not hunks:
+        return section
+
+    if "generated" in steps and path:
+        reason = file_types.name_reason(path)
+        if reason:
+            added, removed = _count_changes(hunks)
+            label = "Lockfile" if reason == "lockfile" else f"{reason.capitalize()} file"
+            return f"{label} changed: {path} (+{added} -{removed} lines, diff omitted)\n"
+
+    if "whitespace" in steps:
+        hunks = [hunk for hunk in hunks if not _is_whitespace_only(hunk)]
+        if not hunks:
+            return f"Whitespace-only changes: {path or 'unknown file'}\n"
+
+    if "context" in steps:
+        hunks = [_collapse_context(hunk, context) for hunk in hunks]
+
+    if "dedupe" in steps:
+        compacted = []
+        for hunk in hunks:
+            # Compare bodies, ignoring the line numbers in the @@ header
+            hunk_header, _, body = hunk.partition("\n")
+            digest = hashlib.sha1(body.encode("utf-8", "surrogateescape")).digest()
+            first = seen_hunks.get(digest)
+            if first is not None and body.strip():
+                compacted.append(f"{hunk_header}\n (same change as in {first})\n")
+            else:
+                seen_hunks[digest] = path or "another file"
+                compacted.append(hunk)
+        hunks = compacted
+
+    return header + "".join(hunks)
+
+
+def _group_paths(entries):
+    """Group (side, path) "Only in" entries by side and directory"""
+    groups = {}
+    for side, path in entries:
+        directory = path.rsplit("/", 1)[0] + "/" if "/" in path else ""
+        groups.setdefault((side, directory), []).append(path.rsplit("/", 1)[-1])
+
+    lines = []
+    for (side, directory), names in sorted(groups.items()):
+        if len(names) == 1:
+            lines.append(f"Only in {side}: {directory}{names[0]}\n")
+            continue
+        shown = ", ".join(sorted(names)[:PATHS_PER_DIRECTORY])
+        more = f", and {len(names) - PATHS_PER_DIRECTORY} more" if len(names) > PATHS_PER_DIRECTORY else ""
+        lines.append(f"Only in {side}: {len(names)} files in {directory or './'} ({shown}{more})\n")
+    return lines
+
+
+def compact_diff(diff_content, steps=None, context=None, model=None):
+    """Shrink a diff before it is sent to the model.
+
+    Depending on steps (default: SMARTCOMMIT_COMPACTION), lockfile and
+    generated-file diffs become line counts, whitespace-only hunks are
+    dropped, unchanged lines beyond context of a change are collapsed,
+    hunks repeated across files are replaced by a reference to the first,
+    and "Only in" lists are grouped by directory. Returns the compacted
+    text; the tokens saved are recorded on a "diff.compact" span.
+    """
+    steps = enabled_steps(steps)
+    if not steps or not diff_content:
+        return diff_content
+    context = CONTEXT_LINES if context is None else context
+
+    with metrics.span("diff.compact", steps=",".join(steps)) as timing:
+        output = []
+        only_in = []
+        seen_hunks = {}
+        for section in diff_chunking.split_files(diff_content):
+            match = _ONLY_IN.match(section.rstrip("\n"))
+            if match and "paths" in steps:
+                only_in.append((match.group(1), match.group(2)))
+                continue
+            output.append(_compact_section(section, steps, seen_hunks, context))
+        output += _group_paths(only_in)
+        compacted = "".join(output)
+
+        original_tokens = diff_chunking.count_tokens(diff_content, model or "gpt-3.5-turbo")
+        compacted_tokens = diff_chunking.count_tokens(compacted, model or "gpt-3.5-turbo")
+        timing.set(
+            bytes=len(diff_content),
+            original_tokens=original_tokens,
+            compacted_tokens=compacted_tokens,
+            saved_tokens=original_tokens - compacted_tokens
+        )
+    return compacted
@@ -0,0 +1,253 @@
+import os
+import stat
+import threading
+import time
+import weakref
+
+import diff_spool
+import fs_watcher
+import git_utils
+import metrics
+import repo_diff
+
+# A refresh touching more paths than this rebuilds from scratch instead
+MAX_INCREMENTAL_PATHS = int(os.getenv("SMARTCOMMIT_WATCH_MAX_PATHS", "2000"))
+
+# Indexes not refreshed for this long stop watching (and rebuild on their
+# next refresh), so abandoned sessions don't hold watcher threads and fds
+WATCH_IDLE_SECONDS = float(os.getenv("SMARTCOMMIT_WATCH_IDLE_SECONDS", "1800"))
+
+_indexes = weakref.WeakSet()
+_indexes_lock = threading.Lock()
+
+# Remote sections sort as changed files, then files only on one side
+_REMOTE_ORDER = {"diff": 0, "only_local": 1, "only_remote": 2}
+_NO_DIFFERENCES = (3, "")
+
+
+def _close_idle(now):
+    with _indexes_lock:
+        indexes = list(_indexes)
+    for index in indexes:
+        if now - index.last_used > WATCH_IDLE_SECONDS:
+            index.close()
+
+
+class DiffIndex:
+    """The changes of one repository as a DiffSpool ("unstaged", "staged"
+    and "remote" parts), patched from filesystem events instead of being
+    recomputed on every rerun.
+
+    Per path it keeps the local file's mtime, size and blob ID along with
+    its unstaged diff and remote comparison, so refresh() only re-reads and
+    re-diffs the paths the watcher reported whose stat or content actually
+    changed, and only their sections are rewritten in the spool. Staging
+    or committing (which the watcher does not see inside .git) re-reads the
+    whole local status but leaves the remote comparison alone, since that
+    only depends on file contents.
+
+    The watcher stops on close(), when the index is garbage collected (e.g.
+    with its session) or after WATCH_IDLE_SECONDS without a refresh.
+    """
+
+    def __init__(self, local_path, remote_path=None, max_workers=1, warn=None):
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.max_workers = max_workers
+        self.warn = warn
+        self.spool = None
+        self.last_used = time.monotonic()
+        self._watcher = None
+        self._stop_watcher = None
+        self._lock = threading.RLock()
+        self.rebuild()
+        with _indexes_lock:
+            _indexes.add(self)
+        _close_idle(self.last_used)
+
+    def close(self):
+        """Stop watching the repository; the next refresh() rebuilds"""
+        with self._lock:
+            if self._stop_watcher is not None:
+                self._stop_watcher()
+            self._watcher = self._stop_watcher = None
+
+    def rebuild(self):
+        """Recompute everything from scratch"""
+        with self._lock:
+            self.close()
+            # Watch before reading so edits made during the rebuild are not lost
+            self._watcher = fs_watcher.create_watcher(self.local_path)
+            self._stop_watcher = weakref.finalize(self, self._watcher.stop)
+            self._remote_head = None
+            self.spool = diff_spool.DiffSpool()
+            with metrics.span("diff_index.rebuild", remote=self.remote_path is not None):
+                self._git_state = self._read_git_state()
+                self._rebuild_local()
+                if self.remote_path:
+                    self._rebuild_remote()
+                self._render()
+
+    def refresh(self):
+        """Apply the filesystem events seen since the last call and return
+        the patched spool"""
+        self.last_used = time.monotonic()
+        _close_idle(self.last_used)
+        with self._lock:
+            if self._watcher is None:
+                self.rebuild()
+                return self.spool
+            paths, rescan = self._watcher.drain()
+            remote_head = git_utils.head_sha(self.remote_path) if self.remote_path else None
+            # A .gitignore edit can change which untracked files are compared
+            if (rescan or not self._watcher.is_alive() or len(paths) > MAX_INCREMENTAL_PATHS
+                    or remote_head != self._remote_head
+                    or any(path.rsplit("/", 1)[-1] == ".gitignore" for path in paths)):
+                self.rebuild()
+                return self.spool
+
+            git_state = self._read_git_state()
+            if not paths and git_state == self._git_state:
+                return self.spool
+
+            try:
+                with metrics.span("diff_index.refresh", paths=len(paths)):
+                    if git_state != self._git_state:
+                        self._git_state = git_state
+                        self._rebuild_local()
+                    elif paths:
+                        self._update_local(sorted(paths))
+                    if self.remote_path and paths:
+                        self._update_remote(sorted(paths))
+                    self._render()
+            except (OSError, RuntimeError, KeyError):
+                # Files changed again mid-update (e.g. deleted before hashing)
+                self.rebuild()
+            return self.spool
+
+    def _read_git_state(self):
+        try:
+            index_stat = os.stat(os.path.join(self.local_path, ".git", "index"))
+            index = (index_stat.st_mtime_ns, index_stat.st_size)
+        except OSError:
+            index = None
+        return git_utils.head_sha(self.local_path), index
+
+    def _rebuild_local(self):
+        self._unstaged, self._staged = repo_diff.local_sections(self.local_path)
+        self._dirty_local = None
+
+    def _update_local(self, paths):
+        unstaged, _ = repo_diff.local_sections(
+            self.local_path, git_utils.read_status(self.local_path, paths)
+        )
+        for path in paths:
+            self._unstaged.pop(path, None)
+        self._unstaged.update(unstaged)
+        if self._dirty_local is not None:
+            self._dirty_local.update(paths)
+
+    def _rebuild_remote(self):
+        self._remote_head = git_utils.head_sha(self.remote_path)
+        self._sparse_dirs = git_utils.sparse_checkout_dirs(self.remote_path)
+        local_blobs, self._remote_blobs = repo_diff.comparison_blobs(self.local_path, self.remote_path)
+        changed, only_local, only_remote = git_utils.compare_blob_maps(local_blobs, self._remote_blobs)
+        # Stats are filled in the first time an event arrives for a path
+        self._files = {path: (None, None, sha) for path, sha in local_blobs.items()}
+        self._only_local = set(only_local)
+        self._only_remote = set(only_remote)
+        self._file_diffs = repo_diff.diff_changed_files(
+            self.local_path, self.remote_path, changed, self.max_workers, self.warn
+        )
+        self._dirty_remote = None
+
+    def _update_remote(self, paths):
+        if self._sparse_dirs:
+            paths = list(git_utils.filter_paths(dict.fromkeys(paths), self._sparse_dirs))
+        if self._dirty_remote is not None:
+            self._dirty_remote.update(paths)
+
+        present, gone = [], []
+        for path in paths:
+            try:
+                path_stat = os.lstat(os.path.join(self.local_path, path))
+            except OSError:
+                gone.append(path)
+                continue
+            if stat.S_ISDIR(path_stat.st_mode):
+                continue
+            entry = self._files.get(path)
+            if entry and entry[:2] == (path_stat.st_mtime_ns, path_stat.st_size):
+                continue
+            present.append((path, path_stat))
+
+        # Untracked files matching .gitignore are not part of the comparison
+        ignored = git_utils.ignored_paths(self.local_path, [path for path, _ in present])
+        gone += [path for path, _ in present if path in ignored]
+        present = [(path, path_stat) for path, path_stat in present if path not in ignored]
+        hashes = git_utils.hash_files(self.local_path, [path for path, _ in present])
+
+        to_diff = []
+        for path, path_stat in present:
+            sha = hashes[path]
+            previous = self._files.get(path)
+            self._files[path] = (path_stat.st_mtime_ns, path_stat.st_size, sha)
+            if previous and previous[2] == sha:
+                continue  # touched, but the content is the same
+            self._only_remote.discard(path)
+            if path not in self._remote_blobs:
+                self._only_local.add(path)
+                self._file_diffs.pop(path, None)
+            elif self._remote_blobs[path] == sha:
+                self._only_local.discard(path)
+                self._file_diffs.pop(path, None)
+            else:
+                self._only_local.discard(path)
+                to_diff.append(path)
+
+        for path in gone:
+            self._files.pop(path, None)
+            self._file_diffs.pop(path, None)
+            self._only_local.discard(path)
+            if path in self._remote_blobs:
+                self._only_remote.add(path)
+
+        if to_diff:
+            for path in to_diff:
+                self._file_diffs.pop(path, None)
+            self._file_diffs.update(repo_diff.diff_changed_files(
+                self.local_path, self.remote_path, to_diff, self.max_workers, self.warn
+            ))
+
+    def _render(self):
+        """Write the sections that changed since the last render to the spool"""
+        for part, sections in (('unstaged', self._unstaged), ('staged', self._staged)):
+            if self._dirty_local is None:
+                self.spool.clear(part)
+                paths = sorted(sections)
+            elif part == 'unstaged':
+                paths = self._dirty_local
+            else:
+                continue
+            for path in paths:
+                self.spool.put(part, path, path, sections.get(path, ""))
+        self._dirty_local = set()
+
+        if self.remote_path:
+            if self._dirty_remote is None:
+                self.spool.clear('remote')
+                paths = set(self._file_diffs) | self._only_local | self._only_remote
+            else:
+                paths = self._dirty_remote
+            for path in paths:
+                sections = {
+                    "diff": self._file_diffs.get(path, ""),
+                    "only_local": f"Only in local: {path}\n" if path in self._only_local else "",
+                    "only_remote": f"Only in remote: {path}\n" if path in self._only_remote else ""
+                }
+                for kind, section in sections.items():
+                    self.spool.put('remote', (_REMOTE_ORDER[kind], path), path, section)
+            self._dirty_remote = set()
+            # The placeholder get_remote_diff also shows
+            empty = not (self._file_diffs or self._only_local or self._only_remote)
+            self.spool.put('remote', _NO_DIFFERENCES, None, repo_diff.NO_DIFFERENCES if empty else "")
@@ -0,0 +1,196 @@
+import bisect
+import hashlib
+import os
+import tempfile
+import threading
+from collections import namedtuple
+
+# How many files one page of the diff view lists, and how many hunks of a
+# file are shown at once
+FILES_PER_PAGE = int(os.getenv("SMARTCOMMIT_DIFF_FILES_PER_PAGE", "25"))
+HUNKS_PER_PAGE = int(os.getenv("SMARTCOMMIT_DIFF_HUNKS_PER_PAGE", "20"))
+
+# Where one file's section sits in the spool. hunks are the byte offsets of
+# its "@@" lines relative to the section; added and removed count its lines.
+SpoolEntry = namedtuple("SpoolEntry", "path offset length hunks added removed digest")
+
+# Sections replaced by put() stay in the file until they outweigh the live
+# ones by this many bytes, then the file is rewritten
+COMPACT_MIN_BYTES = 1024 * 1024
+
+
+def _index_section(data):
+    hunks = []
+    added = removed = 0
+    position = 0
+    for line in data.splitlines(keepends=True):
+        if line.startswith(b"@@"):
+            hunks.append(position)
+        elif hunks and line.startswith(b"+"):
+            added += 1
+        elif hunks and line.startswith(b"-"):
+            removed += 1
+        position += len(line)
+    return tuple(hunks), added, removed
+
+
+class DiffSpool:
+    """A diff written file section by file section to an anonymous temp
+    file, grouped into named parts (e.g. "unstaged", "staged", "remote").
+
+    Only the index of where each section and hunk starts is kept in memory,
+    so holding a diff costs the same however large it is, and a page of it
+    is read back without touching the rest.
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(prefix="smartcommit_diff_")
+        self._lock = threading.Lock()
+        self._end = 0
+        self._garbage = 0
+        self._entries = {}
+        self._keys = {}
+
+    def _write(self, path, data):
+        hunks, added, removed = _index_section(data)
+        self._file.seek(self._end)
+        self._file.write(data)
+        entry = SpoolEntry(path, self._end, len(data), hunks, added, removed, hashlib.sha1(data).digest())
+        self._end += len(data)
+        return entry
+
+    def add(self, part, path, section):
+        """Append one file's section to part"""
+        data = section.encode("utf-8", "surrogateescape")
+        with self._lock:
+            self._entries.setdefault(part, []).append(self._write(path, data))
+
+    def put(self, part, key, path, section):
+        """Set the section stored under key in part, or remove it if section
+        is empty. Sections put() into a part are kept in key order, and
+        only the replaced section is written."""
+        data = section.encode("utf-8", "surrogateescape")
+        with self._lock:
+            entries = self._entries.setdefault(part, [])
+            keys = self._keys.setdefault(part, [])
+            index = bisect.bisect_left(keys, key)
+            found = index < len(keys) and keys[index] == key
+            if found:
+                self._garbage += entries[index].length
+            if data:
+                entry = self._write(path, data)
+                if found:
+                    entries[index] = entry
+                else:
+                    keys.insert(index, key)
+                    entries.insert(index, entry)
+            elif found:
+                del keys[index]
+                del entries[index]
+            self._maybe_compact()
+
+    def clear(self, part):
+        """Remove every section of part"""
+        with self._lock:
+            self._garbage += sum(entry.length for entry in self._entries.pop(part, []))
+            self._keys.pop(part, None)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        live = self._end - self._garbage
+        if self._garbage < max(COMPACT_MIN_BYTES, live):
+            return
+        old_file = self._file
+        self._file = tempfile.TemporaryFile(prefix="smartcommit_diff_")
+        self._end = self._garbage = 0
+        for part, entries in self._entries.items():
+            for i, entry in enumerate(entries):
+                old_file.seek(entry.offset)
+                data = old_file.read(entry.length)
+                self._file.seek(self._end)
+                self._file.write(data)
+                entries[i] = entry._replace(offset=self._end)
+                self._end += entry.length
+        old_file.close()
+
+    def extend(self, part, sections):
+        """Append (path, section) pairs, e.g. straight from a generator"""
+        for path, section in sections:
+            self.add(part, path, section)
+        return self
+
+    def has(self, part):
+        return bool(self._entries.get(part))
+
+    def files(self, part):
+        """Return the SpoolEntry list of part, in the order it was written"""
+        return self._entries.get(part, [])
+
+    def size(self, part):
+        return sum(entry.length for entry in self.files(part))
+
+    def _read(self, offset, length):
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def section(self, part, index):
+        entry = self._entries[part][index]
+        return self._read(entry.offset, entry.length).decode("utf-8", "surrogateescape")
+
+    def hunks(self, part, index, start=0, count=None):
+        """Return (header, hunks) for hunks start to start + count of one
+        file, reading only those bytes"""
+        entry = self._entries[part][index]
+        header_end = entry.hunks[0] if entry.hunks else entry.length
+        header = self._read(entry.offset, header_end).decode("utf-8", "surrogateescape")
+        stop = len(entry.hunks) if count is None else min(len(entry.hunks), start + count)
+        if start >= stop:
+            return header, []
+        bounds = list(entry.hunks[start:stop + 1])
+        if len(bounds) == stop - start:
+            bounds.append(entry.length)
+        body = self._read(entry.offset + bounds[0], bounds[-1] - bounds[0])
+        return header, [
+            body[bounds[i] - bounds[0]:bounds[i + 1] - bounds[0]].decode("utf-8", "surrogateescape")
+            for i in range(len(bounds) - 1)
+        ]
+
+    def text(self, *parts):
+        """Return the parts as one string, joined the way the changes dict's
+        texts are (for generating a message from them)"""
+        texts = []
+        for part in parts:
+            texts.append("".join(self.section(part, i) for i in range(len(self.files(part)))).rstrip("\n"))
+        return "\n".join(filter(None, texts))
+
+    def digest(self, *parts):
+        """Return a hash identifying the contents of parts"""
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update(f"{part}:".encode())
+            for entry in self.files(part):
+                digest.update(entry.digest)
+            digest.update(b";")
+        return digest.hexdigest()
+
+    def view(self, *parts):
+        return DiffView(self, parts)
+
+    def close(self):
+        self._file.close()
+
+
+class DiffView:
+    """Some parts of a DiffSpool, read as one diff"""
+
+    def __init__(self, spool, parts):
+        self.spool = spool
+        self.parts = parts
+        self.digest = spool.digest(*parts)
+
+    def text(self):
+        return self.spool.text(*self.parts)
+
+    def __bool__(self):
+        return any(self.spool.has(part) for part in self.parts)
@@ -0,0 +1,143 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import file_types
+import line_diff
+
+# Below this many files the pool's IPC overhead outweighs the parallelism
+PARALLEL_THRESHOLD = 16
+
+# Files per pool task at most, which with the in-flight window bounds how
+# many finished diffs are held before the consumer reads them
+MAX_BATCH_FILES = 64
+
+# The shared pool. Asking for a different worker count replaces it; the old
+# pool finishes the work already submitted to it and then exits
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def default_workers():
+    """Return a sensible default number of diff worker processes"""
+    return max(1, min(8, (os.cpu_count() or 1) - 1))
+
+
+def get_file_diff(file1_content, file2_content):
+    """Generate diff between two files"""
+    return line_diff.unified_diff(
+        file1_content.splitlines(keepends=True),
+        file2_content.splitlines(keepends=True),
+        fromfile='file1',
+        tofile='file2'
+    )
+
+
+def diff_file_pair(local_root, remote_root, path):
+    """Read one file from both trees and return (path, diff_text, error_msg).
+
+    Binary and oversized files are not read in full; they get a one-line
+    summary from file_types instead of a text diff.
+    """
+    local_file = os.path.join(local_root, path)
+    remote_file = os.path.join(remote_root, path)
+    try:
+        reason = file_types.classify(remote_file, local_file)
+        if reason:
+            return path, file_types.summarize(path, reason, remote_file, local_file), None
+
+        try:
+            with open(local_file, 'r', encoding='utf-8') as f:
+                local_content = f.read()
+            with open(remote_file, 'r', encoding='utf-8') as f:
+                remote_content = f.read()
+        except UnicodeDecodeError:
+            # Not caught by the sniff: invalid UTF-8 past the first few KB
+            return path, file_types.summarize(path, "binary"), None
+
+        diff = line_diff.unified_diff(
+            remote_content.splitlines(keepends=True),
+            local_content.splitlines(keepends=True),
+            fromfile=f'remote/{path}',
+            tofile=f'local/{path}'
+        )
+        return path, diff, None
+    except Exception as e:
+        return path, '', str(e)
+
+
+def _diff_batch(local_root, remote_root, paths):
+    return [diff_file_pair(local_root, remote_root, path) for path in paths]
+
+
+def _batch_results(batch, future):
+    try:
+        return future.result()
+    except Exception as e:
+        # The worker itself died; report every file in its batch
+        return [(path, '', str(e)) for path in batch]
+
+
+def _get_pool(workers=None):
+    """Return the shared process pool, resized to workers if given"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and workers in (None, _pool_workers):
+            return _pool
+        if _pool is not None:
+            # Doesn't cancel anything: batches already submitted still run
+            _pool.shutdown(wait=False)
+        _pool_workers = workers or default_workers()
+        # spawn keeps workers independent of the (multi-threaded) server process
+        _pool = ProcessPoolExecutor(
+            max_workers=_pool_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        return _pool
+
+
+def _submit(pool, *args):
+    """Submit a batch to pool, moving to the current pool if another caller
+    replaced it; returns (pool, future)"""
+    while True:
+        try:
+            return pool, pool.submit(_diff_batch, *args)
+        except RuntimeError:
+            current = _get_pool()
+            if current is pool:
+                raise
+            pool = current
+
+
+def iter_diff_files(local_root, remote_root, paths, max_workers=1):
+    """Diff the given paths between two trees, yielding results as they come.
+
+    Work is spread over a process pool when there are enough files.
+    Results are (path, diff_text, error_msg) tuples in the same order as
+    paths; at most two batches per worker are in flight at a time. A file
+    that fails only sets its own error_msg.
+    """
+    paths = list(paths)
+    if max_workers <= 1 or len(paths) < PARALLEL_THRESHOLD:
+        for path in paths:
+            yield diff_file_pair(local_root, remote_root, path)
+        return
+
+    # Hand out contiguous batches so each task amortizes its IPC round trip
+    batch_size = max(1, min(MAX_BATCH_FILES, len(paths) // (max_workers * 4)))
+
+    # Keep a bounded window of batches in flight, collected in order, so
+    # finished diffs don't pile up in memory ahead of the consumer
+    pool = _get_pool(max_workers)
+    in_flight = deque()
+    for start in range(0, len(paths), batch_size):
+        batch = paths[start:start + batch_size]
+        pool, future = _submit(pool, local_root, remote_root, batch)
+        in_flight.append((batch, future))
+        if len(in_flight) >= max_workers * 2:
+            yield from _batch_results(*in_flight.popleft())
+    while in_flight:
+        yield from _batch_results(*in_flight.popleft())
@@ -0,0 +1,150 @@
+import codecs
+import hashlib
+import mmap
+import os
+
+import git_utils
+
+# Files larger than this (on either side) are compared chunk by chunk
+# instead of being read and text-diffed
+MAX_DIFF_BYTES = int(os.getenv("SMARTCOMMIT_MAX_DIFF_BYTES", str(2 * 1024 * 1024)))
+
+# How much of a file is sniffed for NUL bytes and encoding, as git does
+SNIFF_BYTES = 8000
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+LOCKFILES = {
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml",
+    "poetry.lock", "Pipfile.lock", "uv.lock", "Cargo.lock", "Gemfile.lock",
+    "composer.lock", "go.sum", "mix.lock", "pubspec.lock", "Podfile.lock"
+}
+
+VENDORED_DIRS = {"vendor", "node_modules", "third_party", "bower_components"}
+
+GENERATED_SUFFIXES = (".min.js", ".min.css", ".map", "_pb2.py", "_pb2_grpc.py", ".pb.go")
+
+
+def _is_true(value):
+    return value not in ("unspecified", "unset", "false")
+
+
+def name_reason(path):
+    """Return "lockfile", "vendored" or "generated" if the path alone says so, else None"""
+    name = path.rsplit("/", 1)[-1]
+    if name in LOCKFILES:
+        return "lockfile"
+    if VENDORED_DIRS.intersection(path.split("/")[:-1]):
+        return "vendored"
+    if name.endswith(GENERATED_SUFFIXES):
+        return "generated"
+    return None
+
+
+def generated_paths(repo_path, paths):
+    """Return {path: reason} for lockfiles and vendored or generated files.
+
+    Besides well-known names, honours `.gitattributes`: `linguist-generated`
+    and `linguist-vendored` mark a file as generated or vendored, and
+    `-diff` marks it as binary.
+    """
+    paths = list(paths)
+    reasons = {}
+    for path in paths:
+        reason = name_reason(path)
+        if reason:
+            reasons[path] = reason
+
+    try:
+        attributes = git_utils.check_attributes(
+            repo_path, [p for p in paths if p not in reasons],
+            ["linguist-generated", "linguist-vendored", "diff"]
+        )
+    except RuntimeError:
+        attributes = {}
+    for path, values in attributes.items():
+        if values.get("diff") == "unset":
+            reasons[path] = "binary"
+        elif _is_true(values.get("linguist-generated", "unspecified")):
+            reasons[path] = "generated"
+        elif _is_true(values.get("linguist-vendored", "unspecified")):
+            reasons[path] = "vendored"
+    return reasons
+
+
+def looks_binary(data):
+    """True if the first SNIFF_BYTES of data contain a NUL or are not UTF-8"""
+    head = data[:SNIFF_BYTES]
+    if b"\0" in head:
+        return True
+    try:
+        # Incremental so a multi-byte character cut off at the end is fine
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def sniff(file_path):
+    """Return "binary" if the start of the file looks binary, else None"""
+    with open(file_path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    return "binary" if looks_binary(head) else None
+
+
+def _chunk_digests(file_path, size):
+    """Yield a digest per chunk of the file, reading it through mmap"""
+    if size == 0:
+        return
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            for offset in range(0, size, HASH_CHUNK_BYTES):
+                yield hashlib.blake2b(view[offset:offset + HASH_CHUNK_BYTES], digest_size=16).digest()
+        finally:
+            view.release()
+
+
+def compare_chunks(remote_file, local_file):
+    """Return (changed_chunks, total_chunks) between two files in bounded memory"""
+    remote_size = os.path.getsize(remote_file)
+    local_size = os.path.getsize(local_file)
+    remote_chunks = list(_chunk_digests(remote_file, remote_size))
+    local_chunks = list(_chunk_digests(local_file, local_size))
+    total = max(len(remote_chunks), len(local_chunks))
+    changed = sum(
+        1 for i in range(total)
+        if i >= len(remote_chunks) or i >= len(local_chunks) or remote_chunks[i] != local_chunks[i]
+    )
+    return changed, total
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def summarize(path, reason, remote_file=None, local_file=None):
+    """Return the one-line summary used in place of a text diff"""
+    if reason == "binary":
+        return f"Binary files remote/{path} and local/{path} differ\n"
+    if reason == "large":
+        changed, total = compare_chunks(remote_file, local_file)
+        return (
+            f"Large file changed: {path} ({format_size(os.path.getsize(remote_file))} -> "
+            f"{format_size(os.path.getsize(local_file))}, {changed} of {total} chunks differ)\n"
+        )
+    label = "Lockfile" if reason == "lockfile" else f"{reason.capitalize()} file"
+    return f"{label} changed: {path} (diff omitted)\n"
+
+
+def classify(remote_file, local_file):
+    """Return "large" or "binary" for files that should not be text-diffed, else None"""
+    if max(os.path.getsize(remote_file), os.path.getsize(local_file)) > MAX_DIFF_BYTES:
+        # Sniff first so big binaries are still reported as binary
+        if sniff(remote_file) or sniff(local_file):
+            return "binary"
+        return "large"
+    return sniff(remote_file) or sniff(local_file)
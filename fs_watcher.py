@@ -0,0 +1,224 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+# How often the polling fallback rescans the tree
+POLL_INTERVAL = float(os.getenv("SMARTCOMMIT_WATCH_POLL_SECONDS", "1"))
+
+# inotify(7) constants
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+    | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Directories whose contents never affect the diff
+_SKIP_DIRS = {".git"}
+
+
+def _relative(root, path):
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+
+def _walk_dirs(root):
+    """Yield every directory under root, skipping .git"""
+    for dirpath, dirnames, _ in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in _SKIP_DIRS]
+        yield dirpath
+
+
+class _BaseWatcher:
+    """Collects the paths changed under root since the last drain()"""
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self._lock = threading.Lock()
+        self._changed = set()
+        self._rescan = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"fs-watcher:{self.root}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def _add(self, paths=(), rescan=False):
+        with self._lock:
+            self._changed.update(paths)
+            self._rescan = self._rescan or rescan
+
+    def drain(self):
+        """Return (changed_paths, rescan) and reset them.
+
+        changed_paths are relative to root; rescan is True when events were
+        lost or a whole directory moved, so callers should start over.
+        """
+        with self._lock:
+            changed, rescan = self._changed, self._rescan
+            self._changed, self._rescan = set(), False
+        return changed, rescan
+
+
+class InotifyWatcher(_BaseWatcher):
+    """Watches a tree with inotify(7) through ctypes, one watch per directory"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+        try:
+            for directory in _walk_dirs(self.root):
+                self._watch(directory)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _watch(self, directory):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            if errno == 28:  # ENOSPC: out of inotify watches
+                raise OSError(errno, "inotify watch limit reached")
+            return  # directory vanished meanwhile
+        self._dirs[wd] = directory
+
+    def _watch_new_directory(self, directory):
+        """Watch a directory created after start, reporting files already in it"""
+        paths = []
+        for dirpath in _walk_dirs(directory):
+            self._watch(dirpath)
+            try:
+                names = os.listdir(dirpath)
+            except OSError:
+                continue  # removed again already
+            for name in names:
+                full_path = os.path.join(dirpath, name)
+                if not os.path.isdir(full_path):
+                    paths.append(_relative(self.root, full_path))
+        self._add(paths)
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                readable, _, _ = select.select([self._fd], [], [], 0.5)
+                if readable:
+                    self._handle(os.read(self._fd, 64 * 1024))
+        except OSError:
+            # Watching broke (e.g. watch limit); let the caller rebuild
+            self._add(rescan=True)
+        finally:
+            os.close(self._fd)
+
+    def _handle(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                self._add(rescan=True)
+                continue
+            if mask & _IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+            if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                if directory != self.root:
+                    continue  # reported through the parent's DELETE/MOVED_FROM
+                self._add(rescan=True)
+                continue
+
+            path = os.path.join(directory, name)
+            if mask & _IN_ISDIR:
+                if name in _SKIP_DIRS:
+                    continue
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    self._watch_new_directory(path)
+                elif mask & _IN_MOVED_FROM:
+                    # Every file below it moved; cheaper to rescan than to track
+                    self._add(rescan=True)
+                continue
+            self._add([_relative(self.root, path)])
+
+
+class PollingWatcher(_BaseWatcher):
+    """Fallback for platforms without inotify: rescans mtimes and sizes"""
+
+    def __init__(self, root, interval=None):
+        super().__init__(root)
+        self.interval = POLL_INTERVAL if interval is None else interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for dirpath in _walk_dirs(self.root):
+            try:
+                entries = list(os.scandir(dirpath))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        continue
+                    info = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                snapshot[_relative(self.root, entry.path)] = (info.st_mtime_ns, info.st_size)
+        return snapshot
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            snapshot = self._scan()
+            changed = {
+                path for path in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(path) != self._snapshot.get(path)
+            }
+            self._snapshot = snapshot
+            if changed:
+                self._add(changed)
+
+
+def create_watcher(root):
+    """Start an inotify watcher for root, or a polling one if inotify is unavailable.
+
+    Each consumer should own its watcher: drain() hands events to one caller.
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root).start()
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(root).start()
+
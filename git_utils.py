@@ -0,0 +1,351 @@
+import hashlib
+import os
+import subprocess
+import threading
+from collections import OrderedDict, namedtuple
+
+# One entry of `git status --porcelain=v2`. kind is "changed", "renamed",
+# "unmerged" or "untracked"; index_status and worktree_status are the X
+# and Y letters ("." for unchanged); modes and SHAs are None where the
+# record has none, and orig_path is only set for renames and copies.
+StatusEntry = namedtuple(
+    "StatusEntry",
+    "kind path index_status worktree_status submodule head_mode index_mode worktree_mode "
+    "head_sha index_sha orig_path"
+)
+
+ZERO_SHA = "0" * 40
+
+# Repositories that keep a `git cat-file --batch` process running; the
+# least recently used one is stopped when another repository needs one
+MAX_CAT_FILES = int(os.getenv("SMARTCOMMIT_MAX_CAT_FILES", "8"))
+
+_cat_files = OrderedDict()
+_cat_files_lock = threading.Lock()
+
+
+def git_output(args, cwd, input=None, errors="surrogateescape"):
+    """Run a git command and return its output as text, raising RuntimeError if it fails"""
+    result = subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        input=input,
+        capture_output=True,
+        env=os.environ.copy()
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"git {args[0]} failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return result.stdout.decode("utf-8", errors)
+
+
+def _git_z(args, cwd, input=None):
+    """Run a git command that emits NUL-separated records and return them"""
+    return [record for record in git_output(args, cwd, input).split("\0") if record]
+
+
+def hash_files(repo_path, paths):
+    """Return {path: blob_sha} for working-tree files, as `git hash-object` would store them"""
+    if not paths:
+        return {}
+    result = subprocess.run(
+        ["git", "hash-object", "--stdin-paths"],
+        cwd=repo_path,
+        input="\n".join(paths).encode("utf-8", "surrogateescape"),
+        capture_output=True,
+        env=os.environ.copy()
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"git hash-object failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return dict(zip(paths, result.stdout.decode("ascii").split()))
+
+
+def list_tree_blobs(repo_path, rev="HEAD"):
+    """Return {path: blob_sha} for every file in the tree of rev"""
+    blobs = {}
+    for record in _git_z(["ls-tree", "-r", "-z", "--full-tree", rev], repo_path):
+        info, path = record.split("\t", 1)
+        _, obj_type, sha = info.split()
+        if obj_type == "blob":  # skip submodule commits
+            blobs[path] = sha
+    return blobs
+
+
+def list_worktree_blobs(repo_path):
+    """Return {path: blob_sha} describing the working tree.
+
+    Clean tracked files take their IDs straight from the index; only
+    modified and untracked (non-ignored) files are hashed.
+    """
+    blobs = {}
+    for record in _git_z(["ls-files", "-s", "-z"], repo_path):
+        info, path = record.split("\t", 1)
+        _, sha, _ = info.split()
+        blobs[path] = sha
+
+    for path in _git_z(["ls-files", "-d", "-z"], repo_path):
+        blobs.pop(path, None)
+
+    dirty = [
+        path for path in _git_z(["ls-files", "-m", "-z"], repo_path) if path in blobs
+    ]
+    dirty += _git_z(["ls-files", "-o", "--exclude-standard", "-z"], repo_path)
+    blobs.update(hash_files(repo_path, dirty))
+    return blobs
+
+
+def sparse_checkout_dirs(repo_path):
+    """Return the cone sparse-checkout directories of repo_path, or None if it is not sparse"""
+    result = subprocess.run(
+        ["git", "config", "--bool", "core.sparseCheckout"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        env=os.environ.copy()
+    )
+    if result.stdout.strip() != "true":
+        return None
+    result = subprocess.run(
+        ["git", "sparse-checkout", "list"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        env=os.environ.copy()
+    )
+    if result.returncode != 0:
+        return None
+    return [line for line in result.stdout.splitlines() if line]
+
+
+def filter_paths(blobs, directories):
+    """Return the entries of a {path: blob_sha} map that a cone-mode sparse
+    checkout of directories contains: everything under them, plus files
+    directly inside their parent directories and the top level"""
+    prefixes = tuple(directory.strip("/") + "/" for directory in directories)
+    parents = {""}
+    for directory in directories:
+        parts = directory.strip("/").split("/")
+        parents.update("/".join(parts[:i]) for i in range(1, len(parts)))
+    return {
+        path: sha for path, sha in blobs.items()
+        if path.startswith(prefixes) or path.rpartition("/")[0] in parents
+    }
+
+
+def compare_blob_maps(local_blobs, remote_blobs):
+    """Split two {path: blob_sha} maps into (changed, only_local, only_remote) sorted path lists"""
+    changed = sorted(
+        path for path, sha in local_blobs.items()
+        if path in remote_blobs and remote_blobs[path] != sha
+    )
+    only_local = sorted(local_blobs.keys() - remote_blobs.keys())
+    only_remote = sorted(remote_blobs.keys() - local_blobs.keys())
+    return changed, only_local, only_remote
+
+
+def head_sha(repo_path):
+    """Return the commit ID HEAD points at, or None for an unborn branch"""
+    result = subprocess.run(
+        ["git", "rev-parse", "--verify", "-q", "HEAD"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        env=os.environ.copy()
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def _parse_status(records):
+    """Split porcelain v2 records into ({header: value}, [StatusEntry])"""
+    records = iter(records)
+    headers = {}
+    entries = []
+    for record in records:
+        kind = record[:1]
+        if kind == "#":
+            name, _, value = record[2:].partition(" ")
+            headers[name] = value
+        elif kind == "1":
+            _, xy, sub, m_head, m_index, m_worktree, h_head, h_index, path = record.split(" ", 8)
+            entries.append(StatusEntry(
+                "changed", path, xy[0], xy[1], sub, m_head, m_index, m_worktree, h_head, h_index, None
+            ))
+        elif kind == "2":
+            _, xy, sub, m_head, m_index, m_worktree, h_head, h_index, _, path = record.split(" ", 9)
+            entries.append(StatusEntry(
+                "renamed", path, xy[0], xy[1], sub, m_head, m_index, m_worktree, h_head, h_index, next(records)
+            ))
+        elif kind == "u":
+            fields = record.split(" ", 10)
+            entries.append(StatusEntry(
+                "unmerged", fields[10], fields[1][0], fields[1][1], fields[2],
+                None, None, fields[6], None, None, None
+            ))
+        elif kind == "?":
+            entries.append(StatusEntry(
+                "untracked", record[2:], "?", "?", "N...", None, None, None, None, None, None
+            ))
+    return headers, entries
+
+
+def read_status(repo_path, paths=None):
+    """Return the StatusEntry list of one `git status --porcelain=v2` pass,
+    including every untracked file, optionally limited to paths"""
+    args = ["status", "--porcelain=v2", "-z", "--untracked-files=all"]
+    if paths is not None:
+        args = ["--literal-pathspecs", *args, "--", *paths]
+        if not paths:
+            return []
+    return _parse_status(_git_z(args, repo_path))[1]
+
+
+def read_branch_status(repo_path):
+    """Like read_status, but also return the branch headers: a
+    ({"branch.head": ..., "branch.ab": "+1 -0", ...}, [StatusEntry]) pair"""
+    return _parse_status(
+        _git_z(["status", "--porcelain=v2", "-z", "--branch", "--untracked-files=all"], repo_path)
+    )
+
+
+def repo_fingerprint(repo_path, status=None):
+    """Return a cheap hash that changes whenever the repository state changes.
+
+    Combines the HEAD commit, the index file's mtime and size, the status
+    entries (read_status() unless given), and the mtime and size of every
+    path they list, so further edits to an already-modified file still register.
+    """
+    if status is None:
+        status = read_status(repo_path)
+    digest = hashlib.sha1()
+    digest.update((head_sha(repo_path) or "").encode("ascii"))
+
+    for entry in status:
+        digest.update(repr(tuple(entry)).encode("utf-8", "surrogateescape") + b"\0")
+        try:
+            path_stat = os.lstat(os.path.join(repo_path, entry.path))
+            digest.update(f"{path_stat.st_mtime_ns}:{path_stat.st_size}".encode("ascii"))
+        except OSError:
+            pass
+
+    # Checked after status, which may itself refresh the index
+    try:
+        index_stat = os.stat(os.path.join(repo_path, ".git", "index"))
+        digest.update(f"{index_stat.st_mtime_ns}:{index_stat.st_size}".encode("ascii"))
+    except OSError:
+        pass
+    return digest.hexdigest()
+
+
+class CatFile:
+    """A long-lived `git cat-file --batch` process, so reading many blobs
+    costs one pipe round trip each instead of one subprocess each"""
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self._lock = threading.Lock()
+        self._process = None
+
+    def _start(self):
+        self._process = subprocess.Popen(
+            ["git", "cat-file", "--batch"],
+            cwd=self.repo_path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=os.environ.copy()
+        )
+
+    def read(self, name, max_bytes=None):
+        """Return the contents of an object (a SHA or "rev:path") as bytes, or
+        None if it does not exist. Objects larger than max_bytes are skipped
+        without being held in memory and their size is returned instead."""
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            try:
+                self._process.stdin.write(name.encode("utf-8", "surrogateescape") + b"\n")
+                self._process.stdin.flush()
+                header = self._process.stdout.readline()
+            except OSError:
+                header = b""
+            if not header:
+                self._close()
+                raise RuntimeError(f"git cat-file exited while reading {name}")
+            if header.endswith(b" missing\n") or header.endswith(b" ambiguous\n"):
+                return None
+            size = int(header.split()[2])
+            if max_bytes is not None and size > max_bytes:
+                remaining = size + 1  # the contents and the newline after them
+                while remaining:
+                    remaining -= len(self._process.stdout.read(min(remaining, 1024 * 1024)))
+                return size
+            data = self._process.stdout.read(size)
+            self._process.stdout.read(1)  # the newline after the contents
+            return data
+
+    def _close(self):
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+            self._process.wait()
+            self._process = None
+
+    def close(self):
+        """Stop the cat-file process; the next read() starts a new one"""
+        with self._lock:
+            self._close()
+
+
+def cat_file(repo_path):
+    """Return the shared CatFile of the repository at repo_path, stopping the
+    least recently used one's process beyond MAX_CAT_FILES repositories"""
+    key = os.path.realpath(repo_path)
+    with _cat_files_lock:
+        reader = _cat_files.get(key)
+        if reader is None:
+            reader = _cat_files[key] = CatFile(key)
+        _cat_files.move_to_end(key)
+        evicted = []
+        while len(_cat_files) > max(1, MAX_CAT_FILES):
+            evicted.append(_cat_files.popitem(last=False)[1])
+    # Waits for a read in progress; a later read() on it starts a new process
+    for old_reader in evicted:
+        old_reader.close()
+    return reader
+
+
+def ignored_paths(repo_path, paths):
+    """Return the subset of paths that .gitignore rules exclude (tracked files never are)"""
+    if not paths:
+        return set()
+    result = subprocess.run(
+        ["git", "check-ignore", "-z", "--stdin"],
+        cwd=repo_path,
+        input=b"".join(path.encode("utf-8", "surrogateescape") + b"\0" for path in paths),
+        capture_output=True,
+        env=os.environ.copy()
+    )
+    # Exit status 1 just means nothing was ignored
+    if result.returncode not in (0, 1):
+        raise RuntimeError(f"git check-ignore failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return {record.decode("utf-8", "surrogateescape") for record in result.stdout.split(b"\0") if record}
+
+
+def check_attributes(repo_path, paths, attributes):
+    """Return {path: {attribute: value}} from `git check-attr` for the given paths.
+
+    Values are "set", "unset", "unspecified" or the attribute's string value.
+    """
+    if not paths:
+        return {}
+    records = _git_z(
+        ["check-attr", "-z", "--stdin", *attributes],
+        repo_path,
+        input=b"".join(path.encode("utf-8", "surrogateescape") + b"\0" for path in paths)
+    )
+    result = {}
+    for i in range(0, len(records) - 2, 3):
+        path, attribute, value = records[i:i + 3]
+        result.setdefault(path, {})[attribute] = value
+    return result
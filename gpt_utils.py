@@ -1,15 +1,32 @@
-from openai import OpenAI
+import asyncio
+import contextvars
 import os
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 from dotenv import load_dotenv
+from response_cache import ResponseCache
+import client_registry
+import diff_chunking
+import diff_compaction
+import metrics
 
 # Load environment variables
 load_dotenv()
 
 class GPTClient:
+    """Selects which API key's client the generation functions use.
+
+    initialize() applies to the current thread (or task) context rather
+    than the whole process, so concurrent sessions with different keys do
+    not replace each other's key. The clients themselves come from
+    client_registry and share one pooled HTTP connection pool.
+    """
     _instance = None
 
     def __init__(self):
-        self.client = None
+        self._settings = contextvars.ContextVar("gpt_client_settings", default=None)
 
     @classmethod
     def get_instance(cls):
@@ -17,26 +34,164 @@ class GPTClient:
             cls._instance = GPTClient()
         return cls._instance
 
-    def initialize(self, api_key):
-        """Initialize or update the OpenAI client with the given API key"""
-        self.client = OpenAI(api_key=api_key)
+    def initialize(self, api_key, timeout=None, base_url=None):
+        """Use the given API key for requests made from the current context"""
+        # The clients themselves are built on first use, so callers that
+        # never reach the API (e.g. the commit hook on a cache hit) skip the
+        # cost of importing openai
+        self._settings.set((api_key, timeout, base_url))
+
+    def current(self):
+        """Return the client_registry.KeyClient for the current context's key"""
+        settings = self._settings.get()
+        if settings is None or settings[0] is None:
+            raise ValueError("OpenAI client not initialized. Please set an API key first.")
+        return client_registry.get_client(*settings)
+
+    @property
+    def client(self):
+        return self.current().client
+
+    @property
+    def async_client(self):
+        return self.current().async_client
 
     def is_initialized(self):
         """Check if the client has been initialized"""
-        return self.client is not None
+        settings = self._settings.get()
+        return settings is not None and settings[0] is not None
 
 # Create a global instance
 gpt_client = GPTClient.get_instance()
 
-def generate_commit_message(diff_content):
-    """
-    Generate a commit message using GPT based on the provided diff content.
+MODEL = os.getenv("SMARTCOMMIT_MODEL", "gpt-3.5-turbo")
+TEMPERATURE = 0.7
+
+# Token limits for summarizing large diffs. Diffs up to SINGLE_PASS_TOKENS go
+# out in one request; larger ones are split into MAP_CHUNK_TOKENS chunks that
+# are summarized concurrently and then reduced into one commit message.
+SINGLE_PASS_TOKENS = int(os.getenv("SMARTCOMMIT_SINGLE_PASS_TOKENS", "3000"))
+MAP_CHUNK_TOKENS = int(os.getenv("SMARTCOMMIT_MAP_CHUNK_TOKENS", "2500"))
+MAP_MAX_TOKENS = int(os.getenv("SMARTCOMMIT_MAP_MAX_TOKENS", "150"))
+REDUCE_MAX_TOKENS = int(os.getenv("SMARTCOMMIT_REDUCE_MAX_TOKENS", "300"))
+TOTAL_TOKEN_BUDGET = int(os.getenv("SMARTCOMMIT_TOTAL_TOKEN_BUDGET", "60000"))
+MAP_CONCURRENCY = int(os.getenv("SMARTCOMMIT_MAP_CONCURRENCY", "4"))
+
+# Limits for the async client: requests in flight at once across all
+# sessions, and seconds a single request may take including queueing
+ASYNC_CONCURRENCY = int(os.getenv("SMARTCOMMIT_ASYNC_CONCURRENCY", "4"))
+REQUEST_TIMEOUT = float(os.getenv("SMARTCOMMIT_REQUEST_TIMEOUT", "60"))
+
+# Bump when a prompt template changes so stale cached responses are not reused
+PROMPT_VERSION = 1
+
+# Persistent cache of generated responses, keyed by diff and generation parameters
+response_cache = ResponseCache()
+
+# Per-context hooks for requests that miss the cache: a threading.Event that
+# stops further requests once set, and a callback told each request's
+# estimated token cost before it is sent
+_cancelled = contextvars.ContextVar("gpt_utils_cancelled", default=None)
+_on_request = contextvars.ContextVar("gpt_utils_on_request", default=None)
+
+def _before_request(messages, max_tokens, model):
+    """Called just before a request the cache could not answer is sent"""
+    cancelled = _cancelled.get()
+    if cancelled is not None and cancelled.is_set():
+        raise CancelledError()
+    on_request = _on_request.get()
+    if on_request is not None:
+        on_request(sum(diff_chunking.count_tokens(m["content"], model) for m in messages) + max_tokens)
+
+def _cached_completion(kind, diff_content, messages, max_tokens, model=None):
+    """Return a chat completion, served from the response cache when possible"""
+    model = model or MODEL
+    key = response_cache.make_key(
+        kind, diff_content, PROMPT_VERSION,
+        model=model, temperature=TEMPERATURE, max_tokens=max_tokens
+    )
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+
+    _before_request(messages, max_tokens, model)
+    with metrics.span("openai.chat_completion", kind=kind, model=model) as timing:
+        response = gpt_client.current().call(lambda client: client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=max_tokens
+        ))
+        _record_usage(timing, response, messages)
+    content = response.choices[0].message.content.strip()
+    response_cache.set(key, content)
+    return content
+
+def _record_usage(timing, response, messages, completion=None):
+    """Attach prompt/completion token counts to a timing span, estimating
+    them when the API does not report usage (e.g. for streams)"""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        timing.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+        return
+    model = timing.attributes.get("model") or MODEL
+    timing.set(
+        prompt_tokens=sum(diff_chunking.count_tokens(m["content"], model) for m in messages),
+        completion_tokens=diff_chunking.count_tokens(completion or "", model)
+    )
+
+def _stream_completion(request, error_prefix):
+    """Yield a chat completion's text as it arrives.
+
+    Cache hits are yielded in one piece. The full text is cached only once
+    the stream completes, so a stream abandoned mid-way (e.g. by a
+    Streamlit rerun closing the generator) closes its HTTP response and
+    leaves nothing behind.
     """
-    if not gpt_client.is_initialized():
-        raise ValueError("OpenAI client not initialized. Please set an API key first.")
+    model = request["model"] or MODEL
+    key = response_cache.make_key(
+        request["kind"], request["diff_content"], PROMPT_VERSION,
+        model=model, temperature=TEMPERATURE, max_tokens=request["max_tokens"]
+    )
+    cached = response_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
 
-    prompt = f"""Analyze the following code changes and generate a comprehensive commit message.
-    Follow these guidelines:
+    stream = None
+    try:
+        key_client = gpt_client.current()
+        # The slot is held until the stream ends, not just until it starts
+        with metrics.span("openai.chat_completion", kind=request["kind"], model=model, streamed=True) as timing, \
+                key_client.slot():
+            stream = key_client.call_with_retries(lambda client: client.chat.completions.create(
+                model=model,
+                messages=request["messages"],
+                temperature=TEMPERATURE,
+                max_tokens=request["max_tokens"],
+                stream=True
+            ))
+            parts = []
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        timing.set(first_token_seconds=time.time() - timing.started)
+                    parts.append(delta)
+                    yield delta
+            _record_usage(timing, None, request["messages"], ''.join(parts))
+        response_cache.set(key, ''.join(parts).strip())
+    except Exception as e:
+        yield f"{error_prefix}: {str(e)}"
+    finally:
+        if stream is not None:
+            stream.close()
+
+COMMIT_SYSTEM_PROMPT = "You are a senior developer who writes clear, detailed, and professional git commit messages following best practices."
+
+COMMIT_GUIDELINES = """Follow these guidelines:
     1. First line: Write a concise summary (max 50 characters)
     2. Leave one blank line
     3. Detailed description:
@@ -46,34 +201,166 @@ def generate_commit_message(diff_content):
        - Note any dependencies added/removed
     4. Use imperative mood (e.g., "Add" not "Added")
     5. Focus on what changed and why, not how
-    6. If the changes include multiple distinct updates, list them with bullet points
+    6. If the changes include multiple distinct updates, list them with bullet points"""
+
+def _commit_message_request(diff_content, model=None, single_pass_tokens=None, chunk_tokens=None,
+                            map_max_tokens=None, reduce_max_tokens=None, token_budget=None,
+                            compaction=None):
+    """Build the completion request that produces a commit message for diff_content.
+
+    The diff is first shrunk by diff_compaction (compaction selects the
+    steps). Diffs still larger than single_pass_tokens then go through the
+    map stage of _reduce_request, and the returned request is its reduce
+    step.
+    """
+    model = model or MODEL
+    diff_content = diff_compaction.compact_diff(diff_content, compaction, model=model)
+    single_pass_tokens = single_pass_tokens or SINGLE_PASS_TOKENS
+    if diff_chunking.count_tokens(diff_content, model) > single_pass_tokens:
+        return _reduce_request(
+            diff_content, model=model, chunk_tokens=chunk_tokens, map_max_tokens=map_max_tokens,
+            reduce_max_tokens=reduce_max_tokens, token_budget=token_budget
+        )
+
+    prompt = f"""Analyze the following code changes and generate a comprehensive commit message.
+    {COMMIT_GUIDELINES}
     
     Code changes:
     {diff_content}
     """
-    
+    return {
+        "kind": "commit_message",
+        "diff_content": diff_content,
+        "messages": [
+            {"role": "system", "content": COMMIT_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 300,
+        "model": model
+    }
+
+def generate_commit_message(diff_content, raise_errors=False, **limits):
+    """
+    Generate a commit message using GPT based on the provided diff content.
+
+    The diff is compacted first (see diff_compaction.compact_diff). Diffs
+    larger than SINGLE_PASS_TOKENS are summarized chunk by chunk and then
+    reduced into one message; see _reduce_request. Keyword arguments
+    override the model, the per-stage token limits and the compaction
+    steps. API errors are returned as an error message unless
+    raise_errors is set.
+    """
+    if not gpt_client.is_initialized():
+        raise ValueError("OpenAI client not initialized. Please set an API key first.")
+
     try:
-        response = gpt_client.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a senior developer who writes clear, detailed, and professional git commit messages following best practices."
-                },
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=300
-        )
-        
-        return response.choices[0].message.content.strip()
+        return _cached_completion(**_commit_message_request(diff_content, **limits))
     except Exception as e:
+        if raise_errors:
+            raise
         return f"Error generating commit message: {str(e)}"
 
-def analyze_changes(diff_content):
+def stream_commit_message(diff_content, **limits):
     """
-    Analyze the changes to provide additional context about the modifications.
+    Streaming variant of generate_commit_message that yields text as it arrives.
+    """
+    if not gpt_client.is_initialized():
+        raise ValueError("OpenAI client not initialized. Please set an API key first.")
+
+    try:
+        request = _commit_message_request(diff_content, **limits)
+    except Exception as e:
+        yield f"Error generating commit message: {str(e)}"
+        return
+    yield from _stream_completion(request, "Error generating commit message")
+
+def _summarize_chunk(chunk, model, max_tokens):
+    """Map step: summarize one chunk of a large diff"""
+    prompt = f"""Summarize the following part of a larger set of code changes.
+    List each affected file with a short description of what changed in it.
+    Be concise; this summary will be combined with summaries of the other parts.
+    
+    Code changes:
+    {chunk}
+    """
+    return _cached_completion(
+        "chunk_summary",
+        chunk,
+        [
+            {"role": "system", "content": "You are a senior developer who summarizes code changes accurately and concisely."},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=max_tokens,
+        model=model
+    )
+
+def _reduce_request(diff_content, model=None, chunk_tokens=None, map_max_tokens=None,
+                    reduce_max_tokens=None, token_budget=None, concurrency=None):
+    """Run the map stage over a large diff and build the reduce request.
+
+    The diff is split at file and hunk boundaries into chunks of at most
+    chunk_tokens, the chunks are summarized concurrently, and the returned
+    request reduces the summaries into a commit message. Chunks that would
+    push the run past token_budget (prompt plus completion tokens across
+    all requests) are left out and the message notes the omission.
+    """
+    model = model or MODEL
+    chunk_tokens = chunk_tokens or MAP_CHUNK_TOKENS
+    map_max_tokens = map_max_tokens or MAP_MAX_TOKENS
+    reduce_max_tokens = reduce_max_tokens or REDUCE_MAX_TOKENS
+    token_budget = token_budget or TOTAL_TOKEN_BUDGET
+    concurrency = concurrency or MAP_CONCURRENCY
+
+    chunks = diff_chunking.chunk_diff(diff_content, chunk_tokens, model)
+
+    # Reserve room for the reduce request, which sees every chunk summary
+    remaining = token_budget - reduce_max_tokens
+    selected = []
+    for chunk in chunks:
+        cost = diff_chunking.count_tokens(chunk, model) + 2 * map_max_tokens
+        if cost > remaining:
+            break
+        selected.append(chunk)
+        remaining -= cost
+    if not selected:
+        raise ValueError("diff exceeds the configured token budget")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Each task runs in a copy of this context so it uses the same API key
+        futures = [
+            executor.submit(contextvars.copy_context().run, _summarize_chunk, chunk, model, map_max_tokens)
+            for chunk in selected
+        ]
+        summaries = [future.result() for future in futures]
+
+    combined = "\n\n".join(
+        f"Part {i}:\n{summary}" for i, summary in enumerate(summaries, 1)
+    )
+    omitted = len(chunks) - len(selected)
+    if omitted:
+        combined += f"\n\n({omitted} more part(s) of the diff were omitted to stay within the token budget.)"
+
+    prompt = f"""The following are summaries of consecutive parts of one set of code changes.
+    Combine them into a single comprehensive commit message.
+    {COMMIT_GUIDELINES}
+    
+    Change summaries:
+    {combined}
     """
+    return {
+        "kind": "commit_message_reduce",
+        "diff_content": combined,
+        "messages": [
+            {"role": "system", "content": COMMIT_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": reduce_max_tokens,
+        "model": model
+    }
+
+def _analysis_request(diff_content):
+    """Build the completion request that analyzes diff_content"""
+    diff_content = diff_compaction.compact_diff(diff_content, model=MODEL)
     prompt = f"""Analyze the following code changes and provide a brief summary of:
     1. Type of changes (feature, bugfix, refactor, etc.)
     2. Files affected
@@ -83,21 +370,212 @@ def analyze_changes(diff_content):
     Code changes:
     {diff_content}
     """
-    
+    return {
+        "kind": "analysis",
+        "diff_content": diff_content,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a code review assistant that analyzes code changes and provides helpful insights."
+            },
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 200,
+        "model": MODEL
+    }
+
+def analyze_changes(diff_content):
+    """
+    Analyze the changes to provide additional context about the modifications.
+    """
     try:
-        response = gpt_client.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a code review assistant that analyzes code changes and provides helpful insights."
-                },
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=200
+        return _cached_completion(**_analysis_request(diff_content))
+    except Exception as e:
+        return f"Error analyzing changes: {str(e)}"
+
+def stream_analysis(diff_content):
+    """
+    Streaming variant of analyze_changes that yields text as it arrives.
+    """
+    yield from _stream_completion(_analysis_request(diff_content), "Error analyzing changes")
+
+class BackgroundStream:
+    """Consumes a text stream (e.g. stream_analysis) on a background thread.
+
+    Iterating yields the text as it arrives, including any received before
+    iteration began, so the stream makes progress while something else is
+    rendered. close() stops it and aborts the underlying request.
+    """
+
+    def __init__(self, stream):
+        self._parts = queue.Queue()
+        self._stopped = threading.Event()
+        # Run in a copy of this context so the stream uses the same API key
+        threading.Thread(
+            target=contextvars.copy_context().run, args=(self._consume, stream),
+            name="gpt-utils-stream", daemon=True
+        ).start()
+
+    def _consume(self, stream):
+        try:
+            for text in stream:
+                if self._stopped.is_set():
+                    break
+                self._parts.put(text)
+        finally:
+            stream.close()
+            self._parts.put(None)
+
+    def __iter__(self):
+        while True:
+            text = self._parts.get()
+            if text is None:
+                self._parts.put(None)  # later iterations end at once too
+                return
+            yield text
+
+    def close(self):
+        self._stopped.set()
+
+
+# The async client's connection pool is bound to the event loop that first
+# uses it, so every async request runs on one long-lived background loop.
+_loop = None
+_loop_lock = threading.Lock()
+_semaphore = None
+
+def _event_loop():
+    """Return the background event loop, starting it on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="gpt-utils-async", daemon=True).start()
+        return _loop
+
+def _run_async(coro):
+    """Schedule coro on the background loop and return a concurrent.futures.Future.
+
+    The task runs in a copy of the caller's context, so it sees the API key
+    selected with gpt_client.initialize.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _event_loop())
+
+async def _async_cached_completion(kind, diff_content, messages, max_tokens, model=None):
+    """Async counterpart of _cached_completion, bounded by ASYNC_CONCURRENCY"""
+    global _semaphore
+    model = model or MODEL
+    key = response_cache.make_key(
+        kind, diff_content, PROMPT_VERSION,
+        model=model, temperature=TEMPERATURE, max_tokens=max_tokens
+    )
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(ASYNC_CONCURRENCY)
+    async with _semaphore:
+        _before_request(messages, max_tokens, model)
+        with metrics.span("openai.chat_completion", kind=kind, model=model, async_client=True) as timing:
+            response = await gpt_client.current().acall(lambda client: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=TEMPERATURE,
+                max_tokens=max_tokens
+            ))
+            _record_usage(timing, response, messages)
+    content = response.choices[0].message.content.strip()
+    response_cache.set(key, content)
+    return content
+
+async def generate_commit_message_async(diff_content, timeout=None, **limits):
+    """
+    Async variant of generate_commit_message.
+    """
+    if not gpt_client.is_initialized():
+        raise ValueError("OpenAI client not initialized. Please set an API key first.")
+
+    # Building the request may run the (threaded) map stage for large diffs,
+    # which cancelling this coroutine cannot interrupt; the event stops it
+    # from sending its remaining chunk requests instead
+    cancelled = threading.Event()
+    token = _cancelled.set(cancelled)
+    try:
+        request = await asyncio.get_running_loop().run_in_executor(
+            None, contextvars.copy_context().run, lambda: _commit_message_request(diff_content, **limits)
         )
-        
-        return response.choices[0].message.content.strip()
+        return await asyncio.wait_for(
+            _async_cached_completion(**request), timeout or REQUEST_TIMEOUT
+        )
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+    except asyncio.TimeoutError:
+        return "Error generating commit message: request timed out"
     except Exception as e:
-        return f"Error analyzing changes: {str(e)}" 
\ No newline at end of file
+        return f"Error generating commit message: {str(e)}"
+    finally:
+        _cancelled.reset(token)
+
+async def analyze_changes_async(diff_content, timeout=None):
+    """
+    Async variant of analyze_changes.
+    """
+    try:
+        return await asyncio.wait_for(
+            _async_cached_completion(**_analysis_request(diff_content)), timeout or REQUEST_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        return "Error analyzing changes: request timed out"
+    except Exception as e:
+        return f"Error analyzing changes: {str(e)}"
+
+async def _message_and_analysis(diff_content, timeout):
+    return await asyncio.gather(
+        generate_commit_message_async(diff_content, timeout),
+        analyze_changes_async(diff_content, timeout)
+    )
+
+def generate_message_and_analysis(diff_content, timeout=None):
+    """
+    Generate the commit message and the change analysis for the same diff
+    concurrently and return them as a (message, analysis) tuple.
+    """
+    if not gpt_client.is_initialized():
+        raise ValueError("OpenAI client not initialized. Please set an API key first.")
+
+    message, analysis = _run_async(_message_and_analysis(diff_content, timeout)).result()
+    return message, analysis
+
+def start_stream_analysis(diff_content):
+    """
+    Start stream_analysis in the background and return a BackgroundStream
+    of its text, so the analysis runs while the commit message streams.
+    """
+    if not gpt_client.is_initialized():
+        raise ValueError("OpenAI client not initialized. Please set an API key first.")
+
+    return BackgroundStream(stream_analysis(diff_content))
+
+def start_commit_message(diff_content, delay=0, on_start=None, on_request=None, timeout=None):
+    """
+    Start generate_commit_message_async in the background after delay
+    seconds and return a concurrent.futures.Future for its result.
+    on_start() is called once the delay has passed, and on_request(tokens)
+    before each API request the response cache cannot answer, with its
+    estimated prompt plus completion tokens. Cancelling the future during
+    the delay skips the request, and afterwards aborts it along with any
+    chunk requests of the map stage not yet sent.
+    """
+    if not gpt_client.is_initialized():
+        raise ValueError("OpenAI client not initialized. Please set an API key first.")
+
+    async def run():
+        await asyncio.sleep(delay)
+        if on_start:
+            on_start()
+        _on_request.set(on_request)
+        return await generate_commit_message_async(diff_content, timeout)
+
+    return _run_async(run())
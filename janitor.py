@@ -0,0 +1,121 @@
+import os
+import queue
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import uuid
+
+import metrics
+
+# Directories this app creates (and may leave behind when a process dies)
+PREFIX = "smartcommit_"
+TRASH_PREFIX = PREFIX + "trash_"
+
+# Orphaned smartcommit_* directories younger than this are left alone, in
+# case another running process still uses them
+ORPHAN_MIN_AGE = float(os.getenv("SMARTCOMMIT_JANITOR_MIN_AGE_SECONDS", "3600"))
+
+# Deleting a directory that is still in use (Windows) is retried in the background
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 2.0
+
+_queue = queue.Queue()
+_lock = threading.Lock()
+_thread = None
+
+
+def _make_writable(func, path, exc_info):
+    """rmtree error handler: clear the read-only bit (which git sets on
+    object files and which stops deletion on Windows) and try once more"""
+    try:
+        os.chmod(path, stat.S_IREAD | stat.S_IWRITE | stat.S_IEXEC)
+        func(path)
+    except OSError:
+        pass  # left for the next attempt
+
+
+def _run():
+    while True:
+        path, attempt, not_before = _queue.get()
+        try:
+            delay = not_before - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with metrics.span("janitor.delete", attempt=attempt):
+                shutil.rmtree(path, onerror=_make_writable)
+            if os.path.lexists(path) and attempt + 1 < MAX_ATTEMPTS:
+                _queue.put((path, attempt + 1, time.monotonic() + RETRY_DELAY * 2 ** attempt))
+        except Exception:
+            pass  # never let one path stop the janitor
+        finally:
+            _queue.task_done()
+
+
+def start():
+    """Start the janitor thread if it is not running yet"""
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="smartcommit-janitor", daemon=True)
+            _thread.start()
+
+
+def retire(path):
+    """Schedule a directory for deletion in the background and return at once.
+
+    The directory is first renamed to a smartcommit_trash_* sibling, so
+    path can be reused straight away; if renaming fails (e.g. a file in it
+    is open on Windows) it is deleted where it is. Returns the path that
+    will be deleted, or None if there was nothing to delete.
+    """
+    if not os.path.lexists(path):
+        return None
+    path = os.path.abspath(path)
+    trash = os.path.join(os.path.dirname(path), f"{TRASH_PREFIX}{uuid.uuid4().hex}")
+    try:
+        os.rename(path, trash)
+    except OSError:
+        trash = path
+    start()
+    _queue.put((trash, 0, 0.0))
+    return trash
+
+
+def sweep(root=None, min_age=None, exclude=()):
+    """Retire the smartcommit_* directories directly under root (default:
+    the system temp directory) that earlier runs left behind.
+
+    Trash is always removed; other directories only once they have not
+    been modified for min_age seconds (default ORPHAN_MIN_AGE). Paths in
+    exclude are kept. Returns the number of directories scheduled.
+    """
+    root = root or tempfile.gettempdir()
+    min_age = ORPHAN_MIN_AGE if min_age is None else min_age
+    excluded = {os.path.realpath(path) for path in exclude}
+    now = time.time()
+    scheduled = 0
+    try:
+        entries = list(os.scandir(root))
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.name.startswith(PREFIX) or os.path.realpath(entry.path) in excluded:
+            continue
+        try:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            if not entry.name.startswith(TRASH_PREFIX) and now - entry.stat().st_mtime < min_age:
+                continue
+        except OSError:
+            continue
+        start()
+        _queue.put((entry.path, 0, 0.0))
+        scheduled += 1
+    return scheduled
+
+
+def wait():
+    """Block until every scheduled deletion (including retries) has finished"""
+    _queue.join()
@@ -0,0 +1,323 @@
+import os
+import time
+from bisect import bisect_left
+
+# Hard limits: past either one the diff is replaced by a one-line summary
+DIFF_TIMEOUT = float(os.getenv("SMARTCOMMIT_DIFF_TIMEOUT", "5"))
+MAX_DIFF_LINES = int(os.getenv("SMARTCOMMIT_MAX_DIFF_LINES", "500000"))
+
+# Lines occurring more often than this are never used as histogram anchors
+_MAX_CHAIN = 64
+
+
+class DiffTimeout(Exception):
+    """Raised internally when a diff exceeds its time budget"""
+
+
+def _intern(a_lines, b_lines):
+    """Map lines to integer IDs so comparisons are int compares"""
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in a_lines]
+    b = [ids.setdefault(line, len(ids)) for line in b_lines]
+    return a, b
+
+
+def _longest_increasing(pairs):
+    """Return the longest run of (i, j) pairs increasing in both i and j.
+
+    pairs must already be sorted by i (patience sorting on j).
+    """
+    tails = []
+    tail_index = []
+    previous = [None] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+        previous[k] = tail_index[pos - 1] if pos else None
+
+    result = []
+    k = tail_index[-1] if tail_index else None
+    while k is not None:
+        result.append(pairs[k])
+        k = previous[k]
+    result.reverse()
+    return result
+
+
+def _unique_anchors(a, alo, ahi, b, blo, bhi):
+    """Patience step: lines that occur exactly once on each side, in a
+    common order"""
+    # line -> [index in a, index in b, count in a, count in b]
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.setdefault(a[i], [i, None, 0, 0])
+        entry[2] += 1
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[1] = j
+            entry[3] += 1
+    pairs = sorted((i, j) for i, j, a_count, b_count in counts.values() if a_count == 1 and b_count == 1)
+    return _longest_increasing(pairs)
+
+
+def _histogram_anchor(a, alo, ahi, b, blo, bhi, deadline=None):
+    """Histogram step: the longest common region containing one of the
+    rarest lines shared by both sides, as (i, j, size), or None.
+
+    As in git, the scan of b skips past every region already extended,
+    and stops early (keeping the best region so far) once extending
+    matches has cost _MAX_CHAIN comparisons per line of the range.
+    """
+    positions = {}
+    for i in range(alo, ahi):
+        positions.setdefault(a[i], []).append(i)
+
+    best = None
+    best_key = None
+    budget = _MAX_CHAIN * (ahi - alo + bhi - blo)
+    j = blo
+    while j < bhi:
+        if deadline is not None and time.monotonic() > deadline:
+            raise DiffTimeout()
+        next_j = j + 1
+        occurrences = positions.get(b[j])
+        if occurrences and len(occurrences) <= (best_key[0] if best else _MAX_CHAIN):
+            for i in occurrences:
+                # Extend the match in both directions; like git, a region
+                # counts as rare as the rarest line in it
+                count = len(occurrences)
+                start_i, start_j = i, j
+                while start_i > alo and start_j > blo and a[start_i - 1] == b[start_j - 1]:
+                    start_i -= 1
+                    start_j -= 1
+                    if len(positions[a[start_i]]) < count:
+                        count = len(positions[a[start_i]])
+                end_i, end_j = i + 1, j + 1
+                while end_i < ahi and end_j < bhi and a[end_i] == b[end_j]:
+                    if len(positions[a[end_i]]) < count:
+                        count = len(positions[a[end_i]])
+                    end_i += 1
+                    end_j += 1
+                size = end_i - start_i
+                budget -= size
+                next_j = max(next_j, end_j)
+                # Rarest first, then longest, then closest to the diagonal
+                # (which keeps repetitive files aligned)
+                key = (count, -size, abs((start_i - alo) - (start_j - blo)))
+                if best is None or key < best_key:
+                    best = (start_i, start_j, size)
+                    best_key = key
+            if budget < 0:
+                break
+        j = next_j
+    return best
+
+
+def _myers_blocks(a, alo, ahi, b, blo, bhi, deadline=None):
+    """Matching blocks of a range with Myers' O(ND) algorithm, used where
+    every line is too common to anchor on. Fast when the two sides differ
+    in few lines, which is when everything else is repetitive."""
+    n, m = ahi - alo, bhi - blo
+    offset = n + m + 1
+    v = [0] * (2 * offset + 1)
+    # trace[d] holds v[k] for k in -d..d as it was before step d
+    trace = []
+    for d in range(n + m + 1):
+        if deadline is not None and time.monotonic() > deadline:
+            raise DiffTimeout()
+        trace.append(v[offset - d:offset + d + 1])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                break
+        else:
+            continue
+        break
+
+    # Walk the trace back from the end, collecting the diagonal snakes
+    blocks = []
+    x, y = n, m
+    for d in range(len(trace) - 1, 0, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[d + k - 1] < v[d + k + 1]):
+            prev_k = k + 1
+            snake_x = v[d + prev_k]
+        else:
+            prev_k = k - 1
+            snake_x = v[d + prev_k] + 1
+        if x > snake_x:
+            blocks.append((alo + snake_x, blo + snake_x - k, x - snake_x))
+        x = v[d + prev_k]
+        y = x - prev_k
+    if x > 0:
+        blocks.append((alo, blo, x))
+    return blocks
+
+
+def matching_blocks(a, b, deadline=None):
+    """Return sorted (i, j, size) runs of equal elements between a and b,
+    found with patience diff, a histogram fallback, and Myers' algorithm
+    for ranges where no line is rare enough to anchor on"""
+    blocks = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        if deadline is not None and time.monotonic() > deadline:
+            raise DiffTimeout()
+        alo, ahi, blo, bhi = stack.pop()
+
+        # Trim the common prefix and suffix of this range
+        start = 0
+        while alo + start < ahi and blo + start < bhi and a[alo + start] == b[blo + start]:
+            start += 1
+        if start:
+            blocks.append((alo, blo, start))
+            alo += start
+            blo += start
+        end = 0
+        while ahi - end > alo and bhi - end > blo and a[ahi - end - 1] == b[bhi - end - 1]:
+            end += 1
+        if end:
+            blocks.append((ahi - end, bhi - end, end))
+            ahi -= end
+            bhi -= end
+        if alo == ahi or blo == bhi:
+            continue
+
+        anchors = _unique_anchors(a, alo, ahi, b, blo, bhi)
+        if anchors:
+            prev_i, prev_j = alo, blo
+            for i, j in anchors:
+                blocks.append((i, j, 1))
+                stack.append((prev_i, i, prev_j, j))
+                prev_i, prev_j = i + 1, j + 1
+            stack.append((prev_i, ahi, prev_j, bhi))
+            continue
+
+        region = _histogram_anchor(a, alo, ahi, b, blo, bhi, deadline)
+        if region:
+            i, j, size = region
+            blocks.append(region)
+            stack.append((alo, i, blo, j))
+            stack.append((i + size, ahi, j + size, bhi))
+        else:
+            blocks.extend(_myers_blocks(a, alo, ahi, b, blo, bhi, deadline))
+
+    # Merge adjacent runs into maximal blocks
+    merged = []
+    for i, j, size in sorted(blocks):
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    return merged
+
+
+def _opcodes(blocks, a_len, b_len):
+    """Turn matching blocks into difflib-style (tag, i1, i2, j1, j2) opcodes"""
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in blocks + [(a_len, b_len, 0)]:
+        if i < ai and j < bj:
+            opcodes.append(('replace', i, ai, j, bj))
+        elif i < ai:
+            opcodes.append(('delete', i, ai, j, bj))
+        elif j < bj:
+            opcodes.append(('insert', i, ai, j, bj))
+        if size:
+            opcodes.append(('equal', ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+    return opcodes
+
+
+def _grouped_opcodes(opcodes, n):
+    """Group opcodes into hunks with n lines of context, as difflib does"""
+    if not opcodes:
+        opcodes = [('equal', 0, 1, 0, 1)]
+    if opcodes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = opcodes[0]
+        opcodes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if opcodes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = opcodes[-1]
+        opcodes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    group = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal' and i2 - i1 > n * 2:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def _format_range(start, stop):
+    """Format a hunk range the way difflib.unified_diff does"""
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f'{beginning}'
+    if not length:
+        beginning -= 1
+    return f'{beginning},{length}'
+
+
+def unified_diff(a_lines, b_lines, fromfile='', tofile='', n=3, timeout=None, max_lines=None):
+    """Return a unified diff of two line lists, formatted like difflib.unified_diff.
+
+    Common prefix and suffix are trimmed, lines are interned to integer
+    IDs, and the rest is aligned with patience diff (histogram fallback).
+    If the inputs exceed max_lines in total, or aligning them takes longer
+    than timeout seconds, a one-line "files differ" summary is returned
+    instead of the hunks.
+    """
+    timeout = DIFF_TIMEOUT if timeout is None else timeout
+    max_lines = MAX_DIFF_LINES if max_lines is None else max_lines
+    if a_lines == b_lines:
+        return ''
+
+    header = f'--- {fromfile}\n+++ {tofile}\n'
+    if len(a_lines) + len(b_lines) > max_lines:
+        return header + _summary(a_lines, b_lines, "too large to diff")
+
+    a, b = _intern(a_lines, b_lines)
+    try:
+        blocks = matching_blocks(a, b, time.monotonic() + timeout if timeout else None)
+    except DiffTimeout:
+        return header + _summary(a_lines, b_lines, f"diff took longer than {timeout:g}s")
+
+    output = [header]
+    for group in _grouped_opcodes(_opcodes(blocks, len(a), len(b)), n):
+        first, last = group[0], group[-1]
+        output.append(
+            f'@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@\n'
+        )
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                output.extend(' ' + line for line in a_lines[i1:i2])
+                continue
+            if tag in ('replace', 'delete'):
+                output.extend('-' + line for line in a_lines[i1:i2])
+            if tag in ('replace', 'insert'):
+                output.extend('+' + line for line in b_lines[j1:j2])
+    return ''.join(output)
+
+
+def _summary(a_lines, b_lines, reason):
+    return f'Files differ ({len(a_lines)} -> {len(b_lines)} lines; {reason})\n'
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# How many recent spans, and how many durations per stage, are kept for
+# the UI panel and percentile calculation
+MAX_SPANS = 500
+MAX_SAMPLES_PER_STAGE = 1000
+
+_lock = threading.Lock()
+_spans = deque(maxlen=MAX_SPANS)
+_stages = {}
+
+
+class Span:
+    """One timed stage. Attributes such as bytes and tokens can be attached
+    while the span is open with set()."""
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.started = time.time()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key, amount):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "started": self.started,
+            "duration": self.duration,
+            **self.attributes
+        }
+
+
+def _record(span):
+    with _lock:
+        _spans.append(span)
+        stage = _stages.setdefault(span.name, {
+            "count": 0,
+            "total": 0.0,
+            "bytes": 0,
+            "tokens": 0,
+            "saved_tokens": 0,
+            "samples": deque(maxlen=MAX_SAMPLES_PER_STAGE)
+        })
+        stage["count"] += 1
+        stage["total"] += span.duration
+        stage["bytes"] += span.attributes.get("bytes", 0) or 0
+        stage["tokens"] += (span.attributes.get("prompt_tokens", 0) or 0) + \
+            (span.attributes.get("completion_tokens", 0) or 0)
+        stage["saved_tokens"] += span.attributes.get("saved_tokens", 0) or 0
+        stage["samples"].append(span.duration)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time the enclosed block as a stage called name"""
+    current = Span(name, attributes)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _record(current)
+
+
+def _quantile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def recent_spans(limit=50):
+    """Return the most recent spans as dicts, newest first"""
+    with _lock:
+        spans = list(_spans)[-limit:]
+    return [s.to_dict() for s in reversed(spans)]
+
+
+def summary():
+    """Return per-stage count, total/p50/p95 duration, bytes, tokens and
+    tokens saved by diff compaction"""
+    with _lock:
+        stages = {name: dict(stage, samples=sorted(stage["samples"])) for name, stage in _stages.items()}
+    return [
+        {
+            "stage": name,
+            "count": stage["count"],
+            "total_seconds": stage["total"],
+            "p50_seconds": _quantile(stage["samples"], 0.5),
+            "p95_seconds": _quantile(stage["samples"], 0.95),
+            "bytes": stage["bytes"],
+            "tokens": stage["tokens"],
+            "saved_tokens": stage["saved_tokens"]
+        }
+        for name, stage in sorted(stages.items())
+    ]
+
+
+def reset():
+    """Forget all recorded spans"""
+    with _lock:
+        _spans.clear()
+        _stages.clear()
+
+
+def to_json():
+    """Export the summary and recent spans as a JSON document"""
+    return json.dumps({"stages": summary(), "spans": recent_spans(MAX_SPANS)}, indent=2)
+
+
+def to_prometheus():
+    """Export the per-stage summary in the Prometheus text exposition format"""
+    lines = [
+        "# HELP smartcommit_stage_duration_seconds Time spent in each SmartCommit stage.",
+        "# TYPE smartcommit_stage_duration_seconds summary"
+    ]
+    stages = summary()
+    for stage in stages:
+        label = stage["stage"].replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'smartcommit_stage_duration_seconds{{stage="{label}",quantile="0.5"}} {stage["p50_seconds"]:.6f}')
+        lines.append(f'smartcommit_stage_duration_seconds{{stage="{label}",quantile="0.95"}} {stage["p95_seconds"]:.6f}')
+        lines.append(f'smartcommit_stage_duration_seconds_sum{{stage="{label}"}} {stage["total_seconds"]:.6f}')
+        lines.append(f'smartcommit_stage_duration_seconds_count{{stage="{label}"}} {stage["count"]}')
+
+    for metric, key, help_text in (
+        ("smartcommit_stage_bytes_total", "bytes", "Bytes processed by each stage."),
+        ("smartcommit_stage_tokens_total", "tokens", "Prompt plus completion tokens used by each stage."),
+        ("smartcommit_stage_saved_tokens_total", "saved_tokens", "Prompt tokens saved by diff compaction.")
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for stage in stages:
+            label = stage["stage"].replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'{metric}{{stage="{label}"}} {stage[key]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,257 @@
+import os
+import stat
+
+import clone_cache
+import diff_utils
+import file_types
+import git_utils
+import line_diff
+import metrics
+
+# The text reported when the two sides have no differences at all
+NO_DIFFERENCES = "No differences found"
+
+
+def _file_size(root, path):
+    try:
+        return os.path.getsize(os.path.join(root, path))
+    except OSError:
+        return 0
+
+
+def _worktree_mode(path_stat):
+    if stat.S_ISLNK(path_stat.st_mode):
+        return "120000"
+    return "100755" if path_stat.st_mode & stat.S_IXUSR else "100644"
+
+
+def _read_worktree(repo_path, path):
+    """Return (contents, mode) of a working-tree file, or (None, None) if it is
+    gone; contents is the size instead when the file is too large to diff"""
+    full_path = os.path.join(repo_path, path)
+    try:
+        path_stat = os.lstat(full_path)
+        if stat.S_ISLNK(path_stat.st_mode):
+            return os.fsencode(os.readlink(full_path)), "120000"
+        if path_stat.st_size > file_types.MAX_DIFF_BYTES:
+            return path_stat.st_size, _worktree_mode(path_stat)
+        with open(full_path, 'rb') as f:
+            return f.read(), _worktree_mode(path_stat)
+    except (FileNotFoundError, NotADirectoryError):
+        return None, None
+
+
+def _diff_lines(data):
+    lines = data.decode("utf-8", "replace").splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n\\ No newline at end of file\n"
+    return lines
+
+
+def file_section(path, old, new, old_mode=None, new_mode=None, old_path=None):
+    """Return a `git diff`-style section for one file.
+
+    old and new are the contents as bytes, None when that side does not
+    exist, or an int size for files too large to read.
+    """
+    old_path = old_path or path
+    lines = [f"diff --git a/{old_path} b/{path}\n"]
+    if old is None:
+        lines.append(f"new file mode {new_mode}\n")
+    elif new is None:
+        lines.append(f"deleted file mode {old_mode}\n")
+    else:
+        if old_mode != new_mode:
+            lines.append(f"old mode {old_mode}\nnew mode {new_mode}\n")
+        if old_path != path:
+            lines.append(f"rename from {old_path}\nrename to {path}\n")
+        # Equal sizes of files too large to read say nothing about their contents
+        if old == new and not isinstance(old, int):
+            return "".join(lines) if len(lines) > 1 else ""
+
+    from_name = "/dev/null" if old is None else f"a/{old_path}"
+    to_name = "/dev/null" if new is None else f"b/{path}"
+    if isinstance(old, int) or isinstance(new, int):
+        old_size, new_size = (len(side) if isinstance(side, bytes) else side or 0 for side in (old, new))
+        lines.append(
+            f"Large file changed: {path} ({file_types.format_size(old_size)} -> {file_types.format_size(new_size)})\n"
+        )
+    elif any(side is not None and file_types.looks_binary(side) for side in (old, new)):
+        lines.append(f"Binary files {from_name} and {to_name} differ\n")
+    else:
+        lines.append(line_diff.unified_diff(
+            _diff_lines(old or b""), _diff_lines(new or b""), from_name, to_name
+        ))
+    return "".join(lines)
+
+
+def _blob(reader, sha):
+    # Like _read_worktree, blobs too large to diff are only sized
+    if sha is None or sha == git_utils.ZERO_SHA:
+        return None
+    return reader.read(sha, file_types.MAX_DIFF_BYTES)
+
+
+def iter_local_sections(repo_path, status=None):
+    """Yield ("unstaged" | "staged", path, section) for the repository in
+    path order, driven by one `git status --porcelain=v2` pass (read_status()
+    unless given). Index and HEAD contents come from the shared cat-file
+    process; untracked files are shown as new files."""
+    if status is None:
+        status = git_utils.read_status(repo_path)
+    reader = git_utils.cat_file(repo_path)
+    for entry in sorted(status, key=lambda entry: entry.path):
+        path = entry.path
+        if entry.kind == "unmerged":
+            yield "unstaged", path, f"Unmerged path: {path}\n"
+            continue
+        if entry.submodule.startswith("S"):
+            yield "unstaged", path, f"Submodule changed: {path}\n"
+            continue
+        if entry.kind == "untracked":
+            reason = file_types.name_reason(path)
+            if reason:
+                yield "unstaged", path, f"diff --git a/{path} b/{path}\n" + file_types.summarize(path, reason)
+                continue
+            contents, mode = _read_worktree(repo_path, path)
+            if contents is not None:
+                yield "unstaged", path, file_section(path, None, contents, new_mode=mode)
+            continue
+
+        if entry.index_status != ".":
+            section = file_section(
+                path,
+                None if entry.index_status == "A" else _blob(reader, entry.head_sha),
+                None if entry.index_status == "D" else _blob(reader, entry.index_sha),
+                entry.head_mode, entry.index_mode,
+                entry.orig_path if entry.kind == "renamed" and entry.index_status == "R" else None
+            )
+            if section:
+                yield "staged", path, section
+        if entry.worktree_status != ".":
+            index_contents = _blob(reader, entry.index_sha)
+            contents, mode = (None, None) if entry.worktree_status == "D" else _read_worktree(repo_path, path)
+            if index_contents is None and contents is None:
+                continue
+            section = file_section(path, index_contents, contents, entry.index_mode, mode)
+            if section:
+                yield "unstaged", path, section
+
+
+def local_sections(repo_path, status=None):
+    """Return ({path: unstaged_section}, {path: staged_section}); see iter_local_sections()"""
+    sections = {"unstaged": {}, "staged": {}}
+    for part, path, section in iter_local_sections(repo_path, status):
+        sections[part][path] = section
+    return sections["unstaged"], sections["staged"]
+
+
+def join_sections(sections):
+    """Join {path: section} in path order, as `git diff` lists files"""
+    return "".join(sections[path] for path in sorted(sections)).rstrip("\n")
+
+
+def get_local_changes(repo_path, status=None):
+    """Return the unstaged (including untracked files) and staged diffs of the
+    repository at repo_path; see local_sections()"""
+    with metrics.span("diff.local_changes") as timing:
+        unstaged, staged = local_sections(repo_path, status)
+        changes = {
+            'unstaged': join_sections(unstaged),
+            'staged': join_sections(staged)
+        }
+        timing.set(files=len(unstaged) + len(staged), bytes=len(changes['unstaged']) + len(changes['staged']))
+    return changes
+
+
+def comparison_blobs(local_path, remote_path):
+    """Return the ({path: blob_sha} local, remote) maps the remote comparison uses.
+
+    A sparse clone limits both sides to what it checks out.
+    """
+    local_blobs = git_utils.list_worktree_blobs(local_path)
+    remote_blobs = git_utils.list_tree_blobs(remote_path)
+    sparse_dirs = git_utils.sparse_checkout_dirs(remote_path)
+    if sparse_dirs:
+        local_blobs = git_utils.filter_paths(local_blobs, sparse_dirs)
+        remote_blobs = git_utils.filter_paths(remote_blobs, sparse_dirs)
+    return local_blobs, remote_blobs
+
+
+def iter_changed_files(local_path, remote_path, paths, max_workers=1, warn=None):
+    """Yield (path, text) in path order for files present on both sides
+    with different content.
+
+    Lockfiles, generated, binary and very large files get a one-line
+    summary instead of a text diff. Files that cannot be compared are
+    reported through warn(message) and left out.
+    """
+    paths = sorted(paths)
+    with metrics.span("diff.classify", files=len(paths)) as timing:
+        skipped = file_types.generated_paths(local_path, paths)
+        text_files = [file for file in paths if file not in skipped]
+        timing.set(skipped=len(skipped))
+
+    # Partial clones only fetch the contents that are about to be diffed
+    with metrics.span("diff.fetch_blobs", files=len(text_files)):
+        clone_cache.checkout_paths(remote_path, text_files)
+
+    with metrics.span("diff.read_and_diff", files=len(text_files), workers=max_workers) as timing:
+        timing.set(bytes=sum(_file_size(root, file) for file in text_files for root in (local_path, remote_path)))
+        results = diff_utils.iter_diff_files(local_path, remote_path, text_files, max_workers)
+        for file in paths:
+            if file in skipped:
+                text = file_types.summarize(file, skipped[file])
+            else:
+                _, text, error = next(results)
+                if error:
+                    if warn:
+                        warn(f"Error comparing file {file}: {error}")
+                    continue
+            timing.add("output_bytes", len(text))
+            yield file, text
+
+
+def diff_changed_files(local_path, remote_path, paths, max_workers=1, warn=None):
+    """Return {path: text} from iter_changed_files"""
+    return dict(iter_changed_files(local_path, remote_path, paths, max_workers, warn))
+
+
+def iter_remote_sections(local_path, remote_path, max_workers=1, warn=None):
+    """Yield (path, section) comparing the local working tree with a
+    checkout of the remote: changed files in path order, then the files
+    only on one side.
+
+    Both sides are resolved to blob IDs so only files whose content
+    actually differs are read and diffed (and, for a partial clone,
+    fetched); see iter_changed_files for how each file is reported.
+    """
+    with metrics.span("diff.list_blobs") as timing:
+        local_blobs, remote_blobs = comparison_blobs(local_path, remote_path)
+        changed_files, only_local, only_remote = git_utils.compare_blob_maps(local_blobs, remote_blobs)
+        timing.set(files=len(local_blobs) + len(remote_blobs), changed=len(changed_files))
+
+    yield from iter_changed_files(local_path, remote_path, changed_files, max_workers, warn)
+    for file in only_local:
+        yield file, f"Only in local: {file}\n"
+    for file in only_remote:
+        yield file, f"Only in remote: {file}\n"
+
+
+def get_remote_diff(local_path, remote_path, max_workers=1, warn=None):
+    """Diff the local working tree against a checkout of the remote; see iter_remote_sections"""
+    diff_output = ''.join(
+        section for _, section in iter_remote_sections(local_path, remote_path, max_workers, warn)
+    )
+    return diff_output or NO_DIFFERENCES
+
+
+def combine_changes(changes):
+    """Return the text a commit message should be generated from.
+
+    Mirrors the web app: the remote comparison when there is one,
+    otherwise the unstaged and staged local changes together.
+    """
+    if changes.get('remote'):
+        return changes['remote']
+    return "\n".join(filter(None, [changes.get('unstaged'), changes.get('staged')]))
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "SMARTCOMMIT_RESPONSE_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "smartcommit", "responses.sqlite3")
+)
+DEFAULT_TTL = int(os.getenv("SMARTCOMMIT_RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("SMARTCOMMIT_RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+# A hit only rewrites its access time once it is older than this; the LRU
+# order evictions follow only needs to be approximate
+_TOUCH_SECONDS = 60
+
+
+def normalize_diff(diff_content):
+    """Normalize a diff so cosmetic differences don't defeat the cache"""
+    lines = diff_content.replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+class ResponseCache:
+    """Persistent SQLite cache of model responses with TTL and LRU eviction"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @property
+    def enabled(self):
+        return bool(self.path) and self.ttl > 0 and self.max_entries > 0
+
+    def _connect(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        # Under WAL this skips the fsync on every commit; a crash can lose
+        # the latest writes but never corrupts the cache
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            conn.commit()
+            self._ready = True
+        return conn
+
+    @staticmethod
+    def make_key(kind, diff_content, prompt_version, **params):
+        """Build a cache key from the normalized diff and every generation parameter"""
+        payload = json.dumps({
+            "kind": kind,
+            "prompt_version": prompt_version,
+            "params": params,
+            "diff": hashlib.sha256(normalize_diff(diff_content).encode("utf-8")).hexdigest()
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT value, created, accessed FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                    row = None
+                if row is not None and now - row[2] > _TOUCH_SECONDS:
+                    conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    conn.commit()
+        except sqlite3.Error:
+            row = None
+        self._count(row is not None)
+        return row[0] if row is not None else None
+
+    def set(self, key, value):
+        """Store value under key and evict the least recently used entries"""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        """Remove every cached response"""
+        if not self.enabled:
+            return
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters for this process"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import threading
+
+import diff_chunking
+import gpt_utils
+import repo_diff
+
+# Seconds the diff must stay unchanged before a message is generated ahead of time
+DEBOUNCE_SECONDS = float(os.getenv("SMARTCOMMIT_SPECULATE_DEBOUNCE_SECONDS", "3"))
+
+# Estimated tokens one session may spend on messages nobody asked for yet
+TOKEN_CAP = int(os.getenv("SMARTCOMMIT_SPECULATE_TOKEN_CAP", "20000"))
+
+
+def _digest(diff):
+    if not isinstance(diff, str):
+        return diff.digest  # a diff_spool.DiffView
+    return hashlib.sha1(diff.encode("utf-8", "surrogateescape")).hexdigest()
+
+
+def _text(diff):
+    return diff if isinstance(diff, str) else diff.text()
+
+
+class Speculator:
+    """Generates one session's commit message before it is requested.
+
+    observe() is called with the current diff on every rerun. Once a diff
+    has been observed for debounce seconds without changing, its message
+    is generated in the background and lands in the response cache, so the
+    Generate button is answered from there. A changed diff cancels the
+    pending or in-flight request, and requests stop once the session's
+    estimated spend on requests the cache could not answer would pass
+    token_cap.
+    """
+
+    def __init__(self, debounce=None, token_cap=None):
+        self.debounce = DEBOUNCE_SECONDS if debounce is None else debounce
+        self.token_cap = TOKEN_CAP if token_cap is None else token_cap
+        self.spent_tokens = 0
+        self.status = "idle"
+        self._lock = threading.Lock()
+        self._digest = None
+        self._future = None
+        self._started = False
+        self._generated = set()
+
+    def observe(self, diff):
+        """Note the diff (a string or a DiffView, read only when it changed)
+        the user would generate a message for now"""
+        digest = _digest(diff) if diff else None
+        if digest == self._digest:
+            return
+        self.cancel()
+        self._digest = digest
+        if digest is None or digest in self._generated:
+            return
+        diff_content = _text(diff)
+        if diff_content.strip() == repo_diff.NO_DIFFERENCES:
+            return
+
+        # Map-reduce runs spend more than this, but never past their own budget
+        estimate = min(
+            diff_chunking.count_tokens(diff_content, gpt_utils.MODEL) + gpt_utils.REDUCE_MAX_TOKENS,
+            gpt_utils.TOTAL_TOKEN_BUDGET
+        )
+        if self.spent_tokens + estimate > self.token_cap:
+            self.status = "spend cap reached"
+            return
+
+        def on_start():
+            with self._lock:
+                self._started = True
+                self.status = "generating"
+
+        def on_request(tokens):
+            # Only requests the response cache could not answer cost anything
+            with self._lock:
+                self.spent_tokens += tokens
+
+        self._started = False
+        self.status = "waiting for the diff to settle"
+        future = gpt_utils.start_commit_message(
+            diff_content, delay=self.debounce, on_start=on_start, on_request=on_request
+        )
+        future.add_done_callback(lambda done: self._finished(done, digest))
+        self._future = future
+
+    def _finished(self, future, digest):
+        with self._lock:
+            if future.cancelled():
+                return
+            if future.exception() is None and not future.result().startswith("Error"):
+                self._generated.add(digest)
+                self.status = "ready"
+            else:
+                self.status = "failed"
+
+    def wait(self, diff, timeout=None):
+        """Before generating for diff: wait for a speculative request already
+        in flight for it, or drop one still waiting out the debounce"""
+        future = self._future
+        if future is None or _digest(diff) != self._digest:
+            return
+        with self._lock:
+            started = self._started
+        if not started:
+            # The caller's own request fills the cache instead
+            self.cancel()
+            self._generated.add(self._digest)
+            return
+        try:
+            future.result(timeout)
+        except Exception:
+            pass  # the caller's own request reports the error
+
+    def cancel(self):
+        """Cancel the pending or in-flight speculative request, if any"""
+        if self._future is not None and not self._future.done():
+            self._future.cancel()
+            with self._lock:
+                self.status = "cancelled"
+        self._future = None
+
+    def stop(self):
+        """Cancel any request and forget the observed diff (e.g. when turned off)"""
+        self.cancel()
+        self._digest = None
@@ -0,0 +1,112 @@
+import json
+import subprocess
+import time
+import types
+
+import pytest
+
+import batch
+import client_registry
+import gpt_utils
+from response_cache import ResponseCache
+
+
+class RateLimited(Exception):
+    status_code = 429
+    response = types.SimpleNamespace(headers={"retry-after-ms": "0"})
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+class CountingBucket:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+
+
+def _fake_api(monkeypatch, tmp_path, failures):
+    """Route requests to a fake client that raises failures[i] on the i-th call"""
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        message = types.SimpleNamespace(content="Add feature\n")
+        return types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(message=message)])
+
+    key_client = client_registry.KeyClient("sk-test")
+    key_client._client = types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+    )
+    monkeypatch.setattr(gpt_utils.gpt_client, "current", lambda: key_client)
+    monkeypatch.setattr(gpt_utils, "response_cache", ResponseCache(str(tmp_path / "cache.sqlite")))
+    monkeypatch.setattr(client_registry, "RETRY_BASE_DELAY", 0)
+    gpt_utils.gpt_client.initialize("sk-test")
+    return calls
+
+
+def test_token_bucket_rejects_a_non_positive_rate():
+    for rate in (0, -1):
+        with pytest.raises(ValueError):
+            batch.TokenBucket(rate)
+
+
+def test_token_bucket_allows_a_burst_then_paces_to_the_rate():
+    bucket = batch.TokenBucket(20, capacity=3)
+    started = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - started < 0.05
+    for _ in range(4):
+        bucket.acquire()
+    assert 0.15 <= time.monotonic() - started < 0.5
+
+
+def test_generate_with_retry_retries_and_takes_a_token_per_attempt(monkeypatch, tmp_path):
+    calls = _fake_api(monkeypatch, tmp_path, [RateLimited(), RateLimited()])
+    bucket = CountingBucket()
+    assert batch.generate_with_retry("diff --git a/x b/x\n+y\n", bucket, retries=2) == "Add feature"
+    assert len(calls) == 3
+    assert bucket.acquired == 3
+
+
+def test_generate_with_retry_gives_up_after_retries(monkeypatch, tmp_path):
+    calls = _fake_api(monkeypatch, tmp_path, [RateLimited()] * 3)
+    with pytest.raises(RateLimited):
+        batch.generate_with_retry("diff --git a/x b/x\n+y\n", CountingBucket(), retries=1)
+    assert len(calls) == 2
+
+
+def test_generate_with_retry_does_not_retry_client_errors(monkeypatch, tmp_path):
+    calls = _fake_api(monkeypatch, tmp_path, [BadRequest()])
+    with pytest.raises(BadRequest):
+        batch.generate_with_retry("diff --git a/x b/x\n+y\n", CountingBucket(), retries=5)
+    assert len(calls) == 1
+
+
+def test_run_batch_records_a_bad_repo_and_carries_on(monkeypatch, tmp_path):
+    repo = tmp_path / "repo"
+    subprocess.run(["git", "init", "-q", str(repo)], check=True)
+    for i in range(2):
+        (repo / "file.txt").write_text(f"{i}\n")
+        subprocess.run(["git", "add", "file.txt"], cwd=repo, check=True)
+        subprocess.run(
+            ["git", "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", f"c{i}"],
+            cwd=repo, check=True
+        )
+    monkeypatch.setattr(batch, "generate_with_retry", lambda diff, bucket, retries: "Generated")
+    output = tmp_path / "out.jsonl"
+
+    written = batch.run_batch([str(tmp_path / "missing"), str(repo)], "HEAD~1..HEAD", str(output), workers=2)
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert written == len(records) == 2
+    assert records[0]["repo"] == str(tmp_path / "missing")
+    assert records[0]["commit"] is None and records[0]["error"]
+    assert records[1]["generated_message"] == "Generated"
+    assert records[1]["original_message"] == "c1"
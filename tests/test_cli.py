@@ -0,0 +1,116 @@
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(REPO_ROOT, "cli.py")
+
+# Generous enough for a loaded CI machine; a heavy import at startup
+# (streamlit, openai, GitPython) costs several times this
+STARTUP_BUDGET = 0.5
+
+# Modules that must not be imported when the hook has nothing to do
+HEAVY_MODULES = ("streamlit", "openai", "git", "httpx", "gpt_utils", "repo_diff", "tiktoken")
+
+
+def _imported_modules(argv):
+    code = (
+        "import sys, runpy\n"
+        f"sys.argv = {[CLI, *argv]!r}\n"
+        "try:\n"
+        f"    runpy.run_path({CLI!r}, run_name='__main__')\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print('\\n'.join(sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+@pytest.fixture
+def message_file(tmp_path):
+    path = tmp_path / "COMMIT_EDITMSG"
+    path.write_text("message\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("source", ["message", "merge", "squash", "commit"])
+def test_noop_hook_imports_only_the_standard_library(message_file, source):
+    modules = _imported_modules(["prepare-commit-msg", message_file, source])
+    assert not modules & set(HEAVY_MODULES)
+
+
+def test_help_imports_only_the_standard_library():
+    assert not _imported_modules(["--help"]) & set(HEAVY_MODULES)
+
+
+def test_noop_hook_cold_start_is_fast(message_file):
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, CLI, "prepare-commit-msg", message_file, "message"], check=True)
+        timings.append(time.perf_counter() - start)
+    assert statistics.median(timings) < STARTUP_BUDGET
+
+
+class _FailingAPI(BaseHTTPRequestHandler):
+    """Answers every request with a 429 asking for a long wait, or stalls"""
+    stall = False
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.stall:
+            time.sleep(30)
+            return
+        body = b'{"error": {"message": "rate limited", "type": "requests"}}'
+        self.send_response(429)
+        self.send_header("Retry-After", "30")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.parametrize("stall", [False, True], ids=["rate-limited", "stalled"])
+def test_hook_gives_up_quickly_when_the_api_fails(tmp_path, message_file, stall):
+    pytest.importorskip("openai")
+    handler = type("Handler", (_FailingAPI,), {"stall": stall})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    subprocess.run(["git", "init", "-q", str(repo)], check=True)
+    (repo / "file.txt").write_text("hello\n")
+    subprocess.run(["git", "add", "file.txt"], cwd=repo, check=True)
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-test",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{server.server_address[1]}/v1",
+        SMARTCOMMIT_RESPONSE_CACHE=str(tmp_path / "cache.sqlite"),
+    )
+    try:
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, CLI, "prepare-commit-msg", message_file, "", "--timeout", "2"],
+            cwd=repo, env=env, capture_output=True, text=True, timeout=60
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    assert result.returncode == 0
+    assert "Error generating commit message" in result.stderr
+    assert elapsed < 10
+    with open(message_file, encoding="utf-8") as f:
+        assert f.read() == "message\n"
@@ -0,0 +1,143 @@
+import os
+import subprocess
+import types
+
+import pytest
+
+import clone_cache
+
+
+def _git(*args, cwd=None):
+    result = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def _commit(work, files, message):
+    for path, text in files.items():
+        full_path = work / path
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_text(text)
+    _git("add", "-A", cwd=work)
+    _git("commit", "-q", "-m", message, cwd=work)
+    _git("push", "-q", "origin", "HEAD:main", cwd=work)
+
+
+@pytest.fixture(autouse=True)
+def cache_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(clone_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    for name in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{name}_NAME", "Test")
+        monkeypatch.setenv(f"GIT_{name}_EMAIL", "test@example.com")
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """A bare repository with three commits on main and a feature branch,
+    served over file:// so shallow and partial clones are honoured"""
+    bare = tmp_path / "remote.git"
+    _git("init", "-q", "--bare", str(bare))
+    _git("symbolic-ref", "HEAD", "refs/heads/main", cwd=bare)
+    _git("config", "uploadpack.allowFilter", "true", cwd=bare)
+
+    work = tmp_path / "work"
+    _git("clone", "-q", str(bare), str(work))
+    _commit(work, {"top.txt": "top\n", "src/app.py": "print(1)\n", "docs/guide.md": "guide\n"}, "first")
+    _commit(work, {"src/app.py": "print(2)\n"}, "second")
+    _commit(work, {"docs/guide.md": "guide v3\n"}, "third")
+    _git("push", "-q", "origin", "HEAD:feature", cwd=work)
+
+    return types.SimpleNamespace(url=bare.as_uri(), work=work)
+
+
+def test_equivalent_urls_share_an_entry_and_options_split_it(tmp_path):
+    path = tmp_path / "remote.git"
+    path.mkdir()
+    assert clone_cache.cache_key(str(path)) == clone_cache.cache_key(path.as_uri() + "/")
+    assert (
+        clone_cache.cache_key("https://GitHub.com/owner/repo.git")
+        == clone_cache.cache_key("git@github.com:owner/repo")
+    )
+    assert clone_cache.cache_key(str(path)) != clone_cache.cache_key(str(path), clone_cache.clone_options(depth=1))
+
+
+def test_clone_is_reused_then_refreshed(remote):
+    clone_path, error = clone_cache.get_cached_clone(remote.url)
+    assert error is None
+    assert open(os.path.join(clone_path, "src", "app.py")).read() == "print(2)\n"
+
+    _commit(remote.work, {"src/app.py": "print(3)\n"}, "fourth")
+    # Within the refresh interval the cached clone is served as is
+    assert clone_cache.get_cached_clone(remote.url, max_age=3600) == (clone_path, None)
+    assert open(os.path.join(clone_path, "src", "app.py")).read() == "print(2)\n"
+
+    assert clone_cache.get_cached_clone(remote.url, max_age=0) == (clone_path, None)
+    assert open(os.path.join(clone_path, "src", "app.py")).read() == "print(3)\n"
+    assert _git("rev-parse", "HEAD", cwd=clone_path) == _git("rev-parse", "HEAD", cwd=remote.work)
+
+
+def test_shallow_clone_fetches_only_the_requested_history(remote):
+    options = clone_cache.clone_options(depth=1)
+    clone_path, error = clone_cache.get_cached_clone(remote.url, options=options)
+    assert error is None
+    assert _git("rev-list", "--count", "HEAD", cwd=clone_path) == "1"
+
+    _commit(remote.work, {"top.txt": "top v2\n"}, "fourth")
+    clone_cache.get_cached_clone(remote.url, max_age=0, options=options)
+    assert _git("rev-list", "--count", "HEAD", cwd=clone_path) == "1"
+    assert open(os.path.join(clone_path, "top.txt")).read() == "top v2\n"
+
+
+def test_single_branch_clone_skips_other_branches(remote):
+    clone_path, error = clone_cache.get_cached_clone(
+        remote.url, options=clone_cache.clone_options(single_branch=True)
+    )
+    assert error is None
+    branches = _git("branch", "-r", "--format=%(refname:short)", cwd=clone_path).split()
+    assert "origin/main" in branches
+    assert "origin/feature" not in branches
+
+
+def test_partial_clone_checks_out_only_requested_paths(remote):
+    options = clone_cache.clone_options(partial=True)
+    clone_path, error = clone_cache.get_cached_clone(remote.url, options=options)
+    assert error is None
+    assert sorted(os.listdir(clone_path)) == [".git"]
+
+    clone_cache.checkout_paths(clone_path, ["src/app.py"])
+    assert open(os.path.join(clone_path, "src", "app.py")).read() == "print(2)\n"
+    assert not os.path.exists(os.path.join(clone_path, "top.txt"))
+
+    # A refresh empties the working tree again for the next comparison
+    _commit(remote.work, {"src/app.py": "print(3)\n"}, "fourth")
+    clone_cache.get_cached_clone(remote.url, max_age=0, options=options)
+    assert sorted(os.listdir(clone_path)) == [".git"]
+    clone_cache.checkout_paths(clone_path, ["src/app.py"])
+    assert open(os.path.join(clone_path, "src", "app.py")).read() == "print(3)\n"
+
+
+def test_sparse_clone_checks_out_only_the_cone(remote):
+    clone_path, error = clone_cache.get_cached_clone(
+        remote.url, options=clone_cache.clone_options(sparse_paths=["src/"])
+    )
+    assert error is None
+    assert sorted(os.listdir(clone_path)) == [".git", "src", "top.txt"]
+
+
+def test_eviction_skips_leased_clones(remote):
+    full_path, _ = clone_cache.get_cached_clone(remote.url)
+    shallow_path, _ = clone_cache.get_cached_clone(remote.url, options=clone_cache.clone_options(depth=1))
+
+    with clone_cache.lease(full_path):
+        clone_cache.evict(budget=0)
+    assert os.path.isdir(full_path)
+    assert not os.path.exists(shallow_path)
+
+    clone_cache.evict(budget=0)
+    assert not os.path.exists(full_path)
+
+
+def test_unreachable_remote_reports_an_error(tmp_path):
+    clone_path, error = clone_cache.get_cached_clone((tmp_path / "missing.git").as_uri())
+    assert clone_path is None
+    assert "clone failed" in error
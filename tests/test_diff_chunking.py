@@ -0,0 +1,49 @@
+import diff_chunking
+
+
+def test_git_and_plain_sections_are_split():
+    diff = (
+        "diff --git a/a.py b/a.py\n"
+        "index 1234567..89abcde 100644\n"
+        "--- a/a.py\n"
+        "+++ b/a.py\n"
+        "@@ -1 +1 @@\n"
+        "-old\n"
+        "+new\n"
+        "--- remote/b.py\n"
+        "+++ local/b.py\n"
+        "@@ -1 +1 @@\n"
+        "-x\n"
+        "+y\n"
+    )
+    sections = diff_chunking.split_files(diff)
+    assert [section.splitlines()[0] for section in sections] == ["diff --git a/a.py b/a.py", "--- remote/b.py"]
+    assert "".join(sections) == diff
+
+
+def test_header_without_hunks_ends_at_the_next_unrelated_line():
+    binary = (
+        "diff --git a/img.png b/img.png\n"
+        "new file mode 100644\n"
+        "Binary files /dev/null and b/img.png differ\n"
+    )
+    mode_only = (
+        "diff --git a/run.sh b/run.sh\n"
+        "old mode 100644\n"
+        "new mode 100755\n"
+    )
+    only_in = "Only in local: notes.txt\n"
+    plain = "--- remote/c.py\n+++ local/c.py\n@@ -1 +1 @@\n-a\n+b\n"
+    diff = binary + only_in + plain + mode_only + only_in + plain
+    assert diff_chunking.split_files(diff) == [binary, only_in, plain, mode_only, only_in, plain]
+
+
+def test_summary_bodies_stay_with_their_header():
+    section = "diff --git a/package-lock.json b/package-lock.json\nLockfile changed: package-lock.json (diff omitted)\n"
+    assert diff_chunking.split_files(section + "Only in remote: x\n") == [section, "Only in remote: x\n"]
+
+
+def test_split_hunks():
+    header, hunks = diff_chunking.split_hunks("--- a\n+++ b\n@@ -1 +1 @@\n-a\n+b\n@@ -5 +5 @@\n-c\n+d\n")
+    assert header == "--- a\n+++ b\n"
+    assert hunks == ["@@ -1 +1 @@\n-a\n+b\n", "@@ -5 +5 @@\n-c\n+d\n"]
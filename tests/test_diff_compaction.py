@@ -0,0 +1,44 @@
+import diff_compaction
+
+
+def _section(path, removed, added):
+    lines = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}", "@@ -1,2 +1,2 @@", " context"]
+    lines += [f"-{line}" for line in removed]
+    lines += [f"+{line}" for line in added]
+    return "\n".join(lines) + "\n"
+
+
+def test_whitespace_only_hunk_is_dropped():
+    diff = _section("a.py", ["x = 1", "y  =  2"], ["x =  1", "\ty = 2"])
+    assert diff_compaction.compact_diff(diff, steps="whitespace") == "Whitespace-only changes: a.py\n"
+
+
+def test_removed_whitespace_between_tokens_survives():
+    diff = _section("a.py", ["hello world"], ["helloworld"])
+    assert diff_compaction.compact_diff(diff, steps="whitespace") == diff
+
+
+def test_edits_spread_across_lines_survive():
+    diff = _section("a.py", ["import os", "import sys"], ["importos importsys"])
+    assert diff_compaction.compact_diff(diff, steps="whitespace") == diff
+
+
+def test_lockfile_becomes_a_count():
+    diff = _section("package-lock.json", ["a", "b"], ["c"])
+    assert diff_compaction.compact_diff(diff, steps="generated") == (
+        "Lockfile changed: package-lock.json (+1 -2 lines, diff omitted)\n"
+    )
+
+
+def test_repeated_hunk_refers_to_the_first():
+    diff = _section("a.py", ["old"], ["new"]) + _section("b.py", ["old"], ["new"])
+    compacted = diff_compaction.compact_diff(diff, steps="dedupe")
+    assert compacted.count("-old") == 1
+    assert "(same change as in a.py)" in compacted
+
+
+def test_only_in_lines_are_grouped_by_directory():
+    diff = "".join(f"Only in local: src/f{i}.py\n" for i in range(5))
+    assert diff_compaction.compact_diff(diff, steps="paths") == (
+        "Only in local: 5 files in src/ (f0.py, f1.py, f2.py, and 2 more)\n"
+    )
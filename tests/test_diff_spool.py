@@ -0,0 +1,54 @@
+import diff_spool
+
+
+def _section(path, body):
+    return f"diff --git a/{path} b/{path}\n@@ -1 +1 @@\n-{body}\n+{body}!\n"
+
+
+def test_add_keeps_write_order_and_pages_hunks():
+    spool = diff_spool.DiffSpool()
+    spool.add("remote", "b.py", _section("b.py", "x"))
+    spool.add("remote", "a.py", _section("a.py", "ü") + "@@ -9 +9 @@\n-y\n+z\n")
+    assert [entry.path for entry in spool.files("remote")] == ["b.py", "a.py"]
+    header, hunks = spool.hunks("remote", 1, start=1, count=1)
+    assert header == "diff --git a/a.py b/a.py\n"
+    assert hunks == ["@@ -9 +9 @@\n-y\n+z\n"]
+    assert spool.files("remote")[1][4:6] == (2, 2)
+
+
+def test_put_replaces_only_the_changed_section_in_key_order():
+    spool = diff_spool.DiffSpool()
+    for path in ("c.py", "a.py", "b.py"):
+        spool.put("unstaged", path, path, _section(path, "old"))
+    digest = spool.digest("unstaged")
+    untouched = spool.files("unstaged")[0]
+
+    spool.put("unstaged", "b.py", "b.py", _section("b.py", "new"))
+    assert [entry.path for entry in spool.files("unstaged")] == ["a.py", "b.py", "c.py"]
+    assert spool.files("unstaged")[0] == untouched
+    assert spool.text("unstaged") == (_section("a.py", "old") + _section("b.py", "new") + _section("c.py", "old")).rstrip("\n")
+    assert spool.digest("unstaged") != digest
+
+    spool.put("unstaged", "b.py", "b.py", "")
+    spool.put("unstaged", "missing.py", "missing.py", "")
+    assert [entry.path for entry in spool.files("unstaged")] == ["a.py", "c.py"]
+
+
+def test_same_contents_have_the_same_digest():
+    first, second = diff_spool.DiffSpool(), diff_spool.DiffSpool()
+    first.add("staged", "a.py", _section("a.py", "x"))
+    second.put("staged", "a.py", "a.py", _section("a.py", "x"))
+    assert first.digest("staged") == second.digest("staged")
+    assert first.view("staged").digest != first.view("unstaged").digest
+
+
+def test_replaced_sections_are_compacted_away(monkeypatch):
+    monkeypatch.setattr(diff_spool, "COMPACT_MIN_BYTES", 0)
+    spool = diff_spool.DiffSpool()
+    spool.put("remote", (0, "a.py"), "a.py", _section("a.py", "1"))
+    spool.put("remote", (1, "b.py"), "b.py", "Only in local: b.py\n")
+    for i in range(50):
+        spool.put("remote", (0, "a.py"), "a.py", _section("a.py", str(i)))
+    spool.clear("staged")
+    assert spool._end < 2 * spool.size("remote")
+    assert spool.text("remote") == _section("a.py", "49") + "Only in local: b.py"
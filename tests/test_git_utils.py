@@ -0,0 +1,76 @@
+import subprocess
+from collections import OrderedDict
+
+import git_utils
+
+
+def test_parse_status_reads_every_record_type():
+    records = [
+        "# branch.oid 1234abcd",
+        "# branch.head main",
+        "1 .M N... 100644 100644 100644 aaaa aaaa src/app.py",
+        "1 A. N... 000000 100644 100644 0000 bbbb name with spaces.txt",
+        "2 R. N... 100644 100644 100644 cccc cccc R100 new/name.py",
+        "old/name.py",
+        "u UU N... 100644 100644 100644 100644 dddd eeee ffff conflicted.py",
+        "? notes.md",
+    ]
+    headers, entries = git_utils._parse_status(records)
+
+    assert headers == {"branch.oid": "1234abcd", "branch.head": "main"}
+    assert [(e.kind, e.path, e.index_status, e.worktree_status) for e in entries] == [
+        ("changed", "src/app.py", ".", "M"),
+        ("changed", "name with spaces.txt", "A", "."),
+        ("renamed", "new/name.py", "R", "."),
+        ("unmerged", "conflicted.py", "U", "U"),
+        ("untracked", "notes.md", "?", "?"),
+    ]
+    renamed = entries[2]
+    assert renamed.orig_path == "old/name.py"
+    assert (renamed.head_sha, renamed.worktree_mode) == ("cccc", "100644")
+    assert entries[3].worktree_mode == "100644"
+
+
+def test_parse_status_of_a_clean_tree():
+    assert git_utils._parse_status(["# branch.head main"]) == ({"branch.head": "main"}, [])
+
+
+def _repo_with_blobs(path, *contents):
+    subprocess.run(["git", "init", "-q", str(path)], check=True)
+    shas = []
+    for data in contents:
+        result = subprocess.run(
+            ["git", "hash-object", "-w", "--stdin"], cwd=path, input=data, capture_output=True, check=True
+        )
+        shas.append(result.stdout.decode().strip())
+    return shas
+
+
+def test_cat_file_sizes_blobs_above_max_bytes_and_keeps_reading(tmp_path):
+    big, small = _repo_with_blobs(tmp_path, b"x" * 300_000, b"small\n")
+    reader = git_utils.CatFile(str(tmp_path))
+    try:
+        assert reader.read(big, max_bytes=1000) == 300_000
+        assert reader.read(small, max_bytes=1000) == b"small\n"
+        assert reader.read(big) == b"x" * 300_000
+        assert reader.read("0" * 40) is None
+    finally:
+        reader.close()
+
+
+def test_cat_file_stops_the_least_recently_used_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(git_utils, "MAX_CAT_FILES", 2)
+    monkeypatch.setattr(git_utils, "_cat_files", OrderedDict())
+    readers = []
+    for name in ("a", "b", "c"):
+        (sha,) = _repo_with_blobs(tmp_path / name, name.encode())
+        reader = git_utils.cat_file(str(tmp_path / name))
+        assert reader.read(sha) == name.encode()
+        readers.append(reader)
+    try:
+        assert readers[0]._process is None
+        assert all(reader._process.poll() is None for reader in readers[1:])
+        assert list(git_utils._cat_files.values()) == readers[1:]
+    finally:
+        for reader in readers:
+            reader.close()
@@ -0,0 +1,77 @@
+import difflib
+import random
+import time
+
+import pytest
+
+import line_diff
+
+
+def _check_blocks(a, b, blocks):
+    prev_i = prev_j = 0
+    for i, j, size in blocks:
+        assert i >= prev_i and j >= prev_j
+        assert a[i:i + size] == b[j:j + size]
+        prev_i, prev_j = i + size, j + size
+
+
+def _lcs_length(a, b):
+    lengths = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) - 1, -1, -1):
+        for j in range(len(b) - 1, -1, -1):
+            if a[i] == b[j]:
+                lengths[i][j] = lengths[i + 1][j + 1] + 1
+            else:
+                lengths[i][j] = max(lengths[i + 1][j], lengths[i][j + 1])
+    return lengths[0][0]
+
+
+def _repetitive(n):
+    a = [f"x{i % 300}\n" for i in range(n)]
+    b = [f"changed{i}\n" if i % 1000 == 0 else line for i, line in enumerate(a)]
+    return a, b
+
+
+def test_matching_blocks_are_valid_on_random_input():
+    rng = random.Random(0)
+    for _ in range(500):
+        a = [rng.randint(0, 5) for _ in range(rng.randint(0, 40))]
+        b = [rng.choice([x, rng.randint(0, 5)]) for x in a if rng.random() > 0.2]
+        blocks = line_diff.matching_blocks(a, b)
+        _check_blocks(a, b, blocks)
+
+
+def test_myers_blocks_are_minimal():
+    rng = random.Random(1)
+    for _ in range(300):
+        a = [rng.randint(0, 3) for _ in range(rng.randint(0, 20))]
+        b = [rng.randint(0, 3) for _ in range(rng.randint(0, 20))]
+        blocks = sorted(line_diff._myers_blocks(a, 0, len(a), b, 0, len(b)))
+        _check_blocks(a, b, blocks)
+        assert sum(size for _, _, size in blocks) == _lcs_length(a, b)
+
+
+def test_unified_diff_matches_difflib_on_simple_edit():
+    a = [f"line {i}\n" for i in range(100)]
+    b = a[:10] + ["inserted\n"] + a[10:50] + a[51:]
+    expected = "".join(difflib.unified_diff(a, b, "a/f", "b/f"))
+    assert line_diff.unified_diff(a, b, "a/f", "b/f") == expected
+
+
+@pytest.mark.parametrize("n", [19000, 38000])
+def test_repetitive_lines_are_aligned(n):
+    # Every line repeats, most of them more often than any anchor allows
+    a, b = _repetitive(n)
+    diff = line_diff.unified_diff(a, b, "a/f", "b/f", timeout=5)
+    lines = diff.splitlines()[2:]
+    assert sum(line.startswith("@@") for line in lines) == n // 1000
+    assert sum(line.startswith("-") for line in lines) == n // 1000
+    assert sum(line.startswith("+") for line in lines) == n // 1000
+
+
+def test_timeout_is_enforced_inside_the_search():
+    a, b = _repetitive(19000)
+    start = time.monotonic()
+    with pytest.raises(line_diff.DiffTimeout):
+        line_diff.matching_blocks(a, b, deadline=time.monotonic() + 0.05)
+    assert time.monotonic() - start < 0.5
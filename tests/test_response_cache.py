@@ -0,0 +1,35 @@
+import sqlite3
+import time
+
+import response_cache
+
+
+def _accessed(cache, key):
+    with sqlite3.connect(cache.path) as conn:
+        return conn.execute("SELECT accessed FROM responses WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_hits_only_rewrite_a_stale_access_time(tmp_path):
+    cache = response_cache.ResponseCache(str(tmp_path / "cache.sqlite3"))
+    key = cache.make_key("commit_message", "diff", 1)
+    cache.set(key, "message")
+    stored = _accessed(cache, key)
+
+    assert cache.get(key) == "message"
+    assert _accessed(cache, key) == stored
+
+    stale = time.time() - 2 * response_cache._TOUCH_SECONDS
+    with sqlite3.connect(cache.path) as conn:
+        conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (stale, key))
+    assert cache.get(key) == "message"
+    assert _accessed(cache, key) > stale
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = response_cache.ResponseCache(str(tmp_path / "cache.sqlite3"), ttl=1)
+    key = cache.make_key("analysis", "diff", 1)
+    cache.set(key, "analysis")
+    with sqlite3.connect(cache.path) as conn:
+        conn.execute("UPDATE responses SET created = created - 10")
+    assert cache.get(key) is None
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,141 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import batch
+import file_types
+import git_utils
+import metrics
+import repo_diff
+
+# Repositories scanned at once; each scan is mostly waiting on git
+WORKERS = int(os.getenv("SMARTCOMMIT_WORKSPACE_WORKERS", "8"))
+
+# How many directory levels below the workspace root are searched for repositories
+MAX_DEPTH = int(os.getenv("SMARTCOMMIT_WORKSPACE_MAX_DEPTH", "3"))
+
+
+def discover_repos(root, max_depth=None):
+    """Return the git repositories under root, sorted by path.
+
+    Repositories are not searched for nested ones, and hidden and
+    dependency directories (e.g. node_modules) are skipped.
+    """
+    max_depth = MAX_DEPTH if max_depth is None else max_depth
+    root = os.path.abspath(root)
+    repos = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        # .git is a file in worktrees and submodules
+        if ".git" in dirnames or ".git" in filenames:
+            repos.append(dirpath)
+            dirnames[:] = []
+            continue
+        if dirpath[len(root):].count(os.sep) >= max_depth:
+            dirnames[:] = []
+            continue
+        dirnames[:] = [d for d in dirnames if not d.startswith(".") and d not in file_types.VENDORED_DIRS]
+    return sorted(repos)
+
+
+def _count_lines(diff_text):
+    added = removed = 0
+    for line in diff_text.splitlines():
+        if line.startswith("+") and not line.startswith("+++ "):
+            added += 1
+        elif line.startswith("-") and not line.startswith("--- "):
+            removed += 1
+    return added, removed
+
+
+def _ahead_behind(headers):
+    try:
+        ahead, behind = headers["branch.ab"].split()
+        return int(ahead), -int(behind)
+    except (KeyError, ValueError):
+        return None, None  # no upstream
+
+
+def scan_repo(repo_path, root=None):
+    """Return a summary dict of one repository's branch and local changes.
+
+    One `git status --porcelain=v2 --branch` pass provides the counts and
+    drives the diff, which is kept under "diff" for generating a message.
+    Failures are reported under "error" instead of raised.
+    """
+    summary = {
+        "repo": os.path.relpath(repo_path, root) if root else repo_path,
+        "path": repo_path,
+        "branch": None,
+        "ahead": None,
+        "behind": None,
+        "staged": 0,
+        "unstaged": 0,
+        "untracked": 0,
+        "conflicts": 0,
+        "added_lines": 0,
+        "removed_lines": 0,
+        "diff": "",
+        "error": None
+    }
+    try:
+        with metrics.span("workspace.repo") as timing:
+            headers, status = git_utils.read_branch_status(repo_path)
+            summary["branch"] = headers.get("branch.head")
+            summary["ahead"], summary["behind"] = _ahead_behind(headers)
+            for entry in status:
+                if entry.kind == "untracked":
+                    summary["untracked"] += 1
+                elif entry.kind == "unmerged":
+                    summary["conflicts"] += 1
+                else:
+                    summary["staged"] += entry.index_status != "."
+                    summary["unstaged"] += entry.worktree_status != "."
+            if status:
+                changes = repo_diff.get_local_changes(repo_path, status)
+                summary["diff"] = repo_diff.combine_changes(changes)
+                summary["added_lines"], summary["removed_lines"] = _count_lines(summary["diff"])
+            timing.set(files=len(status), bytes=len(summary["diff"]))
+    except Exception as e:
+        summary["error"] = str(e)
+    return summary
+
+
+def scan_workspace(root, workers=None, max_depth=None, on_result=None):
+    """Scan every repository under root concurrently and return their
+    scan_repo summaries sorted by path; on_result(summary) is called as
+    each one finishes"""
+    workers = workers or WORKERS
+    with metrics.span("workspace.scan") as timing:
+        repos = discover_repos(root, max_depth)
+        timing.set(repos=len(repos), workers=workers)
+        summaries = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(scan_repo, repo_path, root) for repo_path in repos]
+            for future in as_completed(futures):
+                summary = future.result()
+                summaries.append(summary)
+                if on_result:
+                    on_result(summary)
+    return sorted(summaries, key=lambda summary: summary["path"])
+
+
+def generate_messages(diffs, workers=4, requests_per_minute=60, retries=5):
+    """Generate a commit message for each {repo: diff} concurrently.
+
+    Yields (repo, message, error) as each finishes. Requests share one
+    rate limit and are retried like batch.run_batch's, and run in copies
+    of the caller's context so they use its API key.
+    """
+    bucket = batch.TokenBucket(requests_per_minute / 60.0, capacity=workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run, batch.generate_with_retry, diff, bucket, retries
+            ): repo
+            for repo, diff in diffs.items()
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, str(e)